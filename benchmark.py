@@ -0,0 +1,637 @@
+import argparse
+import asyncio
+import datetime
+import gc
+import json
+import math
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlsplit
+
+from main import Vehicle, ElectricCar, Truck, Fleet, ShardedFleet, EXPORT_FORMATS, generate_vehicles, load_numpy, operation_log
+
+try:
+    import resource
+except ImportError:  # Windows: sem ru_maxrss, a memória de pico não é reportada
+    resource = None
+
+BRANDS = [("Toyota", "Corolla"), ("Tesla", "Model 3"), ("Mercedes", "Actros"), ("Volvo", "FH"), ("BMW", "3 Series")]
+
+# ==================== LAYOUT ANTERIOR ====================
+# Réplica dos registos antigos (__dict__ por instância e datetime completo) para comparação
+class DictVehicle:
+    def __init__(self, brand, model, price, year):
+        self.brand = brand
+        self.model = model
+        self.price = price
+        self.year = year
+        self.registration_date = datetime.datetime.now()
+
+class DictElectricCar(DictVehicle):
+    def __init__(self, brand, model, price, year, battery_capacity, autonomy):
+        super().__init__(brand, model, price, year)
+        self.battery_capacity = battery_capacity
+        self.autonomy = autonomy
+
+class DictTruck(DictVehicle):
+    def __init__(self, brand, model, price, year, load_capacity, length):
+        super().__init__(brand, model, price, year)
+        self.load_capacity = load_capacity
+        self.length = length
+
+# ==================== MEMÓRIA ====================
+def make_vehicles(count, classes):
+    vehicle_class, electric_class, truck_class = classes
+    vehicles = []
+    for i in range(count):
+        brand, model = BRANDS[i % len(BRANDS)]
+        # encode/decode cria textos novos, como acontece ao ler um ficheiro
+        brand, model = brand.encode().decode(), model.encode().decode()
+        price = 20000.0 + i % 50000
+        kind = i % 3
+        if kind == 0:
+            vehicles.append(vehicle_class(brand, model, price, 2020))
+        elif kind == 1:
+            vehicles.append(electric_class(brand, model, price, 2022, 75.0, 500.0))
+        else:
+            vehicles.append(truck_class(brand, model, price, 2019, 18.0, 12.5))
+    return vehicles
+
+def bytes_per_vehicle(count, classes):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    vehicles = make_vehicles(count, classes)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del vehicles
+    return (after - before) / count
+
+def memory_benchmark(count):
+    before = bytes_per_vehicle(count, (DictVehicle, DictElectricCar, DictTruck))
+    after = bytes_per_vehicle(count, (Vehicle, ElectricCar, Truck))
+    return {'count': count, 'before': before, 'after': after, 'saving': 1 - after / before}
+
+# ==================== OPERAÇÕES DA FROTA ====================
+SIZES = (1000, 100000, 1000000, 10000000)
+LATENCY_SAMPLES = 10000
+REPEATS = 5
+REGRESSION_THRESHOLD = 0.2
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+def percentile(sorted_timings, percent):
+    index = min(len(sorted_timings) - 1, int(len(sorted_timings) * percent / 100))
+    return sorted_timings[index]
+
+def measure(operation, size, func, runs, items_per_run=1, unit="ops/s"):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter_ns()
+        func()
+        timings.append(time.perf_counter_ns() - start)
+    timings.sort()
+    total = sum(timings) / 1e9
+    return {
+        'size': size,
+        'operation': operation,
+        'runs': runs,
+        'throughput': items_per_run * runs / total if total else float('inf'),
+        'unit': unit,
+        'p50_ms': percentile(timings, 50) / 1e6,
+        'p95_ms': percentile(timings, 95) / 1e6,
+        'p99_ms': percentile(timings, 99) / 1e6,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def fleet_benchmark(size, columnar=False, formats=EXPORT_FORMATS, seed=42):
+    # Dados sintéticos determinísticos: a mesma seed dá sempre a mesma frota
+    rng = random.Random(seed)
+    samples = min(size, LATENCY_SAMPLES)
+    results = []
+
+    fleet = Fleet(columnar=columnar)
+    vehicles = list(generate_vehicles(size, seed))
+    results.append(measure("add_vehicles", size, lambda: fleet.add_vehicles(vehicles), 1, size, "veículos/s"))
+    del vehicles
+
+    extra = iter(list(generate_vehicles(samples, seed + 1)))
+    results.append(measure("add_vehicle", size, lambda: fleet.add_vehicle(next(extra)), samples))
+    results.append(measure("remove_vehicle", size, lambda: fleet.remove_vehicle(rng.randrange(len(fleet))), samples))
+
+    results.append(measure("apply_global_discount", size, lambda: fleet.apply_global_discount(1), REPEATS, size, "veículos/s"))
+    results.append(measure("filter_by_brand", size, lambda: fleet.filter_by_brand("toyota"), REPEATS))
+    results.append(measure("filter_by_year", size, lambda: fleet.filter_by_year(2021), REPEATS))
+    results.append(measure("filter_by_type", size, lambda: fleet.filter_by_type("ElectricCar"), REPEATS))
+    results.append(measure("get_summary", size, fleet.get_summary, samples))
+    # A primeira chamada cria a vista ordenada; as seguintes só a leem
+    results.append(measure("sorted_by[price]", size, lambda: fleet.sorted_by('price'), 1, size, "veículos/s"))
+    results.append(measure("top_10[price]", size, lambda: fleet.sorted_by('price', reverse=True).window(0, 10), samples))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for format_type in formats:
+            filename = os.path.join(directory, f"frota.{format_type}")
+            results.append(measure(f"export_inventory[{format_type}]", size,
+                                   lambda: fleet.export_inventory(filename, format_type), 1, size, "veículos/s"))
+    return results
+
+def run_suite(sizes, columnar=False, formats=EXPORT_FORMATS):
+    results = []
+    for size in sizes:
+        print(f"A medir {size} veículos...", file=sys.stderr)
+        results.extend(fleet_benchmark(size, columnar, formats))
+        gc.collect()
+    return {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'columnar': columnar,
+            'numpy': load_numpy() is not None
+        },
+        'results': results
+    }
+
+def print_results(report):
+    print(f"{'Tamanho':>10}  {'Operação':<26}{'Débito':>16}  {'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'RSS MB':>9}")
+    for row in report['results']:
+        rss = f"{row['peak_rss_mb']:.0f}" if row['peak_rss_mb'] is not None else "-"
+        print(f"{row['size']:>10}  {row['operation']:<26}{row['throughput']:>12.0f} {row['unit']:<4}"
+              f"{row['p50_ms']:>10.4f}{row['p95_ms']:>10.4f}{row['p99_ms']:>10.4f}{rss:>9}")
+
+def compare_results(baseline, report, threshold=REGRESSION_THRESHOLD):
+    # Regressão: p50 pior ou débito menor do que a referência para além do limiar
+    previous = {(row['size'], row['operation']): row for row in baseline['results']}
+    regressions = []
+    for row in report['results']:
+        old = previous.get((row['size'], row['operation']))
+        if old is None:
+            continue
+        slower = row['p50_ms'] > old['p50_ms'] * (1 + threshold)
+        lower = row['throughput'] < old['throughput'] * (1 - threshold)
+        if slower or lower:
+            regressions.append((row, old))
+    return regressions
+
+# ==================== CONCORRÊNCIA ====================
+STRESS_SECONDS = 5
+STRESS_SIZE = 20000
+STRESS_SWITCH_INTERVAL = 1e-5
+
+def _close(a, b):
+    return math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-3)
+
+def _check_summary(summary):
+    # Um resumo lido a meio de uma escrita teria contagens ou valores por tipo desencontrados
+    problems = []
+    if summary['total'] != sum(summary['by_type'].values()):
+        problems.append(f"total {summary['total']} != soma por tipo {sum(summary['by_type'].values())}")
+    if not _close(summary['total_value'], sum(summary['value_by_type'].values())):
+        problems.append(f"valor total {summary['total_value']:.2f} != soma por tipo")
+    return problems
+
+def _check_snapshot(snapshot):
+    # O snapshot tem de bater certo com o resumo do mesmo instante, mesmo com escritas a decorrer
+    summary = snapshot.get_summary()
+    count = value = tax = 0
+    for vehicle in snapshot.iter_vehicles():
+        count += 1
+        value += vehicle.price
+        tax += vehicle.calculate_tax()
+    problems = _check_summary(summary)
+    if count != summary['total']:
+        problems.append(f"snapshot com {count} veículos, resumo com {summary['total']}")
+    if not _close(value, summary['total_value']) or not _close(tax, summary['total_tax']):
+        problems.append("valor ou imposto do snapshot diferente do resumo")
+    return problems
+
+def _check_fleet(fleet):
+    problems = []
+    try:
+        fleet.verify_summary()
+    except AssertionError as e:
+        problems.append(str(e))
+    if len(fleet.vehicles) != len(fleet._by_id) or any(fleet.vehicles[v._row] is not v for v in fleet.vehicles):
+        problems.append("posições e ids da frota desencontrados")
+    if sum(map(len, fleet.indexes.by_type.values())) != len(fleet):
+        problems.append("índice por tipo desencontrado")
+    ranked = [v.id for v in fleet.sorted_by('price')]
+    if ranked != [v.id for v in sorted(fleet.iter_vehicles(), key=lambda v: (v.price, v.id))]:
+        problems.append("vista ordenada por preço desencontrada")
+    return problems
+
+def stress_benchmark(seconds=STRESS_SECONDS, threads=None, writers=None, size=STRESS_SIZE, columnar=False, seed=42):
+    # Escritores (add/remove/preço/desconto) e leitores (resumo, snapshot, top-N) em paralelo,
+    # uma thread por núcleo. Com o GIL as threads alternam: o intervalo de troca curto força
+    # intercalações frequentes; num Python sem GIL correm mesmo em simultâneo
+    threads = threads or max(os.cpu_count() or 1, 2)
+    writers = writers or max(1, threads // 4)
+    fleet = Fleet(columnar=columnar)
+    fleet.add_vehicles(generate_vehicles(size, seed))
+    fleet.sorted_by('price')  # mantida a cada escrita e verificada no fim
+    stop = threading.Event()
+    counts = [{} for _ in range(threads)]
+    failures = []
+    
+    def run(number):
+        rng = random.Random(seed + number)
+        done = counts[number]
+        extra = generate_vehicles(1 << 30, seed + 1000 * (number + 1))
+        try:
+            while not stop.is_set():
+                choice = rng.random()
+                if number < writers:
+                    if choice < 0.4:
+                        operation = "add_vehicle"
+                        fleet.add_vehicle(next(extra))
+                    elif choice < 0.8:
+                        operation = "remove_vehicle"
+                        fleet.remove_vehicle(rng.randrange(max(len(fleet), 1)))
+                    elif choice < 0.97:
+                        operation = "price"
+                        index = rng.randrange(max(len(fleet), 1))
+                        for vehicle in fleet.window(index, index + 1):
+                            vehicle.price = round(rng.uniform(5000, 90000), 2)
+                    else:
+                        operation = "discount"
+                        fleet.apply_global_discount(rng.choice((1, -1)))
+                else:
+                    if choice < 0.6:
+                        operation = "get_summary"
+                        problems = _check_summary(fleet.get_summary())
+                    elif choice < 0.9:
+                        operation = "top_10"
+                        # Os preços também são lidos sob o lock, senão podiam mudar depois da janela
+                        fleet.lock.acquire_read()
+                        try:
+                            prices = [v.price for v in fleet.sorted_by('price', reverse=True).window(0, 10)]
+                        finally:
+                            fleet.lock.release_read()
+                        problems = [] if prices == sorted(prices, reverse=True) else ["top-10 fora de ordem"]
+                    else:
+                        operation = "snapshot"
+                        problems = _check_snapshot(fleet.snapshot())
+                    failures.extend(f"{operation}: {problem}" for problem in problems)
+                done[operation] = done.get(operation, 0) + 1
+        except Exception as e:
+            failures.append(f"thread {number}: {type(e).__name__}: {e}")
+            stop.set()
+    
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(STRESS_SWITCH_INTERVAL)
+    workers = [threading.Thread(target=run, args=(number,)) for number in range(threads)]
+    start = time.perf_counter()
+    try:
+        for worker in workers:
+            worker.start()
+        stop.wait(seconds)
+        stop.set()
+        for worker in workers:
+            worker.join()
+    finally:
+        sys.setswitchinterval(interval)
+    elapsed = time.perf_counter() - start
+    
+    failures.extend(_check_fleet(fleet))
+    totals = {}
+    for done in counts:
+        for operation, count in done.items():
+            totals[operation] = totals.get(operation, 0) + count
+    return {'threads': threads, 'writers': writers, 'seconds': elapsed, 'size': len(fleet),
+            'operations': {operation: count / elapsed for operation, count in sorted(totals.items())},
+            'failures': failures}
+
+# ==================== SERVIÇO HTTP ====================
+SERVICE_SECONDS = 10
+SERVICE_CONNECTIONS = 16
+SERVICE_SIZE = 100000
+# Pedidos de cada cliente, por peso; em paralelo corre sempre uma exportação completa
+SERVICE_MIX = {'GET /summary': 30, 'GET /vehicles': 25, 'GET /vehicles/<id>': 15, 'POST /vehicles': 14,
+               'DELETE /vehicles/<id>': 12, 'POST /discount': 4}
+
+async def http_request(reader, writer, method, path, body=None):
+    # Cliente HTTP/1.1 mínimo com keep-alive; devolve (estado, corpo) e lê respostas em chunks
+    data = json.dumps(body).encode('utf-8') if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(data)}\r\n\r\n".encode('latin-1') + data)
+    await writer.drain()
+    lines = (await reader.readuntil(b"\r\n\r\n")).decode('latin-1').split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    headers = dict(line.lower().split(": ", 1) for line in lines[1:] if line)
+    if headers.get('transfer-encoding') != 'chunked':
+        return status, await reader.readexactly(int(headers.get('content-length', 0)))
+    chunks = []
+    while size := int(await reader.readline(), 16):
+        chunks.append(await reader.readexactly(size))
+        await reader.readline()
+    await reader.readline()
+    return status, b"".join(chunks)
+
+def _service_request(route, rng, ids, size):
+    # Pedido (método, caminho, corpo) para a rota escolhida
+    if route == 'GET /summary':
+        return 'GET', '/summary', None
+    if route == 'GET /vehicles':
+        brand, _ = rng.choice(BRANDS)
+        low = rng.randrange(15000, 90000, 1000)
+        return 'GET', f'/vehicles?brand={brand}&min_price={low}&max_price={low + 5000}&limit=50', None
+    if route == 'GET /vehicles/<id>':
+        return 'GET', f'/vehicles/{rng.randrange(1, size + 1)}', None
+    if route == 'POST /vehicles':
+        brand, model = rng.choice(BRANDS)
+        return 'POST', '/vehicles', {'brand': brand, 'model': model, 'price': rng.randrange(15000, 90000), 'year': rng.randrange(2012, 2025)}
+    if route == 'DELETE /vehicles/<id>':
+        return 'DELETE', f'/vehicles/{ids.pop(rng.randrange(len(ids)))}', None
+    return 'POST', '/discount', {'percentage': rng.choice((5, 10, 15)), 'type': rng.choice(('Vehicle', 'ElectricCar', 'Truck')), 'dry_run': True}
+
+async def _service_load(url, seconds, connections, size, seed):
+    address = urlsplit(url)
+    routes, weights = list(SERVICE_MIX), list(SERVICE_MIX.values())
+    timings = {route: [] for route in routes}
+    failures = []
+    exports = []
+    ids = []  # veículos criados pela carga, que os DELETE removem
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    
+    async def client(number):
+        rng = random.Random(seed + number)
+        reader, writer = await asyncio.open_connection(address.hostname, address.port)
+        try:
+            while loop.time() < deadline:
+                route = rng.choices(routes, weights)[0]
+                if route == 'DELETE /vehicles/<id>' and not ids:
+                    route = 'POST /vehicles'
+                method, path, body = _service_request(route, rng, ids, size)
+                start = time.perf_counter_ns()
+                status, data = await http_request(reader, writer, method, path, body)
+                timings[route].append(time.perf_counter_ns() - start)
+                # 404 é esperado ao ler um id já removido
+                if status >= 400 and not (status == 404 and route == 'GET /vehicles/<id>'):
+                    failures.append(f"{route}: {status} {data[:200].decode('utf-8', 'replace')}")
+                elif route == 'POST /vehicles':
+                    ids.extend(json.loads(data)['ids'])
+        finally:
+            writer.close()
+    
+    async def exporter():
+        # Exportações completas em fluxo, uma de cada vez: não devem atrasar os restantes pedidos
+        reader, writer = await asyncio.open_connection(address.hostname, address.port)
+        try:
+            while loop.time() < deadline:
+                start = time.perf_counter_ns()
+                status, data = await http_request(reader, writer, 'GET', '/export?format=jsonl')
+                if status != 200:
+                    failures.append(f"GET /export: {status}")
+                exports.append((time.perf_counter_ns() - start, len(data)))
+        finally:
+            writer.close()
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(connections)), exporter())
+    elapsed = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection(address.hostname, address.port)
+    _, data = await http_request(reader, writer, 'GET', '/metrics')
+    writer.close()
+    return timings, exports, failures, elapsed, json.loads(data)
+
+def service_benchmark(url=None, seconds=SERVICE_SECONDS, connections=SERVICE_CONNECTIONS, size=SERVICE_SIZE, columnar=False, seed=42):
+    # Sem url arranca "main.py serve" num processo à parte, com uma frota sintética, numa porta livre
+    process = None
+    if url is None:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py"),
+                   "serve", "--synthetic", str(size), "--seed", str(seed), "--port", "0"]
+        if columnar:
+            command.append("--columnar")
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        line = process.stdout.readline()
+        match = re.search(r"http://\S+", line)
+        if match is None:
+            process.kill()
+            raise RuntimeError(f"O serviço não arrancou: {line!r}")
+        url = match.group()
+    try:
+        timings, exports, failures, elapsed, metrics = asyncio.run(_service_load(url, seconds, connections, size, seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    
+    routes = []
+    for route, samples in timings.items():
+        samples.sort()
+        if samples:
+            routes.append({'route': route, 'requests': len(samples), 'throughput': len(samples) / elapsed,
+                           'p50_ms': percentile(samples, 50) / 1e6, 'p99_ms': percentile(samples, 99) / 1e6,
+                           'p999_ms': percentile(samples, 99.9) / 1e6, 'max_ms': samples[-1] / 1e6})
+    total = sum(len(samples) for samples in timings.values())
+    return {'url': url, 'seconds': elapsed, 'connections': connections, 'throughput': total / elapsed, 'routes': routes,
+            'exports': len(exports), 'export_mb_s': sum(size for _, size in exports) / 2**20 / (sum(ns for ns, _ in exports) / 1e9 or 1),
+            'loop_lag': metrics['loop_lag'], 'failures': failures}
+
+# ==================== FROTA PARTICIONADA ====================
+SHARD_SIZE = 1000000
+SHARD_COUNTS = (1, 2, 4, 8)
+
+def shard_benchmark(size=SHARD_SIZE, shard_counts=SHARD_COUNTS, columnar=False, seed=42):
+    # As mesmas operações com 1, 2, 4... partições; o ganho é face à primeira contagem.
+    # Só escala com núcleos livres: com menos núcleos do que partições os processos disputam-nos
+    results = []
+    for shards in shard_counts:
+        print(f"A medir {size} veículos em {shards} partição(ões)...", file=sys.stderr)
+        rows = []
+        start = time.perf_counter()
+        fleet = ShardedFleet(shards, columnar=columnar)
+        fleet.add_synthetic(size, seed)
+        rows.append({'operation': "add_synthetic", 'seconds': time.perf_counter() - start})
+        try:
+            operations = (
+                ("get_summary", fleet.get_summary, REPEATS),
+                ("recompute_summary", fleet.recompute_summary, REPEATS),
+                ("count[price+year]", lambda: fleet.query(price=(20000, 60000), year=(2018, None)).count(), REPEATS),
+                ("top_10[price]", lambda: fleet.sorted_by('price', reverse=True).window(0, 10), REPEATS),
+                ("scenario_totals", lambda: fleet.scenario(10, brand="Toyota").totals(), REPEATS),
+                ("apply_global_discount", lambda: fleet.apply_global_discount(1), REPEATS),
+            )
+            for operation, func, runs in operations:
+                row = measure(operation, size, func, runs)
+                rows.append({'operation': operation, 'seconds': row['p50_ms'] / 1000})
+            with tempfile.TemporaryDirectory() as directory:
+                filename = os.path.join(directory, "frota.jsonl")
+                start = time.perf_counter()
+                fleet.export_inventory(filename, 'jsonl')
+                rows.append({'operation': "export_inventory[jsonl]", 'seconds': time.perf_counter() - start})
+        finally:
+            fleet.close()
+        results.append({'shards': shards, 'rows': rows})
+    
+    baseline = {row['operation']: row['seconds'] for row in results[0]['rows']}
+    for result in results:
+        for row in result['rows']:
+            row['speedup'] = baseline[row['operation']] / row['seconds'] if row['seconds'] else float('inf')
+    return {'size': size, 'cpus': os.cpu_count(), 'results': results}
+
+# ==================== ARRANQUE ====================
+IMPORT_BUDGET_MS = 50
+HEAVY_MODULES = ('tkinter', 'customtkinter', 'numpy', 'concurrent.futures')
+STARTUP_PROBE = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import main\n"
+    "print((time.perf_counter() - start) * 1000)\n"
+    "print(','.join(name for name in {modules!r} if name in sys.modules))\n"
+)
+
+def startup_benchmark(runs=5):
+    # Cada medição corre num interpretador novo; a primeira grava o bytecode em cache,
+    # como numa instalação normal, por isso PYTHONDONTWRITEBYTECODE é ignorado aqui
+    directory = os.path.dirname(os.path.abspath(__file__))
+    env = {key: value for key, value in os.environ.items() if key != "PYTHONDONTWRITEBYTECODE"}
+    probe = STARTUP_PROBE.format(modules=HEAVY_MODULES)
+    timings = []
+    loaded = set()
+    for _ in range(runs + 1):
+        output = subprocess.run([sys.executable, "-c", probe], cwd=directory, env=env,
+                                capture_output=True, text=True, check=True).stdout.splitlines()
+        timings.append(float(output[0]))
+        if len(output) > 1:
+            loaded.update(filter(None, output[1].split(',')))
+    timings = sorted(timings[1:])
+    return {'median_ms': timings[len(timings) // 2], 'max_ms': timings[-1], 'heavy_modules': sorted(loaded)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks da gestão de frotas (sem interface gráfica)")
+    # Sem subcomando corre o benchmark de memória, como antes (benchmark.py --count N)
+    parser.add_argument("--count", type=int, default=100000)
+    commands = parser.add_subparsers(dest="command")
+
+    memory = commands.add_parser("memory", help="memória por veículo: registos antigos vs atuais")
+    memory.add_argument("--count", type=int, default=argparse.SUPPRESS)
+
+    suite = commands.add_parser("fleet", help="débito, latência e memória das operações da Fleet")
+    suite.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    suite.add_argument("--formats", nargs="+", choices=EXPORT_FORMATS, default=list(EXPORT_FORMATS))
+    suite.add_argument("--columnar", action="store_true")
+    suite.add_argument("--output", help="guardar os resultados em JSON")
+    suite.add_argument("--compare", help="JSON de uma execução anterior para detetar regressões")
+    suite.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    suite.add_argument("--log", action="store_true", help="manter o registo de operações em ficheiro")
+
+    stress = commands.add_parser("stress", help="escritas e leituras concorrentes, com verificação de invariantes")
+    stress.add_argument("--seconds", type=float, default=STRESS_SECONDS)
+    stress.add_argument("--threads", type=int, help="por omissão, uma por núcleo")
+    stress.add_argument("--writers", type=int, help="threads escritoras (por omissão, 1/4)")
+    stress.add_argument("--size", type=int, default=STRESS_SIZE)
+    stress.add_argument("--columnar", action="store_true")
+    
+    service = commands.add_parser("service", help="pedidos/s e latência de cauda do serviço HTTP (main.py serve)")
+    service.add_argument("--url", help="serviço já em execução (por omissão arranca um)")
+    service.add_argument("--seconds", type=float, default=SERVICE_SECONDS)
+    service.add_argument("--connections", type=int, default=SERVICE_CONNECTIONS)
+    service.add_argument("--size", type=int, default=SERVICE_SIZE, help="veículos sintéticos do serviço arrancado")
+    service.add_argument("--columnar", action="store_true")
+    
+    shards = commands.add_parser("shards", help="ganho da frota particionada por processos (map-reduce)")
+    shards.add_argument("--size", type=int, default=SHARD_SIZE)
+    shards.add_argument("--shards", type=int, nargs="+", default=list(SHARD_COUNTS))
+    shards.add_argument("--columnar", action="store_true")
+    
+    startup = commands.add_parser("startup", help="tempo de importação de main.py face ao orçamento")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--budget", type=float, default=IMPORT_BUDGET_MS, help="orçamento em ms")
+
+    args = parser.parse_args()
+
+    if args.command == "startup":
+        result = startup_benchmark(args.runs)
+        print(f"Importação de main: mediana {result['median_ms']:.1f} ms, máximo {result['max_ms']:.1f} ms "
+              f"(orçamento {args.budget:.0f} ms)")
+        if result['heavy_modules']:
+            print(f"Módulos pesados carregados no arranque: {', '.join(result['heavy_modules'])}")
+        if result['median_ms'] > args.budget or result['heavy_modules']:
+            sys.exit(1)
+        return
+
+    if args.command == "stress":
+        operation_log.sample_every = 0
+        result = stress_benchmark(args.seconds, args.threads, args.writers, args.size, args.columnar)
+        print(f"{result['threads']} threads ({result['writers']} escritoras), {result['seconds']:.1f} s, "
+              f"{result['size']} veículos no fim")
+        for operation, rate in result['operations'].items():
+            print(f"  {operation:<16}{rate:>12.0f} ops/s")
+        for failure in result['failures'][:20]:
+            print(f"FALHA {failure}")
+        if result['failures']:
+            print(f"{len(result['failures'])} invariante(s) violado(s)")
+            sys.exit(1)
+        print("Invariantes verificados")
+        return
+    
+    if args.command == "shards":
+        operation_log.sample_every = 0
+        result = shard_benchmark(args.size, args.shards, args.columnar)
+        print(f"{result['size']} veículos, {result['cpus']} núcleo(s)")
+        print(f"  {'Operação':<26}" + "".join(f"{str(row['shards']) + ' part.':>20}" for row in result['results']))
+        for index, row in enumerate(result['results'][0]['rows']):
+            cells = [result_row['rows'][index] for result_row in result['results']]
+            print(f"  {row['operation']:<26}" + "".join(f"{cell['seconds'] * 1000:>11.1f} ms {cell['speedup']:>4.1f}x" for cell in cells))
+        return
+    
+    if args.command == "service":
+        result = service_benchmark(args.url, args.seconds, args.connections, args.size, args.columnar)
+        print(f"{result['url']}: {result['connections']} ligações, {result['seconds']:.1f} s, {result['throughput']:.0f} pedidos/s")
+        print(f"  {'Pedido':<24}{'pedidos/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'p99.9 ms':>10}{'máx ms':>10}")
+        for row in result['routes']:
+            print(f"  {row['route']:<24}{row['throughput']:>10.0f}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+                  f"{row['p999_ms']:>10.2f}{row['max_ms']:>10.2f}")
+        print(f"  {result['exports']} exportação(ões) jsonl em paralelo, {result['export_mb_s']:.1f} MB/s")
+        print(f"  Atraso do ciclo de eventos: p50 {result['loop_lag']['p50_ms']:.2f} ms, p99 {result['loop_lag']['p99_ms']:.2f} ms")
+        for failure in result['failures'][:20]:
+            print(f"FALHA {failure}")
+        if result['failures']:
+            print(f"{len(result['failures'])} pedido(s) falhado(s)")
+            sys.exit(1)
+        return
+    
+    if args.command == "fleet":
+        if args.log:
+            operation_log.sample_every = 1
+        report = run_suite(args.sizes, args.columnar, args.formats)
+        print_results(report)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=4)
+            print(f"Resultados guardados em {args.output}")
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as file:
+                baseline = json.load(file)
+            regressions = compare_results(baseline, report, args.threshold)
+            for row, old in regressions:
+                print(f"REGRESSÃO {row['operation']} ({row['size']}): p50 {old['p50_ms']:.4f} -> {row['p50_ms']:.4f} ms, "
+                      f"débito {old['throughput']:.0f} -> {row['throughput']:.0f} {row['unit']}")
+            if regressions:
+                sys.exit(1)
+            print("Sem regressões face à referência")
+        return
+
+    result = memory_benchmark(args.count)
+    print(f"Veículos: {result['count']}")
+    print(f"Antes:  {result['before']:.1f} bytes/veículo")
+    print(f"Depois: {result['after']:.1f} bytes/veículo")
+    print(f"Poupança: {result['saving']:.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1105 @@
+import datetime
+import os
+from concurrent.futures import CancelledError
+from itertools import islice
+from tkinter import ttk, messagebox
+import customtkinter as ctk
+
+from main import Vehicle, ElectricCar, Truck, Fleet, SQLiteFleet, SearchResults, SORT_KEYS, JobScheduler, JobCancelled, generate_vehicles, operation_log, LOG_ENV
+
+# ==================== CONFIGURAÇÃO ====================
+ctk.set_appearance_mode("dark")
+
+# ==================== INTERFACE GRÁFICA ====================
+class VirtualTable:
+    # Tabela virtualizada: o Treeview só tem as linhas visíveis e os dados são
+    # pedidos à fonte (fetch) e formatados à medida que se faz scroll.
+    # sort_keys: coluna -> chave de SORT_KEYS; clicar no cabeçalho alterna a ordem e
+    # chama on_sort(), que troca a fonte pela versão ordenada (ver self.sort)
+    def __init__(self, parent, columns, widths=None, height=15, overscan=20, selectmode="browse", sort_keys=None, on_sort=None):
+        self.frame = ctk.CTkFrame(parent)
+        self.height = height
+        self.overscan = overscan
+        self.selectmode = selectmode
+        self.sort_keys = sort_keys or {}
+        self.on_sort = on_sort
+        self.sort = None
+        
+        self.tree = ttk.Treeview(self.frame, columns=columns, show="headings", height=height, selectmode=selectmode)
+        widths = widths or {}
+        for col in columns:
+            if col in self.sort_keys:
+                self.tree.heading(col, text=col, command=lambda col=col: self._on_heading(col))
+            else:
+                self.tree.heading(col, text=col)
+            self.tree.column(col, width=widths.get(col, 100))
+        
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        
+        # Itens fixos reutilizados em cada scroll
+        self.items = [self.tree.insert("", "end") for _ in range(height)]
+        self.tree.bind("<MouseWheel>", lambda e: self._on_wheel(-1 if e.delta > 0 else 1))
+        self.tree.bind("<Button-4>", lambda e: self._on_wheel(-1))
+        self.tree.bind("<Button-5>", lambda e: self._on_wheel(1))
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        
+        self.set_source(lambda: 0, lambda start, stop: [], lambda row: (None, ()))
+    
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+    
+    def pack_forget(self):
+        self.frame.pack_forget()
+    
+    def set_source(self, count, fetch, format_row):
+        # count() -> total de linhas; fetch(start, stop) -> objetos; format_row(obj) -> (chave, valores)
+        self.count = count
+        self.fetch = fetch
+        self.format_row = format_row
+        self.first = 0
+        self._selected = set()
+        self.refresh()
+    
+    def refresh(self):
+        self._total = self.count()
+        self._cache_start, self._cache = 0, []
+        self.scroll_to(self.first)
+    
+    def scroll_to(self, first):
+        self.first = max(0, min(first, self._total - self.height))
+        stop = min(self.first + self.height, self._total)
+        
+        if self.first < self._cache_start or stop > self._cache_start + len(self._cache):
+            self._cache_start = max(0, self.first - self.overscan)
+            rows = self.fetch(self._cache_start, stop + self.overscan)
+            self._cache = [self.format_row(row) for row in rows]
+        
+        visible = self._cache[self.first - self._cache_start:stop - self._cache_start]
+        for index, item in enumerate(self.items):
+            if index < len(visible):
+                self.tree.item(item, values=visible[index][1])
+                self.tree.move(item, "", index)
+            else:
+                self.tree.detach(item)
+        self.tree.selection_set([item for item, (key, _) in zip(self.items, visible) if key in self._selected])
+        
+        if self._total:
+            self.scrollbar.set(self.first / self._total, stop / self._total)
+        else:
+            self.scrollbar.set(0, 1)
+    
+    def visible_keys(self):
+        start = self.first - self._cache_start
+        return [key for key, _ in self._cache[start:start + self.height]]
+    
+    def selected_keys(self):
+        return list(self._selected)
+    
+    def clear_selection(self):
+        self._selected.clear()
+    
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self._total))
+        elif unit == "pages":
+            self.scroll_to(self.first + int(amount) * self.height)
+        else:
+            self.scroll_to(self.first + int(amount))
+    
+    def _on_heading(self, column):
+        # Primeiro clique: do maior para o menor; cliques seguintes invertem a ordem
+        name = self.sort_keys[column]
+        reverse = not self.sort[1] if self.sort is not None and self.sort[0] == name else True
+        self.set_sort((name, reverse))
+        if self.on_sort is not None:
+            self.on_sort()
+        self.first = 0
+        self.refresh()
+    
+    def set_sort(self, sort):
+        # sort = (chave, decrescente) ou None; a seta no cabeçalho mostra a ordem atual
+        self.sort = sort
+        for column, name in self.sort_keys.items():
+            arrow = "" if sort is None or sort[0] != name else (" ▼" if sort[1] else " ▲")
+            self.tree.heading(column, text=column + arrow)
+    
+    def _on_wheel(self, direction):
+        self.scroll_to(self.first + direction * 3)
+        return "break"
+    
+    def _on_select(self, event=None):
+        # Mantém a seleção por chave, para sobreviver ao scroll
+        selection = set(self.tree.selection())
+        if self.selectmode == "browse" and selection:
+            self._selected.clear()
+        for item, key in zip(self.items, self.visible_keys()):
+            if item in selection:
+                self._selected.add(key)
+            else:
+                self._selected.discard(key)
+
+# Partes do dashboard afetadas por cada evento (os totais são sempre revistos)
+DASHBOARD_PARTS = ('counts', 'recent')
+DASHBOARD_EVENT_PARTS = {
+    'added': ('counts', 'recent'),
+    'removed': ('counts', 'recent'),
+    'repriced': ('recent',),
+    'reset': ('counts', 'recent')
+}
+DASHBOARD_RECENT = 5
+SEARCH_DEBOUNCE_MS = 150
+# Colunas ordenáveis das tabelas de veículos
+TABLE_SORT_KEYS = {"Preço": 'price', "Ano": 'year', "Imposto": 'tax'}
+# Filtros combinados com custo estimado (FleetQuery.cost) até este valor correm na thread do Tk
+QUERY_SYNC_COST = 50000
+
+class FleetManagementApp(ctk.CTk):
+    # fleet pode ser uma Fleet em memória ou uma SQLiteFleet persistente
+    def __init__(self, fleet=None, sample_size=None):
+        super().__init__()
+        self.fleet = fleet if fleet is not None else Fleet()
+        self.jobs = JobScheduler()
+        self.current_job = None
+        # Vistas construídas uma vez e mantidas; os eventos da frota marcam o que redesenhar
+        self.views = {}
+        self.current_view = None
+        self._dirty = set()
+        self._flush_pending = None
+        self._search_pending = None
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.setup_ui()
+        self.fleet.subscribe(self._on_fleet_event)
+        # Os exemplos só enchem a frota em memória: uma base SQLite vazia fica vazia
+        if not isinstance(self.fleet, SQLiteFleet) and not len(self.fleet):
+            self.load_sample_data(sample_size)
+    
+    def setup_ui(self):
+        self.title("Sistema de Gestão de Frotas")
+        self.geometry("1200x700")
+        self.minsize(1000, 600)
+        
+        # Container principal
+        self.main_container = ctk.CTkFrame(self)
+        self.main_container.pack(fill="both", expand=True, padx=10, pady=10)
+        
+        self.create_sidebar()
+        self.create_main_content()
+        self.create_status_bar()
+        self.show_dashboard()
+    
+    def create_sidebar(self):
+        sidebar = ctk.CTkFrame(self.main_container, width=200, corner_radius=10)
+        sidebar.pack(side="left", fill="y", padx=(0, 10), pady=10)
+        
+        ctk.CTkLabel(sidebar, text="Gestor de Frotas", font=ctk.CTkFont(size=20, weight="bold")).pack(pady=(20, 30))
+        
+        # Botões de navegação (removida a opção Definições)
+        buttons = [
+            ("📊 Dashboard", self.show_dashboard),
+            ("🚗 Adicionar Veículo", self.show_add_vehicle),
+            ("🗑️ Remover Veículo", self.show_remove_vehicle),
+            ("💰 Aplicar Desconto", self.show_discount),
+            ("🔍 Filtrar", self.show_inventory),  # Alterado de "📋 Inventário" para "🔍 Filtrar"
+            ("📤 Exportar", self.show_export),
+            ("🩺 Diagnóstico", self.show_diagnostics),
+            ("↩️ Desfazer", self.undo)
+        ]
+        
+        for text, command in buttons:
+            btn = ctk.CTkButton(sidebar, text=text, command=command, height=40, corner_radius=8)
+            btn.pack(pady=5, padx=10)
+        self.bind("<Control-z>", lambda event: self.undo())
+    
+    def create_main_content(self):
+        self.content_frame = ctk.CTkFrame(self.main_container, corner_radius=10)
+        self.content_frame.pack(side="right", fill="both", expand=True, pady=10)
+        
+        self.content_title = ctk.CTkLabel(self.content_frame, text="Dashboard", font=ctk.CTkFont(size=24, weight="bold"))
+        self.content_title.pack(pady=(20, 10))
+        
+        self.content_container = ctk.CTkScrollableFrame(self.content_frame, corner_radius=10)
+        self.content_container.pack(fill="both", expand=True, padx=20, pady=(0, 20))
+    
+    def create_status_bar(self):
+        status_bar = ctk.CTkFrame(self, height=30)
+        status_bar.pack(side="bottom", fill="x")
+        
+        self.status_label = ctk.CTkLabel(status_bar, text="Pronto", font=ctk.CTkFont(size=12))
+        self.status_label.pack(side="left", padx=10)
+        
+        # Progresso e cancelamento da tarefa em segundo plano (só visíveis durante a tarefa)
+        self.job_cancel = ctk.CTkButton(status_bar, text="Cancelar", command=self.cancel_job, width=80, height=24, fg_color="#D32F2F")
+        self.job_progress = ctk.CTkProgressBar(status_bar, width=200)
+        
+        self.update_status()
+    
+    def update_status(self, message="Pronto"):
+        self.status_label.configure(text=message)
+    
+    # ==================== TAREFAS ====================
+    
+    def run_job(self, description, func, on_success):
+        # func(job) corre numa thread do pool; o resultado volta à thread do Tk via after()
+        if self.current_job is not None:
+            messagebox.showwarning("Aviso", "Já existe uma tarefa em curso!")
+            return None
+        
+        job = self.jobs.submit(description, func)
+        self.current_job = job
+        self.job_progress.set(0)
+        self.job_cancel.pack(side="right", padx=10)
+        self.job_progress.pack(side="right", padx=10)
+        self._poll_job(job, on_success)
+        return job
+    
+    def _poll_job(self, job, on_success):
+        if not job.done():
+            self.job_progress.set(job.progress)
+            self.update_status(f"{job.description}... {job.progress:.0%}")
+            self.after(100, self._poll_job, job, on_success)
+            return
+        
+        self.current_job = None
+        self.job_progress.pack_forget()
+        self.job_cancel.pack_forget()
+        try:
+            result = job.result()
+        except (JobCancelled, CancelledError):
+            self.update_status(f"{job.description}: cancelado")
+            return
+        except Exception as e:
+            self.update_status("Pronto")
+            messagebox.showerror("Erro", f"Ocorreu um erro: {str(e)}")
+            return
+        self.update_status("Pronto")
+        on_success(result)
+    
+    def undo(self):
+        # Desfaz a última alteração através do diário da Fleet (a SQLiteFleet não tem diário)
+        if getattr(self.fleet, 'journal', None) is None:
+            messagebox.showinfo("Info", "Esta frota não permite desfazer alterações!")
+            return
+        success, message = self.fleet.undo()
+        self.update_status(message)
+    
+    def cancel_job(self):
+        if self.current_job is not None:
+            self.current_job.cancel()
+    
+    def on_close(self):
+        self.fleet.unsubscribe(self._on_fleet_event)
+        for pending in (self._flush_pending, self._search_pending):
+            if pending is not None:
+                self.after_cancel(pending)
+        self.cancel_job()
+        self.jobs.shutdown()
+        self.destroy()
+    
+    # ==================== EVENTOS ====================
+    
+    def _on_fleet_event(self, event, vehicles):
+        # Os eventos acumulam-se e são desenhados de uma vez no próximo frame
+        self._dirty.update(DASHBOARD_EVENT_PARTS[event])
+        if self._flush_pending is None:
+            self._flush_pending = self.after(16, self._flush_fleet_events)
+    
+    def _flush_fleet_events(self):
+        self._flush_pending = None
+        parts, self._dirty = self._dirty, set()
+        self.update_dashboard(parts)
+        
+        # As tabelas só pedem as linhas visíveis; as vistas escondidas atualizam ao reaparecer
+        if self.current_view is self.views.get('remove'):
+            self.update_remove_view()
+        elif self.current_view is self.views.get('inventory') and (self.filter_live or self.filter_query):
+            self.refresh_filter_results()
+        elif self.current_view is self.views.get('diagnostics'):
+            self.update_diagnostics()
+    
+    @staticmethod
+    def _set_text(label, text):
+        # configure só quando o texto muda: evita redesenhos desnecessários
+        if label.cget("text") != text:
+            label.configure(text=text)
+    
+    # ==================== VIEWS ====================
+    
+    def show_view(self, name, title, builder):
+        # Cada vista é construída uma única vez; mudar de vista só troca o frame visível
+        view = self.views.get(name)
+        if view is None:
+            view = ctk.CTkFrame(self.content_container, fg_color="transparent")
+            builder(view)
+            self.views[name] = view
+        if self.current_view is not view:
+            if self.current_view is not None:
+                self.current_view.pack_forget()
+            view.pack(fill="both", expand=True)
+            self.current_view = view
+        self.content_title.configure(text=title)
+        return view
+    
+    def show_dashboard(self):
+        self.show_view('dashboard', "Dashboard", self.build_dashboard)
+    
+    def build_dashboard(self, view):
+        # Estatísticas
+        self.stats_frame = ctk.CTkFrame(view, corner_radius=10)
+        self.stats_frame.pack(fill="x", pady=(0, 20))
+        
+        stats_data = [
+            ("total", "Total Veículos", "#4CC9F0"),
+            ("total_value", "Valor Total", "#4361EE"),
+            ("total_tax", "Imposto Total", "#3A0CA3"),
+            ("average", "Valor Médio", "#7209B7")
+        ]
+        
+        row_frame = ctk.CTkFrame(self.stats_frame)
+        row_frame.pack(fill="x", padx=20, pady=20)
+        
+        self.stat_labels = {}
+        for key, title, color in stats_data:
+            card = ctk.CTkFrame(row_frame, height=100, corner_radius=10)
+            card.pack(side="left", padx=10, expand=True, fill="both")
+            
+            ctk.CTkLabel(card, text=title, font=ctk.CTkFont(size=14)).pack(pady=(15, 5))
+            self.stat_labels[key] = ctk.CTkLabel(card, text="", font=ctk.CTkFont(size=22, weight="bold"), text_color=color)
+            self.stat_labels[key].pack(pady=5)
+        
+        # Distribuição por tipo (uma linha por tipo, criada quando o tipo aparece)
+        self.dist_frame = ctk.CTkFrame(view, corner_radius=10)
+        ctk.CTkLabel(self.dist_frame, text="Distribuição por Tipo", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=(15, 10))
+        self.type_rows = {}
+        
+        # Veículos recentes (linhas fixas reutilizadas)
+        self.recent_frame = ctk.CTkFrame(view, corner_radius=10)
+        ctk.CTkLabel(self.recent_frame, text="Veículos Recentes", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=(15, 10))
+        self.recent_rows = []
+        for _ in range(DASHBOARD_RECENT):
+            vehicle_frame = ctk.CTkFrame(self.recent_frame, height=50)
+            name_label = ctk.CTkLabel(vehicle_frame, text="", font=ctk.CTkFont(size=12))
+            name_label.pack(side="left", padx=10)
+            tax_label = ctk.CTkLabel(vehicle_frame, text="", font=ctk.CTkFont(size=12))
+            tax_label.pack(side="right", padx=10)
+            self.recent_rows.append((vehicle_frame, name_label, tax_label))
+        
+        self.update_dashboard(DASHBOARD_PARTS)
+    
+    def update_dashboard(self, parts):
+        if not hasattr(self, 'stat_labels'):
+            return
+        summary = self.fleet.get_summary()
+        total = summary['total']
+        
+        self._set_text(self.stat_labels['total'], f"{total}")
+        self._set_text(self.stat_labels['total_value'], f"€{summary['total_value']:,.2f}")
+        self._set_text(self.stat_labels['total_tax'], f"€{summary['total_tax']:,.2f}")
+        self._set_text(self.stat_labels['average'], f"€{summary['total_value']/max(total, 1):,.2f}")
+        
+        if 'counts' in parts:
+            self.update_type_rows(summary)
+        if 'recent' in parts:
+            self.update_recent_rows(total)
+    
+    def update_type_rows(self, summary):
+        total = summary['total']
+        for vehicle_type in summary['by_type']:
+            if vehicle_type not in self.type_rows:
+                type_frame = ctk.CTkFrame(self.dist_frame, height=40)
+                ctk.CTkLabel(type_frame, text=vehicle_type, font=ctk.CTkFont(size=14)).pack(side="left", padx=10)
+                progress_bar = ctk.CTkProgressBar(type_frame)
+                progress_bar.pack(side="left", padx=10, expand=True, fill="x")
+                count_label = ctk.CTkLabel(type_frame, text="", font=ctk.CTkFont(size=14))
+                count_label.pack(side="right", padx=10)
+                self.type_rows[vehicle_type] = (type_frame, progress_bar, count_label)
+        
+        # Só se volta a arrumar as linhas quando o conjunto de tipos presentes muda
+        shown = [vehicle_type for vehicle_type, (type_frame, _, _) in self.type_rows.items() if type_frame.winfo_manager()]
+        if shown != list(summary['by_type']):
+            for type_frame, _, _ in self.type_rows.values():
+                type_frame.pack_forget()
+            for vehicle_type in summary['by_type']:
+                self.type_rows[vehicle_type][0].pack(fill="x", padx=20, pady=5)
+        
+        for vehicle_type, count in summary['by_type'].items():
+            _, progress_bar, count_label = self.type_rows[vehicle_type]
+            progress = (count / total) * 100
+            if progress_bar.get() != progress / 100:
+                progress_bar.set(progress / 100)
+            self._set_text(count_label, f"{count} ({progress:.1f}%)")
+        
+        if summary['by_type'] and not self.dist_frame.winfo_manager():
+            self.dist_frame.pack(fill="x", pady=(0, 20), after=self.stats_frame)
+        elif not summary['by_type'] and self.dist_frame.winfo_manager():
+            self.dist_frame.pack_forget()
+    
+    def update_recent_rows(self, total):
+        recent = self.fleet.recent(len(self.recent_rows)) if total else []
+        for i, (vehicle_frame, name_label, tax_label) in enumerate(self.recent_rows):
+            if i < len(recent):
+                self._set_text(name_label, str(recent[i]))
+                self._set_text(tax_label, f"Imposto: €{recent[i].calculate_tax():.2f}")
+                if not vehicle_frame.winfo_manager():
+                    vehicle_frame.pack(fill="x", padx=20, pady=5)
+            elif vehicle_frame.winfo_manager():
+                vehicle_frame.pack_forget()
+        
+        if recent and not self.recent_frame.winfo_manager():
+            self.recent_frame.pack(fill="x")
+        elif not recent and self.recent_frame.winfo_manager():
+            self.recent_frame.pack_forget()
+    
+    def show_add_vehicle(self):
+        self.show_view('add', "Adicionar Veículo", self.build_add_vehicle)
+    
+    def build_add_vehicle(self, view):
+        form_frame = ctk.CTkFrame(view, corner_radius=10)
+        form_frame.pack(fill="x", pady=(0, 20), padx=20)
+        
+        # Tipo de veículo
+        ctk.CTkLabel(form_frame, text="Tipo de Veículo:", font=ctk.CTkFont(size=14)).grid(row=0, column=0, padx=20, pady=20, sticky="w")
+        self.vehicle_type = ctk.StringVar(value="Vehicle")
+        type_combo = ctk.CTkComboBox(form_frame, values=["Vehicle", "ElectricCar", "Truck"], variable=self.vehicle_type, command=self.update_form_fields, width=200)
+        type_combo.grid(row=0, column=1, padx=20, pady=20, sticky="w")
+        
+        # Campos comuns
+        self.entries = {}
+        fields = [("Marca:", "brand"), ("Modelo:", "model"), ("Preço (€):", "price"), ("Ano:", "year")]
+        
+        for i, (label, key) in enumerate(fields, 1):
+            ctk.CTkLabel(form_frame, text=label, font=ctk.CTkFont(size=14)).grid(row=i, column=0, padx=20, pady=10, sticky="w")
+            entry = ctk.CTkEntry(form_frame, width=200)
+            entry.grid(row=i, column=1, padx=20, pady=10, sticky="w")
+            self.entries[key] = entry
+        
+        # Campos específicos (um grupo por tipo, alternados em update_form_fields)
+        self.special_frame = ctk.CTkFrame(form_frame, corner_radius=10)
+        self.special_frame.grid(row=5, column=0, columnspan=2, padx=20, pady=20, sticky="ew")
+        
+        special_fields = {
+            "ElectricCar": [("Capacidade Bateria (kWh):", "battery"), ("Autonomia (km):", "autonomy")],
+            "Truck": [("Capacidade Carga (ton):", "load"), ("Comprimento (m):", "length")]
+        }
+        self.special_groups = {}
+        for vehicle_type, fields in special_fields.items():
+            group = ctk.CTkFrame(self.special_frame, fg_color="transparent")
+            for i, (label, key) in enumerate(fields):
+                ctk.CTkLabel(group, text=label, font=ctk.CTkFont(size=14)).grid(row=i, column=0, padx=20, pady=10, sticky="w")
+                entry = ctk.CTkEntry(group, width=200)
+                entry.grid(row=i, column=1, padx=20, pady=10, sticky="w")
+                self.entries[key] = entry
+            self.special_groups[vehicle_type] = group
+        
+        # Botões
+        button_frame = ctk.CTkFrame(form_frame)
+        button_frame.grid(row=6, column=0, columnspan=2, pady=30)
+        
+        ctk.CTkButton(button_frame, text="Adicionar Veículo", command=self.add_vehicle, height=40, width=150).pack(side="left", padx=20)
+        ctk.CTkButton(button_frame, text="Limpar Formulário", command=self.clear_form, height=40, width=150, fg_color="gray").pack(side="left", padx=20)
+        
+        self.update_form_fields()
+    
+    def update_form_fields(self, choice=None):
+        vehicle_type = self.vehicle_type.get()
+        for group_type, group in self.special_groups.items():
+            if group_type == vehicle_type:
+                group.pack(fill="x")
+            else:
+                group.pack_forget()
+    
+    def add_vehicle(self):
+        try:
+            brand = self.entries['brand'].get()
+            model = self.entries['model'].get()
+            price = float(self.entries['price'].get())
+            year = int(self.entries['year'].get())
+            
+            vehicle_type = self.vehicle_type.get()
+            
+            if vehicle_type == "Vehicle":
+                vehicle = Vehicle(brand, model, price, year)
+            elif vehicle_type == "ElectricCar":
+                battery = float(self.entries['battery'].get())
+                autonomy = float(self.entries['autonomy'].get())
+                vehicle = ElectricCar(brand, model, price, year, battery, autonomy)
+            elif vehicle_type == "Truck":
+                load = float(self.entries['load'].get())
+                length = float(self.entries['length'].get())
+                vehicle = Truck(brand, model, price, year, load, length)
+            
+            # O dashboard é atualizado pelo evento 'added'
+            self.fleet.add_vehicle(vehicle)
+            messagebox.showinfo("Sucesso", f"Veículo adicionado!\n\n{vehicle}")
+            self.clear_form()
+            self.update_status(f"Adicionado {brand} {model}")
+            self.show_dashboard()
+            
+        except ValueError:
+            messagebox.showerror("Erro", "Por favor, introduza valores válidos!")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Ocorreu um erro: {str(e)}")
+    
+    def clear_form(self):
+        for entry in self.entries.values():
+            entry.delete(0, 'end')
+    
+    def show_remove_vehicle(self):
+        self.show_view('remove', "Remover Veículo", self.build_remove_vehicle)
+        self.update_remove_view()
+    
+    def build_remove_vehicle(self, view):
+        self.remove_empty = ctk.CTkLabel(view, text="Não há veículos na frota!", font=ctk.CTkFont(size=16))
+        
+        # Tabela de veículos (chave de cada linha: id estável do veículo)
+        columns = ("#", "Tipo", "Marca", "Modelo", "Preço", "Ano", "Imposto")
+        self.table = VirtualTable(view, columns, widths={"#": 50, "Modelo": 150}, selectmode="extended", sort_keys=TABLE_SORT_KEYS)
+        self.table.set_source(lambda: len(self.fleet), lambda start, stop: self.fleet_window(self.table, start, stop), lambda vehicle: (vehicle.id, (
+            vehicle.id,
+            vehicle.__class__.__name__,
+            vehicle.brand,
+            vehicle.model,
+            f"€{vehicle.price:.2f}",
+            vehicle.year,
+            f"€{vehicle.calculate_tax():.2f}"
+        )))
+        
+        # Botão de remover
+        self.remove_buttons = ctk.CTkFrame(view)
+        ctk.CTkButton(self.remove_buttons, text="Remover Veículo Selecionado", command=self.remove_selected, height=40, width=200, fg_color="#D32F2F").pack(pady=10)
+    
+    def fleet_window(self, table, start, stop):
+        # Frota inteira: por posição ou, com a tabela ordenada, uma janela da vista
+        # ordenada da frota (O(log n + k), sem ordenar nada a cada clique)
+        if table.sort is None:
+            return self.fleet.window(start, stop)
+        name, reverse = table.sort
+        return self.fleet.sorted_by(name, reverse=reverse).window(start, stop)
+    
+    def update_remove_view(self):
+        self.table.refresh()
+        if not len(self.fleet):
+            self.table.pack_forget()
+            self.remove_buttons.pack_forget()
+            self.remove_empty.pack(pady=50)
+        elif not self.remove_buttons.winfo_manager():
+            self.remove_empty.pack_forget()
+            self.table.pack(fill="both", expand=True, padx=20, pady=20)
+            self.remove_buttons.pack(pady=20)
+    
+    def remove_selected(self):
+        selection = self.table.selected_keys()
+        if not selection:
+            messagebox.showwarning("Aviso", "Selecione um veículo para remover!")
+            return
+        
+        if len(selection) == 1:
+            vehicle = self.fleet.get_vehicle(selection[0])
+            question = f"Remover {vehicle.brand} {vehicle.model}?"
+        else:
+            question = f"Remover {len(selection)} veículos?"
+        
+        if messagebox.askyesno("Confirmar", question):
+            # A tabela é atualizada pelo evento 'removed'
+            removed = self.fleet.remove_vehicles(selection)
+            if removed:
+                self.table.clear_selection()
+                if len(removed) == 1:
+                    self.update_status(f"Removido {removed[0].brand} {removed[0].model}")
+                else:
+                    self.update_status(f"Removidos {len(removed)} veículos")
+                messagebox.showinfo("Sucesso", "Veículo removido!" if len(removed) == 1 else f"{len(removed)} veículos removidos!")
+    
+    def show_discount(self):
+        self.show_view('discount', "Aplicar Desconto/Imposto", self.build_discount)
+    
+    def build_discount(self, view):
+        discount_frame = ctk.CTkFrame(view, corner_radius=10)
+        discount_frame.pack(fill="x", padx=100, pady=50)
+        
+        ctk.CTkLabel(discount_frame, text="Aplicar percentagem de desconto (positivo) ou imposto (negativo) aos veículos abrangidos", font=ctk.CTkFont(size=14), wraplength=400).pack(pady=(30, 20))
+        
+        input_frame = ctk.CTkFrame(discount_frame)
+        input_frame.pack(pady=20)
+        
+        ctk.CTkLabel(input_frame, text="Percentagem:", font=ctk.CTkFont(size=14)).pack(side="left", padx=(0, 10))
+        self.percentage_entry = ctk.CTkEntry(input_frame, width=100)
+        self.percentage_entry.pack(side="left")
+        ctk.CTkLabel(input_frame, text="%", font=ctk.CTkFont(size=14)).pack(side="left", padx=(5, 20))
+        
+        ctk.CTkLabel(discount_frame, text="Exemplo: +10% = 10% desconto, -5% = 5% imposto extra", font=ctk.CTkFont(size=12), text_color="gray").pack(pady=10)
+        
+        # Âmbito do cenário (vazio = todos os veículos)
+        scope_frame = ctk.CTkFrame(discount_frame)
+        scope_frame.pack(pady=10)
+        
+        ctk.CTkLabel(scope_frame, text="Tipo:", font=ctk.CTkFont(size=14)).pack(side="left", padx=(10, 5))
+        self.discount_type = ctk.StringVar(value="Todos")
+        ctk.CTkComboBox(scope_frame, values=["Todos", "Vehicle", "ElectricCar", "Truck"], variable=self.discount_type, width=130).pack(side="left")
+        ctk.CTkLabel(scope_frame, text="Marca:", font=ctk.CTkFont(size=14)).pack(side="left", padx=(15, 5))
+        self.discount_brand = ctk.CTkEntry(scope_frame, width=110)
+        self.discount_brand.pack(side="left")
+        ctk.CTkLabel(scope_frame, text="Ano mínimo:", font=ctk.CTkFont(size=14)).pack(side="left", padx=(15, 5))
+        self.discount_year = ctk.CTkEntry(scope_frame, width=70)
+        self.discount_year.pack(side="left", padx=(0, 10))
+        
+        button_frame = ctk.CTkFrame(discount_frame)
+        button_frame.pack(pady=30)
+        
+        ctk.CTkButton(button_frame, text="Aplicar", command=self.apply_discount, height=40, width=200).pack(side="left", padx=10)
+        ctk.CTkButton(button_frame, text="Pré-visualizar", command=self.preview_discount, height=40, width=200, fg_color="gray").pack(side="left", padx=10)
+    
+    def discount_scenario(self, source):
+        # Cenário com a percentagem e o âmbito do formulário (ValueError se inválidos)
+        percentage = float(self.percentage_entry.get())
+        vehicle_type = self.discount_type.get()
+        year = self.discount_year.get().strip()
+        return source.scenario(
+            percentage,
+            vehicle_type=None if vehicle_type == "Todos" else vehicle_type,
+            brand=self.discount_brand.get().strip() or None,
+            min_year=int(year) if year else None
+        )
+    
+    def apply_discount(self):
+        try:
+            scenario = self.discount_scenario(self.fleet)
+        except ValueError:
+            messagebox.showerror("Erro", "Introduza uma percentagem e um ano válidos!")
+            return
+        
+        percentage = scenario.percentage
+        if messagebox.askyesno("Confirmar", f"Aplicar {percentage}% {'desconto' if percentage > 0 else 'imposto extra'} aos veículos abrangidos?"):
+            try:
+                count = scenario.commit()
+            except ValueError as e:
+                messagebox.showerror("Erro", str(e))
+                return
+            messagebox.showinfo("Sucesso", f"Aplicado a {count} veículos!")
+            self.update_status(f"Aplicado {percentage}% a {count} veículos")
+            self.show_dashboard()
+    
+    def preview_discount(self):
+        try:
+            scenario = self.discount_scenario(self.fleet)
+        except ValueError:
+            messagebox.showerror("Erro", "Introduza uma percentagem e um ano válidos!")
+            return
+        
+        preview_window = ctk.CTkToplevel(self)
+        preview_window.title("Pré-visualização de Desconto")
+        preview_window.geometry("600x400")
+        
+        # Totais do cenário calculados em segundo plano sobre um snapshot
+        total_label = ctk.CTkLabel(preview_window, text="Variação total: a calcular...", font=ctk.CTkFont(size=14, weight="bold"))
+        total_label.pack(side="bottom", pady=10)
+        
+        def on_success(totals):
+            if total_label.winfo_exists():
+                total_label.configure(text=f"{totals['count']} veículos abrangidos | Variação total: €{totals['delta_value']:+,.2f} "
+                                           f"| Imposto: €{totals['delta_tax']:+,.2f}")
+        
+        snapshot = self.fleet.snapshot()
+        snapshot_scenario = self.discount_scenario(snapshot)
+        def run(job):
+            # O snapshot é fechado pela tarefa que o lê (numa base SQLite liberta a ligação)
+            with snapshot:
+                return snapshot_scenario.totals(job)
+        if self.run_job("A calcular pré-visualização", run, on_success) is None:
+            snapshot.close()
+        
+        # Novos preços calculados só para as linhas visíveis, sem alterar a frota
+        def format_row(vehicle):
+            new_price = scenario.new_price(vehicle)
+            change = new_price - vehicle.price
+            change_percent = (change / vehicle.price) * 100 if vehicle.price != 0 else 0
+            return vehicle.id, (
+                vehicle.brand,
+                vehicle.model,
+                f"€{vehicle.price:.2f}",
+                f"€{new_price:.2f}",
+                f"{change_percent:+.1f}%"
+            )
+        
+        columns = ("Marca", "Modelo", "Preço Antigo", "Preço Novo", "Variação")
+        table = VirtualTable(preview_window, columns, widths={col: 120 for col in columns})
+        table.pack(fill="both", expand=True, padx=10, pady=10)
+        table.set_source(lambda: len(self.fleet), self.fleet.window, format_row)
+    
+    def show_inventory(self):
+        view = self.views.get('inventory')
+        self.show_view('inventory', "Filtrar", self.build_inventory)  # Alterado de "Inventário" para "Filtrar"
+        if view is None:
+            self.show_all_results()
+        elif self.filter_live or self.filter_query:
+            self.refresh_filter_results()
+    
+    def build_inventory(self, view):
+        inventory_frame = ctk.CTkFrame(view, corner_radius=10)
+        inventory_frame.pack(fill="both", expand=True, padx=20, pady=20)
+        
+        # Filtros
+        filters_frame = ctk.CTkFrame(inventory_frame)
+        filters_frame.pack(fill="x", pady=20, padx=20)
+        
+        # Pesquisa em marca e modelo, a cada tecla; combinada com os restantes filtros
+        brand_frame = ctk.CTkFrame(filters_frame)
+        brand_frame.pack(fill="x", pady=10)
+        ctk.CTkLabel(brand_frame, text="Pesquisar Marca/Modelo:", font=ctk.CTkFont(size=14)).pack(side="left", padx=(0, 10))
+        self.brand_filter = ctk.CTkEntry(brand_frame, width=150, placeholder_text="ex.: Actr, Kona")
+        self.brand_filter.pack(side="left")
+        self.brand_filter.bind("<KeyRelease>", self.schedule_search)
+        self.brand_filter.bind("<Return>", lambda event: self.apply_filters())
+        
+        # Intervalos de ano e de preço (campos vazios = sem limite)
+        year_frame = ctk.CTkFrame(filters_frame)
+        year_frame.pack(fill="x", pady=10)
+        ctk.CTkLabel(year_frame, text="Ano (mínimo / máximo):", font=ctk.CTkFont(size=14)).pack(side="left", padx=(0, 10))
+        self.year_filter = ctk.CTkEntry(year_frame, width=100)
+        self.year_filter.pack(side="left")
+        self.max_year_filter = ctk.CTkEntry(year_frame, width=100)
+        self.max_year_filter.pack(side="left", padx=10)
+        
+        price_frame = ctk.CTkFrame(filters_frame)
+        price_frame.pack(fill="x", pady=10)
+        ctk.CTkLabel(price_frame, text="Preço (mínimo / máximo):", font=ctk.CTkFont(size=14)).pack(side="left", padx=(0, 10))
+        self.min_price_filter = ctk.CTkEntry(price_frame, width=100)
+        self.min_price_filter.pack(side="left")
+        self.max_price_filter = ctk.CTkEntry(price_frame, width=100)
+        self.max_price_filter.pack(side="left", padx=10)
+        
+        # Filtro por tipo
+        type_frame = ctk.CTkFrame(filters_frame)
+        type_frame.pack(fill="x", pady=10)
+        ctk.CTkLabel(type_frame, text="Filtrar por Tipo:", font=ctk.CTkFont(size=14)).pack(side="left", padx=(0, 10))
+        self.type_filter = ctk.StringVar(value="Todos")
+        ctk.CTkComboBox(type_frame, values=["Todos", "Vehicle", "ElectricCar", "Truck"], variable=self.type_filter, width=150).pack(side="left")
+        
+        buttons_frame = ctk.CTkFrame(filters_frame, fg_color="transparent")
+        buttons_frame.pack(pady=20)
+        ctk.CTkButton(buttons_frame, text="Filtrar", command=self.apply_filters, width=150).pack(side="left", padx=10)
+        ctk.CTkButton(buttons_frame, text="Mostrar Todos", command=self.clear_filters, width=150, fg_color="gray").pack(side="left", padx=10)
+        
+        # Tabela de resultados (a mesma tabela serve todos os filtros)
+        self.results_frame = ctk.CTkFrame(inventory_frame)
+        self.results_frame.pack(fill="both", expand=True, pady=20, padx=20)
+        
+        self.filter_empty = ctk.CTkLabel(self.results_frame, text="Nenhum veículo encontrado", font=ctk.CTkFont(size=14))
+        self.filter_count = ctk.CTkLabel(self.results_frame, text="", font=ctk.CTkFont(size=12))
+        self.filter_plan = ctk.CTkLabel(self.results_frame, text="", font=ctk.CTkFont(size=11), text_color="gray", justify="left")
+        
+        columns = ("Marca", "Modelo", "Tipo", "Preço", "Ano", "Imposto")
+        self.filter_table = VirtualTable(self.results_frame, columns, widths={"Marca": 120, "Modelo": 150}, height=10,
+                                         sort_keys=TABLE_SORT_KEYS, on_sort=self.on_filter_sort)
+        self.filter_live = False
+        self.filter_query = None
+        self.filter_results = []
+    
+    def schedule_search(self, event=None):
+        # Debounce: a pesquisa corre SEARCH_DEBOUNCE_MS depois da última tecla
+        if self._search_pending is not None:
+            self.after_cancel(self._search_pending)
+        self._search_pending = self.after(SEARCH_DEBOUNCE_MS, self.apply_filters)
+    
+    def filter_criteria(self):
+        # Só os critérios preenchidos; valores inválidos são ignorados, como antes
+        def number(entry, kind):
+            try:
+                return kind(entry.get().strip())
+            except ValueError:
+                return None
+        vehicle_type = self.type_filter.get()
+        criteria = {
+            'search': self.brand_filter.get().strip() or None,
+            'vehicle_type': None if vehicle_type == "Todos" else vehicle_type,
+            'year': (number(self.year_filter, int), number(self.max_year_filter, int)),
+            'price': (number(self.min_price_filter, float), number(self.max_price_filter, float))
+        }
+        return {name: value for name, value in criteria.items() if value not in (None, (None, None))}
+    
+    def run_filter(self, criteria):
+        # Só pesquisa: janelas sobre os baldes do índice de texto, sem copiar os resultados.
+        # Restantes casos: FleetQuery, materializada para a tabela poder saltar para qualquer linha
+        if list(criteria) == ['search']:
+            self.filter_results = self.fleet.search(criteria['search'])
+        else:
+            query = self.fleet.query(**criteria)
+            if query.cost is None or query.cost > QUERY_SYNC_COST:
+                return query
+            self.filter_results = list(query)
+            self._set_text(self.filter_plan, query.explain())
+        self.sort_filter_results()
+        return None
+    
+    def apply_filters(self):
+        if self._search_pending is not None:
+            self.after_cancel(self._search_pending)
+            self._search_pending = None
+        criteria = self.filter_criteria()
+        if not criteria:
+            self.show_all_results()
+            return
+        self._set_text(self.filter_plan, "")
+        query = self.run_filter(criteria)
+        if query is None:
+            # Resultado barato de recalcular: acompanha as alterações da frota
+            self.show_filter_results(lambda: len(self.filter_results), self.fetch_filter_results)
+            self.filter_query = criteria
+            return
+        
+        # Filtro caro: corre em segundo plano sobre um snapshot e o resultado fica fixo
+        self.filter_query = None
+        snapshot = self.fleet.snapshot()
+        def run(job):
+            with snapshot:
+                query = snapshot.query(**criteria)
+                return list(query), query.explain()
+        def done(result):
+            self.filter_results, plan = result
+            self._set_text(self.filter_plan, plan)
+            self.sort_filter_results()
+            self.show_filter_results(lambda: len(self.filter_results), self.fetch_filter_results)
+        if self.run_job("A filtrar", run, done) is None:
+            snapshot.close()
+    
+    def fetch_filter_results(self, start, stop):
+        results = self.filter_results
+        return results.window(start, stop) if isinstance(results, SearchResults) else results[start:stop]
+    
+    def on_filter_sort(self):
+        # Com a frota inteira a ordem vem de fleet_window; só os resultados fixos são reordenados
+        if not self.filter_live:
+            self.sort_filter_results()
+    
+    def sort_filter_results(self):
+        # Resultado de um filtro: só esse subconjunto é ordenado, uma vez por clique ou por
+        # novo resultado (a frota inteira usa as vistas ordenadas, ver fleet_window)
+        if self.filter_table.sort is None:
+            return
+        name, reverse = self.filter_table.sort
+        key = SORT_KEYS[name]
+        self.filter_results = sorted(self.filter_results, key=lambda vehicle: (key(vehicle), vehicle.id), reverse=reverse)
+    
+    def refresh_filter_results(self):
+        # O filtro é repetido sobre a frota atual; a tabela mantém a posição do scroll
+        if self.filter_query and self.run_filter(self.filter_query) is not None:
+            # A frota cresceu e o filtro deixou de ser barato: mantém o último resultado
+            self.filter_query = None
+        self.filter_table.refresh()
+        self.update_filter_count()
+    
+    def clear_filters(self):
+        for entry in (self.brand_filter, self.year_filter, self.max_year_filter, self.min_price_filter, self.max_price_filter):
+            entry.delete(0, 'end')
+        self.type_filter.set("Todos")
+        self.show_all_results()
+    
+    def show_all_results(self):
+        # A frota inteira, lida por janelas sem cópia
+        self.filter_query = None
+        self._set_text(self.filter_plan, "")
+        self.show_filter_results(lambda: len(self.fleet), lambda start, stop: self.fleet_window(self.filter_table, start, stop), live=True)
+    
+    def show_filter_results(self, count, fetch, live=False):
+        # live=True: a tabela lê a frota e acompanha os eventos; senão mostra o resultado fixo do filtro
+        self.filter_live = live
+        self.filter_table.set_source(count, fetch, lambda vehicle: (vehicle.id, (
+            vehicle.brand,
+            vehicle.model,
+            vehicle.__class__.__name__,
+            f"€{vehicle.price:.2f}",
+            vehicle.year,
+            f"€{vehicle.calculate_tax():.2f}"
+        )))
+        self.update_filter_count()
+    
+    def update_filter_count(self):
+        found = self.filter_table.count()
+        if not found:
+            self.filter_count.pack_forget()
+            self.filter_plan.pack_forget()
+            self.filter_table.pack_forget()
+            self.filter_empty.pack(pady=50)
+            return
+        
+        self._set_text(self.filter_count, f"Encontrados {found} veículo(s)")
+        if not self.filter_count.winfo_manager():
+            self.filter_empty.pack_forget()
+            self.filter_plan.pack(side="bottom", pady=(0, 10))
+            self.filter_count.pack(side="bottom", pady=10)
+            self.filter_table.pack(fill="both", expand=True)
+    
+    def show_export(self):
+        self.show_view('export', "Exportar Inventário", self.build_export)
+        # Nome sugerido renovado a cada visita, como antes
+        self.filename.delete(0, 'end')
+        self.filename.insert(0, f"frota_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    
+    def build_export(self, view):
+        export_frame = ctk.CTkFrame(view, corner_radius=10)
+        export_frame.pack(fill="both", expand=True, padx=50, pady=50)
+        
+        # Formato
+        ctk.CTkLabel(export_frame, text="Formato de Exportação:", font=ctk.CTkFont(size=16)).pack(pady=(0, 20))
+        
+        self.export_format = ctk.StringVar(value="csv")
+        formats = [("CSV (Excel)", "csv"), ("Texto (legível)", "txt"), ("JSON (estruturado)", "json"), ("JSON Lines (anexável)", "jsonl")]
+        
+        for text, value in formats:
+            ctk.CTkRadioButton(export_frame, text=text, variable=self.export_format, value=value).pack(pady=5)
+        
+        # Nome do ficheiro
+        file_frame = ctk.CTkFrame(export_frame)
+        file_frame.pack(pady=20)
+        
+        ctk.CTkLabel(file_frame, text="Nome do Ficheiro:", font=ctk.CTkFont(size=14)).pack(side="left", padx=(0, 10))
+        self.filename = ctk.CTkEntry(file_frame, width=200)
+        self.filename.pack(side="left")
+        
+        # Botões
+        button_frame = ctk.CTkFrame(export_frame)
+        button_frame.pack(pady=30)
+        
+        ctk.CTkButton(button_frame, text="Exportar", command=self.export_data, height=40, width=200).pack(pady=10)
+        ctk.CTkButton(button_frame, text="Pré-visualizar", command=self.preview_export, height=40, width=200, fg_color="gray").pack(pady=10)
+    
+    def export_data(self):
+        filename = self.filename.get()
+        format_type = self.export_format.get()
+        
+        if not filename.endswith(f'.{format_type}'):
+            filename += f'.{format_type}'
+        
+        # A exportação lê um snapshot: alterações feitas entretanto não a afetam
+        snapshot = self.fleet.snapshot()
+        
+        def on_success(result):
+            success, message = result
+            if success:
+                messagebox.showinfo("Sucesso", message)
+                self.update_status(f"Exportado para {filename}")
+            else:
+                messagebox.showerror("Erro", message)
+        
+        def run(job):
+            with snapshot:
+                return snapshot.export_inventory(filename, format_type, job)
+        
+        if self.run_job(f"A exportar {filename}", run, on_success) is None:
+            snapshot.close()
+    
+    def preview_export(self):
+        if not len(self.fleet):
+            messagebox.showinfo("Info", "Não há veículos para pré-visualizar!")
+            return
+        
+        preview_window = ctk.CTkToplevel(self)
+        preview_window.title("Pré-visualização de Exportação")
+        preview_window.geometry("800x500")
+        
+        text_widget = ctk.CTkTextbox(preview_window, font=ctk.CTkFont(family="Courier", size=12))
+        text_widget.pack(fill="both", expand=True, padx=10, pady=10)
+        
+        preview_text = "PRÉ-VISUALIZAÇÃO DE EXPORTAÇÃO\n"
+        preview_text += "=" * 50 + "\n\n"
+        
+        for i, vehicle in enumerate(islice(self.fleet.iter_vehicles(), 5), 1):
+            preview_text += f"Veículo {i}:\n"
+            preview_text += f"  Tipo: {vehicle.__class__.__name__}\n"
+            preview_text += f"  Marca: {vehicle.brand}\n"
+            preview_text += f"  Modelo: {vehicle.model}\n"
+            preview_text += f"  Preço: €{vehicle.price:.2f}\n"
+            preview_text += f"  Imposto: €{vehicle.calculate_tax():.2f}\n"
+            preview_text += f"  Ano: {vehicle.year}\n"
+            
+            if isinstance(vehicle, ElectricCar):
+                preview_text += f"  Bateria: {vehicle.battery_capacity}kWh\n"
+                preview_text += f"  Autonomia: {vehicle.autonomy}km\n"
+            elif isinstance(vehicle, Truck):
+                preview_text += f"  Carga: {vehicle.load_capacity}t\n"
+                preview_text += f"  Comprimento: {vehicle.length}m\n"
+            
+            preview_text += "\n"
+        
+        summary = self.fleet.get_summary()
+        if summary['total'] > 5:
+            preview_text += f"... e mais {summary['total'] - 5} veículos\n\n"
+        
+        preview_text += "=" * 50 + "\n"
+        preview_text += f"Total veículos: {summary['total']}\n"
+        preview_text += f"Valor total: €{summary['total_value']:.2f}\n"
+        preview_text += f"Imposto total: €{summary['total_tax']:.2f}\n"
+        preview_text += "=" * 50
+        
+        text_widget.insert("1.0", preview_text)
+        text_widget.configure(state="disabled")
+    
+    def show_diagnostics(self):
+        self.show_view('diagnostics', "Diagnóstico", self.build_diagnostics)
+        self.update_diagnostics()
+    
+    def build_diagnostics(self, view):
+        ctk.CTkLabel(view, text="Latência por operação (histogramas acumulados desde o arranque)", font=ctk.CTkFont(size=14)).pack(pady=(10, 10))
+        
+        columns = ("Operação", "Chamadas", "Média (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)")
+        self.metrics_table = VirtualTable(view, columns, widths={"Operação": 180}, height=10)
+        self.metrics_table.pack(fill="both", expand=True, padx=20, pady=10)
+        self.metrics_rows = []
+        self.metrics_table.set_source(lambda: len(self.metrics_rows), lambda start, stop: self.metrics_rows[start:stop], lambda row: (row[0], (
+            row[0],
+            row[1]['count'],
+            f"{row[1]['mean_ms']:.3f}",
+            f"{row[1]['p50_ms']:.3f}",
+            f"{row[1]['p95_ms']:.3f}",
+            f"{row[1]['p99_ms']:.3f}"
+        )))
+        
+        if operation_log.sample_every:
+            log_text = f"Registo de operações: {os.path.abspath(operation_log.filename)}"
+        else:
+            log_text = f"Registo de operações desativado (main.py --log ou {LOG_ENV}=ficheiro)"
+        ctk.CTkLabel(view, text=log_text, font=ctk.CTkFont(size=12), text_color="gray").pack(pady=5)
+        
+        button_frame = ctk.CTkFrame(view)
+        button_frame.pack(pady=10)
+        ctk.CTkButton(button_frame, text="Atualizar", command=self.update_diagnostics, height=40, width=150).pack(side="left", padx=10)
+        ctk.CTkButton(button_frame, text="Limpar Métricas", command=self.reset_diagnostics, height=40, width=150, fg_color="gray").pack(side="left", padx=10)
+    
+    def update_diagnostics(self):
+        self.metrics_rows = sorted(self.fleet.operation_metrics().items())
+        self.metrics_table.refresh()
+    
+    def reset_diagnostics(self):
+        self.fleet.metrics.reset()
+        self.update_diagnostics()
+    
+    # count=None carrega os 10 veículos de exemplo; com count usa o gerador sintético (seed fixa).
+    # Os dados iniciais não ficam no diário: o primeiro Ctrl+Z não esvazia a frota
+    def load_sample_data(self, count=None, seed=0):
+        self.fleet.clear()
+        
+        if count is not None:
+            self.fleet.add_vehicles(generate_vehicles(count, seed))
+            self.fleet.reset_journal()
+            self.update_status(f"{count} veículos sintéticos carregados (seed {seed})")
+            return
+        
+        sample_vehicles = [
+            Vehicle("Toyota", "Corolla", 25000, 2022),
+            Vehicle("Ford", "Focus", 22000, 2021),
+            ElectricCar("Tesla", "Model 3", 45000, 2023, 75, 500),
+            ElectricCar("Nissan", "Leaf", 32000, 2022, 40, 270),
+            Truck("Mercedes", "Actros", 85000, 2020, 18, 12.5),
+            Truck("Volvo", "FH", 92000, 2021, 20, 13.2),
+            Vehicle("BMW", "3 Series", 42000, 2023),
+            ElectricCar("Hyundai", "Kona Electric", 38000, 2022, 64, 450),
+            Vehicle("Volkswagen", "Golf", 28000, 2021),
+            Truck("MAN", "TGX", 78000, 2019, 16, 11.8)
+        ]
+        
+        for vehicle in sample_vehicles:
+            self.fleet.add_vehicle(vehicle)
+        self.fleet.reset_journal()
+        
+        self.update_status("10 veículos de exemplo carregados")
@@ -1,787 +1,3573 @@
+import argparse
+import atexit
 import datetime
+import copy
 import csv
+import heapq
 import json
-from tkinter import ttk, messagebox
-import customtkinter as ctk
+import math
+import mmap
+import os
+import pathlib
+import queue
+import random
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import unicodedata
+import weakref
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from functools import lru_cache, wraps
+from itertools import accumulate, chain, compress, islice
+from operator import attrgetter, itemgetter
 
-# ==================== CONFIGURAÇÃO ====================
-ctk.set_appearance_mode("dark")
+# A interface gráfica (customtkinter) vive em gui.py e só é importada pelo comando "gui";
+# NumPy e concurrent.futures também só são carregados quando são precisos.
+# O tempo de importação deste módulo é vigiado por "benchmark.py startup" (IMPORT_BUDGET_MS).
+
+# ==================== REGISTO DE OPERAÇÕES ====================
+# Desligado por omissão (nada é escrito na pasta atual): liga-se com "main.py --log" ou com a
+# variável de ambiente FROTA_LOG, cujo valor é o ficheiro onde escrever
+LOG_FILE = 'frota_operacoes.jsonl'
+LOG_ENV = 'FROTA_LOG'
+LOG_BATCH_SIZE = 1000
+HISTOGRAM_SUB_BUCKETS = 16
+
+class LatencyHistogram:
+    # Baldes log-lineares (16 por potência de 2, erro relativo < 4%):
+    # registo O(1) e memória limitada, sem guardar as amostras
+    __slots__ = ('count', 'total', 'buckets')
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.buckets = {}
+    
+    def record(self, value):
+        value = max(value, 1)
+        self.count += 1
+        self.total += value
+        mantissa, exponent = math.frexp(value)
+        key = exponent * HISTOGRAM_SUB_BUCKETS + int((mantissa - 0.5) * 2 * HISTOGRAM_SUB_BUCKETS)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+    
+    def percentile(self, percent):
+        # Devolve o limite superior do balde que contém o percentil pedido
+        target = percent / 100 * self.count
+        running = 0
+        for key in sorted(self.buckets):
+            running += self.buckets[key]
+            if running >= target:
+                exponent, sub = divmod(key, HISTOGRAM_SUB_BUCKETS)
+                return (0.5 + (sub + 1) / (2 * HISTOGRAM_SUB_BUCKETS)) * 2.0 ** exponent
+        return 0
+    
+    def summary(self):
+        # Latências em milissegundos (os valores são registados em nanossegundos)
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count / 1e6 if self.count else 0,
+            'p50_ms': self.percentile(50) / 1e6,
+            'p95_ms': self.percentile(95) / 1e6,
+            'p99_ms': self.percentile(99) / 1e6
+        }
+
+class OperationMetrics:
+    # Um histograma de latência por operação
+    def __init__(self):
+        self.histograms = {}
+    
+    def record(self, operation, elapsed_ns):
+        histogram = self.histograms.get(operation)
+        if histogram is None:
+            histogram = self.histograms[operation] = LatencyHistogram()
+        histogram.record(elapsed_ns)
+    
+    def summary(self):
+        return {operation: histogram.summary() for operation, histogram in self.histograms.items()}
+    
+    def reset(self):
+        self.histograms.clear()
+
+class OperationLog:
+    # Registo estruturado (JSON Lines) escrito por uma thread própria: a operação
+    # só coloca um tuplo na fila; formatação e escrita acontecem fora do caminho crítico.
+    # sample_every por operação: 1 regista todas, N regista 1 em cada N, 0 desativa.
+    def __init__(self, filename=LOG_FILE, sample_every=1):
+        self.filename = filename
+        self.sample_every = sample_every
+        self._sampling = {}
+        self._counters = {}
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def set_sampling(self, operation, every):
+        self._sampling[operation] = every
+    
+    def record(self, operation, elapsed_ns, **fields):
+        every = self._sampling.get(operation, self.sample_every)
+        if not every:
+            return
+        if every > 1:
+            count = self._counters[operation] = self._counters.get(operation, 0) + 1
+            if count % every:
+                return
+        if self._thread is None:
+            self._start()
+        self._queue.put((time.time(), operation, elapsed_ns, fields))
+    
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_loop, name="frota-log", daemon=True)
+                self._thread.start()
+    
+    def _write_loop(self):
+        with open(self.filename, 'a', encoding='utf-8') as file:
+            while True:
+                # Esvazia a fila em lotes: uma escrita por lote, não por operação
+                batch = [self._queue.get()]
+                while len(batch) < LOG_BATCH_SIZE:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                
+                lines = []
+                waiters = []
+                for item in batch:
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                        continue
+                    timestamp, operation, elapsed_ns, fields = item
+                    record = {'ts': round(timestamp, 3), 'op': operation, 'ms': round(elapsed_ns / 1e6, 4)}
+                    record.update(fields)
+                    lines.append(json.dumps(record, ensure_ascii=False))
+                if lines:
+                    file.write("\n".join(lines) + "\n")
+                    file.flush()
+                for waiter in waiters:
+                    waiter.set()
+    
+    def flush(self, timeout=5):
+        # Espera até a thread de escrita ter gravado tudo o que estava na fila
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+operation_log = OperationLog(os.environ.get(LOG_ENV) or LOG_FILE, sample_every=1 if os.environ.get(LOG_ENV) else 0)
+atexit.register(operation_log.flush)
+
+# ==================== CONCORRÊNCIA ====================
+class ReadWriteLock:
+    # Vários leitores em simultâneo ou um único escritor. Um escritor à espera bloqueia
+    # leitores novos, para que um fluxo contínuo de leituras não adie as escritas.
+    # Reentrante na mesma thread: quem escreve pode ler e voltar a escrever e quem lê pode
+    # voltar a ler; passar de leitura a escrita daria impasse e é recusado com RuntimeError.
+    # Isso inclui Vehicle.price = ... em código chamado durante uma leitura (read_locked):
+    # junte os preços novos e aplique-os depois com Fleet.set_prices
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._condition = threading.Condition(self._mutex)
+        self._reads = {}  # thread leitora -> leituras encaixadas
+        self._writer = None
+        self._writes = 0
+        self._waiting_writers = 0
+        self._waiting_readers = 0
+    
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self._mutex:
+            if self._writer == me:
+                # Leitura dentro da própria escrita
+                self._writes += 1
+                return
+            reads = self._reads.get(me, 0)
+            if not reads and (self._writer is not None or self._waiting_writers):
+                self._waiting_readers += 1
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+                self._waiting_readers -= 1
+            self._reads[me] = reads + 1
+    
+    def release_read(self):
+        me = threading.get_ident()
+        with self._mutex:
+            if self._writer == me:
+                self._writes -= 1
+                return
+            reads = self._reads.pop(me) - 1
+            if reads:
+                self._reads[me] = reads
+            elif not self._reads and self._waiting_writers:
+                self._condition.notify_all()
+    
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._mutex:
+            if self._writer == me:
+                self._writes += 1
+                return
+            if me in self._reads:
+                raise RuntimeError("Não é possível escrever na frota durante uma leitura na mesma thread")
+            if self._writer is not None or self._reads:
+                self._waiting_writers += 1
+                while self._writer is not None or self._reads:
+                    self._condition.wait()
+                self._waiting_writers -= 1
+            self._writer = me
+            self._writes = 1
+    
+    def release_write(self):
+        with self._mutex:
+            self._writes -= 1
+            if not self._writes:
+                self._writer = None
+                if self._waiting_writers or self._waiting_readers:
+                    self._condition.notify_all()
 
 # ==================== DECORADOR ====================
+def read_locked(func):
+    # Leitura sob self.lock: vê sempre um estado entre duas escritas completas
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        lock = self.lock
+        lock.acquire_read()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            lock.release_read()
+    return wrapper
+
+def write_locked(func):
+    # Escrita exclusiva sob self.lock (leitores e outros escritores esperam)
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        lock = self.lock
+        lock.acquire_write()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            lock.release_write()
+    return wrapper
+
 def log_operation(func):
-    def wrapper(*args, **kwargs):
-        now = datetime.datetime.now()
-        print(f"[{now.strftime('%d-%m-%Y %H:%M:%S')}] Executando: {func.__name__}")
-        return func(*args, **kwargs)
+    # Mede a latência em nanossegundos para as métricas da frota e envia
+    # um registo (amostrado) para o operation_log
+    name = func.__name__
+    
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter_ns()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            self.metrics.record(name, elapsed)
+            operation_log.record(name, elapsed, fleet=self.__class__.__name__)
     return wrapper
 
+# ==================== MOTOR DE IMPOSTOS ====================
+class TaxRules:
+    # Taxa por tipo = base_rate * multiplicador do tipo, com exceções por (tipo, ano)
+    # e regras adicionais: funções (tipo, ano) -> taxa ou None, testadas por ordem.
+    # Cada alteração avisa as frotas, que recalculam os impostos numa só passagem.
+    def __init__(self, base_rate=0.23, multipliers=None):
+        self.base_rate = base_rate
+        self.multipliers = {'Vehicle': 1.0, 'ElectricCar': 0.5, 'Truck': 1.3, **(multipliers or {})}
+        self.year_rates = {}
+        self.rules = []
+        self.version = 0
+        self._rates = {}
+        self._frozen = None
+        self._fleets = weakref.WeakSet()
+    
+    def rate(self, vehicle_type, year):
+        key = (vehicle_type, year)
+        rate = self._rates.get(key)
+        if rate is None:
+            rate = self._rates[key] = self._resolve(vehicle_type, year)
+        return rate
+    
+    def _resolve(self, vehicle_type, year):
+        for rule in self.rules:
+            rate = rule(vehicle_type, year)
+            if rate is not None:
+                return rate
+        rate = self.year_rates.get((vehicle_type, year))
+        if rate is not None:
+            return rate
+        return self.base_rate * self.multipliers.get(vehicle_type, 1.0)
+    
+    def configure(self, base_rate=None, multipliers=None, year_rates=None):
+        # Várias alterações de uma vez: um único recálculo nas frotas
+        if base_rate is not None:
+            self.base_rate = base_rate
+        if multipliers:
+            self.multipliers.update(multipliers)
+        if year_rates:
+            self.year_rates.update(year_rates)
+        self._changed()
+    
+    def set_rate(self, vehicle_type, rate, year=None):
+        # Sem ano muda a taxa do tipo; com ano cria uma exceção só para esse ano
+        if year is None:
+            self.configure(multipliers={vehicle_type: rate / self.base_rate})
+        else:
+            self.configure(year_rates={(vehicle_type, year): rate})
+    
+    def add_rule(self, rule):
+        # A ShardedFleet envia as regras aos processos das partições: têm de ser funções de
+        # módulo (ou objetos) que o pickle consiga enviar, não lambdas nem funções locais
+        import pickle
+        try:
+            pickle.dumps(rule)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            raise ValueError(f"A regra de imposto tem de poder ser enviada para outro processo (pickle): {e}") from None
+        self.rules.append(rule)
+        self._changed()
+    
+    def remove_rule(self, rule):
+        self.rules.remove(rule)
+        self._changed()
+    
+    def frozen(self):
+        # Cópia independente das regras atuais (usada pelos snapshots), partilhada até mudarem
+        if self._frozen is None or self._frozen.version != self.version:
+            rules = TaxRules(self.base_rate, self.multipliers)
+            rules.year_rates = dict(self.year_rates)
+            rules.rules = list(self.rules)
+            rules.version = self.version
+            self._frozen = rules
+        return self._frozen
+    
+    def subscribe(self, fleet):
+        self._fleets.add(fleet)
+    
+    def _changed(self):
+        self._rates.clear()
+        self.version += 1
+        for fleet in list(self._fleets):
+            fleet._rates_changed()
+
+tax_rules = TaxRules()
+
 # ==================== CLASSES DE VEÍCULOS ====================
+DATE_FORMAT = '%d-%m-%Y %H:%M:%S'
+
+@lru_cache(maxsize=4096)
+def format_timestamp(timestamp):
+    return time.strftime(DATE_FORMAT, time.localtime(timestamp))
+
 class Vehicle:
+    # Registos compactos: sem __dict__ por instância, textos internados e data em epoch
+    __slots__ = ('id', 'brand', 'model', 'year', '_price', '_tax', '_registration_ts', '_store', '_row', '_fleet')
+    
     def __init__(self, brand, model, price, year):
-        self.brand = brand
-        self.model = model
+        # Quando o veículo pertence a uma frota colunar, o preço e o imposto vivem nas colunas
+        self.id = None
+        self._store = None
+        self._row = -1
+        self._fleet = None
+        self._tax = None
+        self.brand = sys.intern(brand)
+        self.model = sys.intern(model)
         self.price = price
         self.year = year
-        self.registration_date = datetime.datetime.now()
+        self._registration_ts = int(time.time())
+    
+    @property
+    def registration_date(self):
+        return datetime.datetime.fromtimestamp(self._registration_ts)
+    
+    @registration_date.setter
+    def registration_date(self, value):
+        self._registration_ts = int(value.timestamp())
+    
+    @property
+    def price(self):
+        if self._store is not None:
+            return self._store.price[self._row]
+        return self._price
+    
+    @price.setter
+    def price(self, value):
+        # Dentro de uma frota a alteração e a atualização dos totais são uma só escrita;
+        # o veículo pode ter mudado de frota enquanto esperava pelo lock. A escrita precisa
+        # do lock da frota: com uma leitura aberta na mesma thread dá RuntimeError
+        # (ver ReadWriteLock); para vários preços use Fleet.set_prices
+        while True:
+            fleet = self._fleet
+            if fleet is None:
+                self._set_price(value)
+                return
+            fleet.lock.acquire_write()
+            try:
+                if self._fleet is fleet:
+                    old_price, old_tax = self.price, self.calculate_tax()
+                    self._set_price(value)
+                    fleet._price_changed(self, old_price, old_tax)
+                    return
+            finally:
+                fleet.lock.release_write()
+    
+    def _set_price(self, value):
+        if self._store is not None:
+            self._store.price[self._row] = value
+            self._store.tax[self._row] = value * tax_rules.rate(self.__class__.__name__, self.year)
+        else:
+            self._price = value
+            self._tax = None
+    
+    def calculate_tax(self):
+        # Taxa do motor de impostos (tax_rules). Dentro de uma Fleet o valor fica em cache
+        # até o preço ou as taxas mudarem; fora de uma frota é calculado a cada chamada
+        if self._store is not None:
+            return self._store.tax[self._row]
+        tax = self._tax
+        if tax is None:
+            tax = self.price * tax_rules.rate(self.__class__.__name__, self.year)
+            if self._row >= 0:
+                self._tax = tax
+        return tax
+    
+    def __str__(self):
+        return f"{self.brand} {self.model} - €{self.price:.2f} (Ano: {self.year})"
+    
+    def _clone(self):
+        # Cópia slot a slot: bastante mais rápida do que copy.copy num objeto com __slots__
+        clone = object.__new__(self.__class__)
+        for name in _slot_names(self.__class__):
+            setattr(clone, name, getattr(self, name))
+        return clone
+    
+    def copy(self):
+        # Cópia desligada de qualquer frota, com o preço atual
+        clone = self._clone()
+        clone._store = None
+        clone._row = -1
+        clone._fleet = None
+        clone._price = self.price
+        clone._tax = None
+        return clone
+    
+    def to_dict(self):
+        return {
+            'type': self.__class__.__name__,
+            'brand': self.brand,
+            'model': self.model,
+            'price': self.price,
+            'year': self.year,
+            'tax': self.calculate_tax(),
+            'registration_date': format_timestamp(self._registration_ts)
+        }
+
+@lru_cache(maxsize=None)
+def _slot_names(cls):
+    return tuple(name for klass in cls.__mro__ for name in getattr(klass, '__slots__', ()))
+
+class ElectricCar(Vehicle):
+    __slots__ = ('battery_capacity', 'autonomy')
+    
+    def __init__(self, brand, model, price, year, battery_capacity, autonomy):
+        super().__init__(brand, model, price, year)
+        self.battery_capacity = battery_capacity
+        self.autonomy = autonomy
+    
+    def __str__(self):
+        return f"{self.brand} {self.model} (Elétrico) - €{self.price:.2f} - Bateria: {self.battery_capacity}kWh - Autonomia: {self.autonomy}km"
+
+class Truck(Vehicle):
+    __slots__ = ('load_capacity', 'length')
+    
+    def __init__(self, brand, model, price, year, load_capacity, length):
+        super().__init__(brand, model, price, year)
+        self.load_capacity = load_capacity
+        self.length = length
+    
+    def __str__(self):
+        return f"{self.brand} {self.model} (Camião) - €{self.price:.2f} - Carga: {self.load_capacity}t - Comprimento: {self.length}m"
+
+# ==================== ARMAZENAMENTO COLUNAR ====================
+VEHICLE_TYPES = ('Vehicle', 'ElectricCar', 'Truck')
+
+def vehicle_type_code(vehicle):
+    if isinstance(vehicle, ElectricCar):
+        return 1
+    if isinstance(vehicle, Truck):
+        return 2
+    return 0
+
+_numpy = None
+
+def load_numpy():
+    # NumPy é opcional e pesado de importar: só é carregado na primeira VehicleColumns
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:  # sem NumPy as colunas são processadas com array
+            _numpy = False
+    return _numpy or None
+
+class VehicleColumns:
+    # Uma linha por veículo; marca e modelo guardados como ids de dicionário
+    def __init__(self):
+        self.np = load_numpy()
+        self.price = array('d')
+        self.tax = array('d')
+        self.year = array('q')
+        self.type_code = array('b')
+        self.battery_capacity = array('d')
+        self.autonomy = array('d')
+        self.load_capacity = array('d')
+        self.length = array('d')
+        self.brand_id = array('q')
+        self.model_id = array('q')
+        self.vehicle_id = array('q')
+        self.brands = []
+        self.models = []
+        self._brand_ids = {}
+        self._model_ids = {}
+    
+    def __len__(self):
+        return len(self.price)
+    
+    def _columns(self):
+        return (self.price, self.tax, self.year, self.type_code, self.battery_capacity, self.autonomy,
+                self.load_capacity, self.length, self.brand_id, self.model_id, self.vehicle_id)
+    
+    @staticmethod
+    def _encode(value, values, ids):
+        code = ids.get(value)
+        if code is None:
+            code = ids[value] = len(values)
+            values.append(value)
+        return code
+    
+    def _view(self, column):
+        # Vista NumPy sem cópia sobre o buffer do array
+        return self.np.frombuffer(column, dtype=column.typecode)
+    
+    def append(self, vehicle):
+        nan = float('nan')
+        code = vehicle_type_code(vehicle)
+        self.price.append(vehicle.price)
+        self.tax.append(vehicle.calculate_tax())
+        self.year.append(vehicle.year)
+        self.type_code.append(code)
+        self.battery_capacity.append(vehicle.battery_capacity if code == 1 else nan)
+        self.autonomy.append(vehicle.autonomy if code == 1 else nan)
+        self.load_capacity.append(vehicle.load_capacity if code == 2 else nan)
+        self.length.append(vehicle.length if code == 2 else nan)
+        self.brand_id.append(self._encode(vehicle.brand, self.brands, self._brand_ids))
+        self.model_id.append(self._encode(vehicle.model, self.models, self._model_ids))
+        self.vehicle_id.append(vehicle.id)
+        return len(self.price) - 1
+    
+    def swap_remove(self, row):
+        # A última linha ocupa o lugar da removida: O(1) por coluna
+        for column in self._columns():
+            column[row] = column[-1]
+            del column[-1]
+    
+    def scale_prices(self, factor):
+        if not self.price:
+            return
+        # O imposto é proporcional ao preço: escala com o mesmo fator
+        if self.np is not None:
+            prices = self._view(self.price)
+            prices *= factor
+            taxes = self._view(self.tax)
+            taxes *= factor
+        else:
+            self.price = array('d', [p * factor for p in self.price])
+            self.tax = array('d', [t * factor for t in self.tax])
+    
+    # ---------- Cenários (só com NumPy) ----------
+    def select(self, vehicle_type=None, brand_key=None, min_year=None, ranges=None):
+        # Máscara booleana das linhas abrangidas por um cenário ou consulta;
+        # ranges: atributo -> (mínimo, máximo), com NaN fora de qualquer intervalo
+        mask = self.np.ones(len(self.price), dtype=bool)
+        if not self.price:
+            return mask
+        if vehicle_type is not None:
+            # Um tipo desconhecido não abrange nenhuma linha (como no caminho por objetos)
+            code = VEHICLE_TYPES.index(vehicle_type) if vehicle_type in VEHICLE_TYPES else -1
+            mask &= self._view(self.type_code) == code
+        if brand_key is not None:
+            codes = [code for code, brand in enumerate(self.brands) if brand.casefold() == brand_key]
+            mask &= self.np.isin(self._view(self.brand_id), codes)
+        if min_year is not None:
+            mask &= self._view(self.year) >= min_year
+        for name, (low, high) in (ranges or {}).items():
+            values = self._view(getattr(self, name))
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        return mask
+    
+    def totals_by_type(self, mask):
+        # (contagem, valor, imposto) por tipo numa passagem vetorizada
+        if not self.price:
+            return {}
+        codes = self._view(self.type_code)[mask]
+        size = len(VEHICLE_TYPES)
+        counts = self.np.bincount(codes, minlength=size)
+        values = self.np.bincount(codes, weights=self._view(self.price)[mask], minlength=size)
+        taxes = self.np.bincount(codes, weights=self._view(self.tax)[mask], minlength=size)
+        return {VEHICLE_TYPES[code]: (int(counts[code]), float(values[code]), float(taxes[code]))
+                for code in range(size) if counts[code]}
+    
+    def scale_selected(self, mask, factor):
+        if self.price:
+            prices = self._view(self.price)
+            prices[mask] = self.np.round(prices[mask] * factor, 2)
+    
+    def selected(self, mask):
+        # (ids, preços) das linhas da máscara em arrays compactos, para o diário
+        return (array('q', self._view(self.vehicle_id)[mask].tobytes()),
+                array('d', self._view(self.price)[mask].tobytes()))
+    
+    def recompute_tax(self, rules, mask=None):
+        # Uma passagem sobre a frota inteira (ou só as linhas da máscara): taxa por
+        # (tipo, ano) resolvida uma vez por par
+        if not self.price:
+            return
+        if self.np is not None:
+            rows = slice(None) if mask is None else mask
+            codes = self._view(self.type_code)[rows]
+            years = self._view(self.year)[rows]
+            if not len(years):
+                return
+            first = int(years.min())
+            table = self.np.array([[rules.rate(vehicle_type, year) for year in range(first, int(years.max()) + 1)]
+                                   for vehicle_type in VEHICLE_TYPES])
+            self._view(self.tax)[rows] = self._view(self.price)[rows] * table[codes, years - first]
+        else:
+            rates = {}
+            taxes = array('d')
+            for price, code, year in zip(self.price, self.type_code, self.year):
+                rate = rates.get((code, year))
+                if rate is None:
+                    rate = rates[(code, year)] = rules.rate(VEHICLE_TYPES[code], year)
+                taxes.append(price * rate)
+            self.tax = taxes
+    
+    def total_value(self):
+        if self.np is not None and self.price:
+            return float(self._view(self.price).sum())
+        return sum(self.price)
+    
+    def total_tax(self):
+        if self.np is not None and self.price:
+            return float(self._view(self.tax).sum())
+        return sum(self.tax)
+    
+    def count_by_type(self):
+        if self.np is not None and self.price:
+            counts = self.np.bincount(self._view(self.type_code), minlength=len(VEHICLE_TYPES)).tolist()
+        else:
+            counts = [self.type_code.count(code) for code in range(len(VEHICLE_TYPES))]
+        return {name: count for name, count in zip(VEHICLE_TYPES, counts) if count}
+
+# ==================== PESQUISA DE TEXTO ====================
+SEARCH_GRAM = 3
+
+def normalize_text(text):
+    # Minúsculas e sem acentos: "Citroën" e "citroen" dão o mesmo texto
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+@lru_cache(maxsize=65536)
+def search_term(brand, model):
+    # Texto pesquisável de um veículo (marca e modelo são internados: há poucos pares distintos)
+    return normalize_text(f"{brand} {model}")
+
+def search_matches(term, words, prefix=False):
+    # prefix=True: cada palavra tem de começar uma palavra do texto; senão basta aparecer nele
+    if prefix:
+        term = ' ' + term
+        return all(' ' + word in term for word in words)
+    return all(word in term for word in words)
+
+class SearchResults:
+    # Os baldes dos textos encontrados, lidos sem cópia: contar custa O(textos) e cada
+    # janela O(textos + janela), qualquer que seja o número de veículos encontrados.
+    # É uma vista sobre a frota atual: não deve ser percorrida enquanto a frota muda.
+    def __init__(self, buckets):
+        self.buckets = buckets
+    
+    def __len__(self):
+        return sum(map(len, self.buckets))
+    
+    def __iter__(self):
+        return chain.from_iterable(self.buckets)
+    
+    def window(self, start, stop):
+        rows = []
+        for bucket in self.buckets:
+            if stop <= 0:
+                break
+            if start < len(bucket):
+                rows.extend(islice(bucket, max(start, 0), stop))
+            start -= len(bucket)
+            stop -= len(bucket)
+        return rows
+
+class TextIndex:
+    # Pesquisa por prefixo e por substring em marca + modelo. Os veículos ficam agrupados
+    # pelo texto normalizado e cada texto entra num índice de trigramas: uma consulta só
+    # verifica os textos que contêm todos os trigramas das suas palavras
+    def __init__(self):
+        self.buckets = {}
+        self.grams = {}
+    
+    @staticmethod
+    def _grams(text):
+        return {text[i:i + SEARCH_GRAM] for i in range(len(text) - SEARCH_GRAM + 1)}
+    
+    def add(self, vehicle):
+        term = search_term(vehicle.brand, vehicle.model)
+        bucket = self.buckets.get(term)
+        if bucket is None:
+            bucket = self.buckets[term] = {}
+            for gram in self._grams(term):
+                self.grams.setdefault(gram, set()).add(term)
+        bucket[vehicle] = None
+    
+    def remove(self, vehicle):
+        term = search_term(vehicle.brand, vehicle.model)
+        bucket = self.buckets[term]
+        del bucket[vehicle]
+        if not bucket:
+            del self.buckets[term]
+            for gram in self._grams(term):
+                terms = self.grams[gram]
+                terms.discard(term)
+                if not terms:
+                    del self.grams[gram]
+    
+    def search(self, text, prefix=False):
+        words = normalize_text(text).split()
+        candidates = None
+        for gram in set().union(*map(self._grams, words)):
+            terms = self.grams.get(gram)
+            if not terms:
+                return SearchResults([])
+            candidates = set(terms) if candidates is None else candidates & terms
+        # Só palavras com menos de SEARCH_GRAM letras: todos os textos são candidatos
+        if candidates is None:
+            candidates = self.buckets
+        matches = sorted(term for term in candidates if search_matches(term, words, prefix))
+        return SearchResults([self.buckets[term] for term in matches])
+
+# ==================== VISTAS ORDENADAS ====================
+# Chaves de ordenação disponíveis (Fleet.sorted_by, cabeçalhos das tabelas)
+SORT_KEYS = {
+    'price': lambda vehicle: vehicle.price,
+    'year': lambda vehicle: vehicle.year,
+    'tax': lambda vehicle: vehicle.calculate_tax()
+}
+SORTED_LOAD = 512
+# Acima de 1/SORTED_REBUILD_FRACTION da frota alterada, as vistas são descartadas e refeitas
+SORTED_REBUILD_FRACTION = 8
+
+class SortedView:
+    # Veículos ordenados por (chave, id) em blocos de até 2·SORTED_LOAD, como uma lista
+    # ordenada de sortedcontainers: inserir e remover custa O(log n + SORTED_LOAD) e ler
+    # k posições a partir de qualquer ponto O(log n + k). O id desempata chaves iguais e
+    # localiza o par exato a remover, por isso a remoção precisa da chave com que entrou.
+    def __init__(self, key, vehicles=()):
+        # vehicles por ordem crescente de id: a ordenação estável só compara as chaves
+        self.key = key
+        vehicles = list(vehicles)
+        keys = array('d', map(key, vehicles))
+        ids = array('q', [vehicle.id for vehicle in vehicles])
+        numpy = load_numpy()
+        if numpy is not None and keys:
+            order = numpy.argsort(numpy.frombuffer(keys, dtype='d'), kind='stable').tolist()
+        else:
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+        keys = array('d', map(keys.__getitem__, order))
+        ids = array('q', map(ids.__getitem__, order))
+        vehicles = list(map(vehicles.__getitem__, order))
+        self._keys = [keys[start:start + SORTED_LOAD] for start in range(0, len(keys), SORTED_LOAD)]
+        self._ids = [ids[start:start + SORTED_LOAD] for start in range(0, len(ids), SORTED_LOAD)]
+        self._vehicles = [vehicles[start:start + SORTED_LOAD] for start in range(0, len(vehicles), SORTED_LOAD)]
+        self._maxes = [(block[-1], block_ids[-1]) for block, block_ids in zip(self._keys, self._ids)]
+        self._offsets = None
+    
+    def __len__(self):
+        offsets = self._positions()
+        return offsets[-1] if offsets else 0
+    
+    def _positions(self):
+        # Posição final de cada bloco, refeita só depois de uma alteração
+        if self._offsets is None:
+            self._offsets = list(accumulate(map(len, self._keys)))
+        return self._offsets
+    
+    def _locate(self, key, vehicle_id):
+        # (bloco, posição) do primeiro par >= (key, vehicle_id); no fim, o último bloco
+        block = min(bisect_left(self._maxes, (key, vehicle_id)), len(self._maxes) - 1)
+        keys = self._keys[block]
+        low = bisect_left(keys, key)
+        return block, bisect_left(self._ids[block], vehicle_id, low, bisect_right(keys, key, low))
+    
+    def add(self, vehicle):
+        key, vehicle_id = self.key(vehicle), vehicle.id
+        self._offsets = None
+        if not self._maxes:
+            self._keys.append(array('d', [key]))
+            self._ids.append(array('q', [vehicle_id]))
+            self._vehicles.append([vehicle])
+            self._maxes.append((key, vehicle_id))
+            return
+        block, index = self._locate(key, vehicle_id)
+        keys, ids, vehicles = self._keys[block], self._ids[block], self._vehicles[block]
+        keys.insert(index, key)
+        ids.insert(index, vehicle_id)
+        vehicles.insert(index, vehicle)
+        self._maxes[block] = (keys[-1], ids[-1])
+        if len(keys) > 2 * SORTED_LOAD:
+            # Bloco cheio: a metade de cima passa a ser um bloco novo
+            self._keys[block + 1:block + 1] = [keys[SORTED_LOAD:]]
+            self._ids[block + 1:block + 1] = [ids[SORTED_LOAD:]]
+            self._vehicles[block + 1:block + 1] = [vehicles[SORTED_LOAD:]]
+            del keys[SORTED_LOAD:], ids[SORTED_LOAD:], vehicles[SORTED_LOAD:]
+            self._maxes[block:block + 1] = [(keys[-1], ids[-1]), self._maxes[block]]
+    
+    def remove(self, vehicle, key=None):
+        # key: a chave com que o veículo entrou, quando o valor atual já é outro
+        key = self.key(vehicle) if key is None else key
+        block, index = self._locate(key, vehicle.id) if self._maxes else (0, 0)
+        if not self._maxes or index >= len(self._ids[block]) or self._ids[block][index] != vehicle.id:
+            raise KeyError(f"Veículo {vehicle.id} não está na vista ordenada")
+        self._offsets = None
+        keys, ids, vehicles = self._keys[block], self._ids[block], self._vehicles[block]
+        del keys[index], ids[index], vehicles[index]
+        if keys:
+            self._maxes[block] = (keys[-1], ids[-1])
+        else:
+            del self._keys[block], self._ids[block], self._vehicles[block], self._maxes[block]
+    
+    def rank(self, key, after=False):
+        # Número de pares com chave < key (ou <= key, com after=True)
+        if key is None:
+            return len(self) if after else 0
+        offsets = self._positions()
+        block = bisect_right(self._maxes, (key, math.inf)) if after else bisect_left(self._maxes, (key, -math.inf))
+        if block == len(self._maxes):
+            return len(self)
+        keys = self._keys[block]
+        index = bisect_right(keys, key) if after else bisect_left(keys, key)
+        return (offsets[block - 1] if block else 0) + index
+    
+    def islice(self, start, stop, reverse=False):
+        # Veículos das posições [start, stop), a partir de um dos extremos; a vista
+        # não pode mudar enquanto o iterador é consumido
+        offsets = self._positions()
+        start, stop = max(start, 0), min(stop, len(self))
+        if start >= stop:
+            return
+        block = bisect_right(offsets, stop - 1 if reverse else start)
+        index = (stop if reverse else start) - (offsets[block - 1] if block else 0)
+        remaining = stop - start
+        while remaining > 0:
+            vehicles = self._vehicles[block]
+            if reverse:
+                chunk = vehicles[max(index - remaining, 0):index]
+                yield from reversed(chunk)
+                block -= 1
+                index = len(self._vehicles[block]) if block >= 0 else 0
+            else:
+                chunk = vehicles[index:index + remaining]
+                yield from chunk
+                block += 1
+                index = 0
+            remaining -= len(chunk)
+
+class SortedRange:
+    # Veículos com low <= chave <= high, por ordem da vista; mesma interface que
+    # SearchResults (len, iteração, window) para as tabelas virtualizadas.
+    # Com lock, window() lê sob o lock de leitura da frota (a iteração não: é preguiçosa)
+    def __init__(self, view, low=None, high=None, reverse=False, output=None, lock=None):
+        self.view = view
+        self.start = view.rank(low)
+        self.stop = max(view.rank(high, after=True), self.start)
+        self.reverse = reverse
+        self.output = output
+        self.lock = lock
+    
+    def __len__(self):
+        return self.stop - self.start
+    
+    def __iter__(self):
+        rows = self.view.islice(self.start, self.stop, self.reverse)
+        return map(self.output, rows) if self.output is not None else rows
+    
+    def window(self, start, stop):
+        # Posições relativas ao início da fatia (do fim da vista, com reverse)
+        if self.lock is not None:
+            self.lock.acquire_read()
+        try:
+            start, stop = max(start, 0), min(stop, len(self))
+            if self.reverse:
+                rows = self.view.islice(self.stop - stop, self.stop - start, True)
+            else:
+                rows = self.view.islice(self.start + start, self.start + stop)
+            return list(map(self.output, rows) if self.output is not None else rows)
+        finally:
+            if self.lock is not None:
+                self.lock.release_read()
+
+# ==================== ÍNDICES SECUNDÁRIOS ====================
+class FleetIndexes:
+    # Cada balde é um dict usado como conjunto ordenado: remoção O(1), ordem de inserção
+    def __init__(self):
+        self.by_brand = {}
+        self.by_type = {}
+        self.by_year = {}
+        self.years = []
+        self.text = TextIndex()
+        # Vistas ordenadas (SortedView) criadas no primeiro pedido e depois mantidas
+        self.sorted = {}
+        self.sort_keys = SORT_KEYS
+        self._building = threading.Lock()
+    
+    def add(self, vehicle):
+        self.by_brand.setdefault(vehicle.brand.casefold(), {})[vehicle] = None
+        self.by_type.setdefault(type(vehicle).__name__, {})[vehicle] = None
+        bucket = self.by_year.get(vehicle.year)
+        if bucket is None:
+            bucket = self.by_year[vehicle.year] = {}
+            insort(self.years, vehicle.year)
+        bucket[vehicle] = None
+        self.text.add(vehicle)
+        for view in self.sorted.values():
+            view.add(vehicle)
+    
+    def remove(self, vehicle):
+        self._discard(self.by_brand, vehicle.brand.casefold(), vehicle)
+        self._discard(self.by_type, type(vehicle).__name__, vehicle)
+        if self._discard(self.by_year, vehicle.year, vehicle):
+            del self.years[bisect_left(self.years, vehicle.year)]
+        self.text.remove(vehicle)
+        for view in self.sorted.values():
+            view.remove(vehicle)
+    
+    def sorted_view(self, name, vehicles):
+        # vehicles (por ordem de id) só é lido quando a vista ainda não existe. Vários leitores
+        # podem pedi-la ao mesmo tempo: só um a constrói e os restantes esperam por ela
+        view = self.sorted.get(name)
+        if view is None:
+            with self._building:
+                view = self.sorted.get(name)
+                if view is None:
+                    view = self.sorted[name] = SortedView(self.sort_keys[name], vehicles)
+        return view
+    
+    def reprice(self, vehicle, old_price, old_tax):
+        # O ano nunca muda; preço e imposto saem com a chave antiga e voltam com a nova
+        for name, old_key in (('price', old_price), ('tax', old_tax)):
+            view = self.sorted.get(name)
+            if view is not None:
+                view.remove(vehicle, old_key)
+                view.add(vehicle)
+    
+    def drop_sorted(self, *names):
+        for name in names:
+            self.sorted.pop(name, None)
+    
+    @staticmethod
+    def _discard(index, key, vehicle):
+        # Devolve True quando o balde fica vazio e é apagado
+        bucket = index[key]
+        del bucket[vehicle]
+        if not bucket:
+            del index[key]
+            return True
+        return False
+    
+    def with_brand(self, brand):
+        return list(self.by_brand.get(brand.casefold(), ()))
+    
+    def with_type(self, vehicle_type):
+        return list(self.by_type.get(vehicle_type, ()))
+    
+    def with_min_year(self, min_year):
+        start = bisect_left(self.years, min_year)
+        return [v for year in self.years[start:] for v in self.by_year[year]]
+
+# ==================== CONSULTAS COMPOSTAS ====================
+# Intervalos aceites por query(): atributo -> tipo que o atributo implica (None = todos)
+QUERY_RANGES = {'year': None, 'price': None, 'battery_capacity': 'ElectricCar', 'autonomy': 'ElectricCar',
+                'load_capacity': 'Truck', 'length': 'Truck'}
+# Custo relativo por linha: teste em Python = 1, cada critério extra = QUERY_TEST_COST,
+# passagem NumPy sobre as colunas = QUERY_VECTOR_COST
+QUERY_TEST_COST = 0.5
+QUERY_VECTOR_COST = 0.02
+
+def _in_range(value, bounds):
+    low, high = bounds
+    return value is not None and (low is None or value >= low) and (high is None or value <= high)
+
+def _range_label(name, bounds):
+    low, high = bounds
+    return f"{name} {'-∞' if low is None else low}..{'∞' if high is None else high}"
+
+def query_criteria(brand=None, vehicle_type=None, search=None, **ranges):
+    # Normaliza os critérios: intervalos (mínimo, máximo) com None = sem limite; os atributos
+    # de ElectricCar/Truck implicam o tipo. Devolve (marca, tipo, texto, intervalos, vazio)
+    unknown = set(ranges) - set(QUERY_RANGES)
+    if unknown:
+        raise TypeError(f"Critérios desconhecidos: {', '.join(sorted(unknown))}")
+    ranges = {name: tuple(bounds) for name, bounds in ranges.items() if bounds is not None and tuple(bounds) != (None, None)}
+    types = {QUERY_RANGES[name] for name in ranges if QUERY_RANGES[name]}
+    if vehicle_type:
+        types.add(vehicle_type)
+    empty = len(types) > 1
+    return brand or None, (types.pop() if len(types) == 1 else None), search or None, ranges, empty
+
+class FleetQuery:
+    # Conjunção de critérios sobre os índices de uma frota (ver Fleet.query). O plano começa
+    # pelo índice mais seletivo (os tamanhos dos índices são exatos) e testa os restantes
+    # critérios em cada candidato: pertença aos outros índices (interseção) e intervalos.
+    # Se os candidatos forem muitos percorre a frota inteira, de preferência com NumPy.
+    # Os resultados são produzidos de forma preguiçosa; a ordem depende do plano.
+    def __init__(self, indexes, vehicles, columns=None, price_of=None, output=None,
+                 brand=None, vehicle_type=None, search=None, prefix=False, **ranges):
+        self.brand, self.vehicle_type, self.search, self.ranges, empty = query_criteria(brand, vehicle_type, search, **ranges)
+        self.prefix = prefix
+        self.vehicles = vehicles
+        self.columns = columns if not self.search else None
+        self.price_of = price_of
+        self.output = output
+        self.steps = []
+        self._plan(indexes, empty)
+    
+    def _paths(self, indexes):
+        # (candidatos, critério, descrição, baldes) de cada critério com índice, do mais seletivo
+        # ao menos; a vista ordenada de preço, quando existe, entra com a fatia do intervalo
+        paths = []
+        if self.brand:
+            paths.append(('brand', f"índice de marca '{self.brand}'", [indexes.by_brand.get(self.brand.casefold(), {})]))
+        if self.vehicle_type:
+            paths.append(('type', f"índice de tipo {self.vehicle_type}", [indexes.by_type.get(self.vehicle_type, {})]))
+        if 'year' in self.ranges:
+            low, high = self.ranges['year']
+            start = 0 if low is None else bisect_left(indexes.years, low)
+            stop = len(indexes.years) if high is None else bisect_right(indexes.years, high)
+            paths.append(('year', f"índice de anos ({_range_label('year', (low, high))})",
+                          [indexes.by_year[year] for year in indexes.years[start:stop]]))
+        if self.search:
+            paths.append(('search', f"índice de texto '{self.search}'", indexes.text.search(self.search, self.prefix).buckets))
+        if 'price' in self.ranges and 'price' in indexes.sorted:
+            paths.append(('price', f"vista ordenada ({_range_label('price', self.ranges['price'])})",
+                          [SortedRange(indexes.sorted['price'], *self.ranges['price'])]))
+        return sorted(((sum(map(len, buckets)), name, label, buckets) for name, label, buckets in paths), key=lambda path: path[0])
+    
+    def _plan(self, indexes, empty):
+        total = len(self.vehicles)
+        paths = [] if empty else self._paths(indexes)
+        criteria = len(paths) + sum(name != 'year' for name in self.ranges)
+        if empty or (paths and not paths[0][0]):
+            self.strategy = 'empty'
+            self.cost = 0
+            self.steps.append("critérios incompatíveis: nenhum resultado" if empty else f"{paths[0][2]}: 0 candidatos")
+            return
+        
+        # Testes residuais: pertença a um balde (interseção com outro índice) ou comparação
+        tests = []
+        for size, name, label, buckets in paths[1:]:
+            if len(buckets) == 1 and isinstance(buckets[0], dict):
+                tests.append((buckets[0].__contains__, f"interseção com {label} ({size})"))
+            else:
+                tests.append((self._index_test(name), f"{label} como filtro ({size})"))
+        indexed = {name for size, name, label, buckets in paths}
+        for name, bounds in self.ranges.items():
+            if name not in indexed:
+                tests.append((self._index_test(name), f"filtro {_range_label(name, bounds)}"))
+        
+        index_cost = paths[0][0] * (1 + QUERY_TEST_COST * len(tests)) if paths else float('inf')
+        scan_cost = total * (1 + QUERY_TEST_COST * max(criteria - 1, 0))
+        vector_cost = total * QUERY_VECTOR_COST if self.columns is not None and criteria else float('inf')
+        self.cost = min(index_cost, scan_cost, vector_cost)
+        if self.cost == vector_cost:
+            self.strategy = 'vector'
+            self.steps.append(f"passagem vetorizada (NumPy) sobre {total} linhas: custo {vector_cost:.0f}")
+            return
+        if self.cost == index_cost:
+            self.strategy = 'index'
+            size, name, label, self.buckets = paths[0]
+            self.steps.append(f"{label}: {size} candidatos de {total} (custo {index_cost:.0f}, percorrer tudo: {scan_cost:.0f})")
+        else:
+            self.strategy = 'scan'
+            # Sem índice útil: todos os critérios passam a testes
+            tests = [(self._index_test(name), f"{label} como filtro ({size})") for size, name, label, buckets in paths[:1]] + tests
+            self.steps.append(f"percorrer as {total} linhas (custo {scan_cost:.0f})")
+        self.tests = [test for test, label in tests]
+        self.steps.extend(label for test, label in tests)
+    
+    def _index_test(self, name):
+        # Teste de um critério veículo a veículo (também os que têm índice)
+        if name == 'brand':
+            key = self.brand.casefold()
+            return lambda vehicle: vehicle.brand.casefold() == key
+        if name == 'type':
+            return lambda vehicle: vehicle.__class__.__name__ == self.vehicle_type
+        if name == 'price' and self.price_of is not None:
+            return lambda vehicle: _in_range(self.price_of(vehicle), self.ranges['price'])
+        if name in self.ranges:
+            bounds = self.ranges[name]
+            return lambda vehicle: _in_range(getattr(vehicle, name, None), bounds)
+        words = normalize_text(self.search).split()
+        return lambda vehicle: search_matches(search_term(vehicle.brand, vehicle.model), words, self.prefix)
+    
+    def explain(self):
+        return "\n".join(f"{number}. {step}" for number, step in enumerate(self.steps, 1))
+    
+    def _rows(self):
+        if self.strategy == 'vector':
+            columns = self.columns
+            mask = columns.select(self.vehicle_type, self.brand.casefold() if self.brand else None, ranges=self.ranges)
+            return map(self.vehicles.__getitem__, columns.np.flatnonzero(mask).tolist())
+        candidates = chain.from_iterable(self.buckets) if self.strategy == 'index' else iter(self.vehicles)
+        tests = self.tests
+        if not tests:
+            return candidates
+        return (vehicle for vehicle in candidates if all(test(vehicle) for test in tests))
+    
+    def __iter__(self):
+        if self.strategy == 'empty':
+            return iter(())
+        rows = self._rows()
+        return map(self.output, rows) if self.output is not None else rows
+    
+    def fetch(self, offset=0, limit=None):
+        return islice(self, offset, None if limit is None else offset + limit)
+    
+    def count(self):
+        if self.strategy == 'vector':
+            return int(self.columns.select(self.vehicle_type, self.brand.casefold() if self.brand else None, ranges=self.ranges).sum())
+        return sum(1 for _ in self._rows()) if self.strategy != 'empty' else 0
+
+# ==================== EXPORTAÇÃO EM FLUXO ====================
+EXPORT_FORMATS = ('csv', 'txt', 'json', 'jsonl')
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_BUFFER_SIZE = 1 << 16
+CSV_FIELDS = ['type', 'brand', 'model', 'price', 'tax', 'year',
+              'battery_capacity', 'autonomy', 'load_capacity',
+              'length', 'registration_date']
+
+def vehicle_row(vehicle):
+    data = vehicle.to_dict()
+    # Adicionar campos específicos
+    if isinstance(vehicle, ElectricCar):
+        data['battery_capacity'] = vehicle.battery_capacity
+        data['autonomy'] = vehicle.autonomy
+    elif isinstance(vehicle, Truck):
+        data['load_capacity'] = vehicle.load_capacity
+        data['length'] = vehicle.length
+    return data
+
+def _iter_rows(rows, totals):
+    # Os totais do resumo acumulam-se na mesma passagem que escreve as linhas
+    for row in rows:
+        totals['total_vehicles'] += 1
+        totals['total_value'] += row['price']
+        totals['total_tax'] += row['tax']
+        yield row
+
+def _chunks(rows, size=EXPORT_CHUNK_SIZE):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+def write_rows(file, rows, format_type='csv'):
+    # Escreve linhas de vehicle_row (p. ex. já preparadas noutros processos) em memória
+    # constante para um objeto com write() (ficheiro ou fluxo) e devolve os totais
+    writers = {'txt': _write_txt, 'csv': _write_csv, 'json': _write_json, 'jsonl': _write_jsonl}
+    if format_type not in writers:
+        raise ValueError(f"Formato não suportado: {format_type}")
+    
+    totals = {'total_vehicles': 0, 'total_value': 0, 'total_tax': 0}
+    writers[format_type](file, _iter_rows(rows, totals), totals)
+    return totals
+
+def write_vehicles(file, vehicles, format_type='csv'):
+    return write_rows(file, map(vehicle_row, vehicles), format_type)
+
+def export_rows(rows, filename, format_type='csv'):
+    if format_type not in EXPORT_FORMATS:
+        raise ValueError(f"Formato não suportado: {format_type}")
+    
+    newline = '' if format_type == 'csv' else None
+    try:
+        with open(filename, 'w', newline=newline, encoding='utf-8', buffering=EXPORT_BUFFER_SIZE) as file:
+            totals = write_rows(file, rows, format_type)
+    except BaseException:
+        # Não deixar ficheiros a meio (erro ou tarefa cancelada)
+        if os.path.exists(filename):
+            os.remove(filename)
+        raise
+    return totals
+
+def export_vehicles(vehicles, filename, format_type='csv'):
+    # Escreve qualquer iterável de veículos num ficheiro e devolve os totais
+    return export_rows(map(vehicle_row, vehicles), filename, format_type)
+
+def _write_txt(file, rows, totals):
+    file.write("=" * 50 + "\n")
+    file.write("INVENTÁRIO DA FROTA\n")
+    file.write(f"Data de exportação: {datetime.datetime.now().strftime('%d-%m-%Y %H:%M:%S')}\n")
+    file.write("=" * 50 + "\n\n")
+    
+    number = 0
+    for chunk in _chunks(rows):
+        lines = []
+        for row in chunk:
+            number += 1
+            lines.append(f"VEÍCULO {number}:\n")
+            lines.append(f"  Tipo: {row['type']}\n")
+            lines.append(f"  Marca: {row['brand']}\n")
+            lines.append(f"  Modelo: {row['model']}\n")
+            lines.append(f"  Preço: €{row['price']:.2f}\n")
+            lines.append(f"  Imposto: €{row['tax']:.2f}\n")
+            lines.append(f"  Ano: {row['year']}\n")
+            
+            if row['type'] == 'ElectricCar':
+                lines.append(f"  Capacidade da bateria: {row['battery_capacity']}kWh\n")
+                lines.append(f"  Autonomia: {row['autonomy']}km\n")
+            elif row['type'] == 'Truck':
+                lines.append(f"  Capacidade de carga: {row['load_capacity']}t\n")
+                lines.append(f"  Comprimento: {row['length']}m\n")
+            
+            lines.append("\n" + "-" * 40 + "\n\n")
+        file.write("".join(lines))
+    
+    # Resumo
+    file.write("=" * 50 + "\n")
+    file.write("RESUMO DA FROTA\n")
+    file.write(f"Total de veículos: {totals['total_vehicles']}\n")
+    file.write(f"Valor total da frota: €{totals['total_value']:.2f}\n")
+    file.write(f"Imposto total: €{totals['total_tax']:.2f}\n")
+    file.write("=" * 50 + "\n")
+
+def _write_csv(file, rows, totals):
+    writer = csv.DictWriter(file, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for chunk in _chunks(rows):
+        writer.writerows(chunk)
+
+def _write_json(file, rows, totals):
+    # Mesmo documento que json.dump(indent=4), mas com os veículos escritos à medida
+    # que são gerados; os totais ficam no fim porque só são conhecidos no final
+    file.write("{\n")
+    file.write(f'    "export_date": {json.dumps(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))},\n')
+    file.write('    "vehicles": [')
+    separator = "\n"
+    for chunk in _chunks(rows):
+        parts = []
+        for row in chunk:
+            item = json.dumps(row, indent=4, ensure_ascii=False).replace("\n", "\n        ")
+            parts.append(separator + "        " + item)
+            separator = ",\n"
+        file.write("".join(parts))
+    file.write("\n    ]" if totals['total_vehicles'] else "]")
+    for key in ('total_vehicles', 'total_value', 'total_tax'):
+        file.write(f',\n    "{key}": {json.dumps(totals[key])}')
+    file.write("\n}\n")
+
+def _write_jsonl(file, rows, totals):
+    # Um objeto por linha: pode ser anexado e lido linha a linha
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    for chunk in _chunks(rows):
+        file.write("".join(dumps(row) + "\n" for row in chunk))
+
+# ==================== IMPORTAÇÃO EM FLUXO ====================
+IMPORT_BATCH_SIZE = 10000
+IMPORT_READ_SIZE = 1 << 16
+IMPORT_MAX_ERRORS = 100
+# Lotes maiores do que 1/8 da frota reconstroem índices e totais; os menores entram um a um
+IMPORT_REBUILD_FRACTION = 8
+VEHICLE_CLASSES = {'Vehicle': Vehicle, 'ElectricCar': ElectricCar, 'Truck': Truck}
+_NON_SEPARATOR = re.compile(r'[^\s,]')
+_NEXT_RECORD = re.compile(r'[{\]]')
+
+@lru_cache(maxsize=4096)
+def _parse_timestamp(text):
+    # As exportações repetem muito o mesmo instante: a cache evita o strptime por linha
+    return int(time.mktime(time.strptime(text, DATE_FORMAT)))
+
+def vehicle_from_row(row):
+    vehicle_type = row.get('type') or 'Vehicle'
+    if vehicle_type not in VEHICLE_CLASSES:
+        raise ValueError(f"Tipo desconhecido: {vehicle_type}")
+    
+    args = [row['brand'], row['model'], float(row['price']), int(row['year'])]
+    if vehicle_type == 'ElectricCar':
+        args += [float(row['battery_capacity']), float(row['autonomy'])]
+    elif vehicle_type == 'Truck':
+        args += [float(row['load_capacity']), float(row['length'])]
+    vehicle = VEHICLE_CLASSES[vehicle_type](*args)
+    
+    if row.get('registration_date'):
+        vehicle._registration_ts = _parse_timestamp(row['registration_date'])
+    return vehicle
+
+def _iter_csv_records(file):
+    return csv.DictReader(file)
+
+# Os leitores devolvem o erro (em vez do registo) quando um registo não se lê: a linha é
+# rejeitada no relatório da importação e a leitura continua no registo seguinte
+def _iter_jsonl_records(file):
+    decode = json.JSONDecoder().decode
+    for line in file:
+        if line.strip():
+            try:
+                yield decode(line)
+            except json.JSONDecodeError as e:
+                yield e
+
+def _iter_json_records(file):
+    # Lê a lista "vehicles" objeto a objeto sem carregar o documento inteiro
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while True:
+        start = buffer.find('"vehicles"')
+        if start >= 0 and buffer.find('[', start) >= 0:
+            pos = buffer.find('[', start) + 1
+            break
+        chunk = file.read(IMPORT_READ_SIZE)
+        if not chunk:
+            raise ValueError("Lista 'vehicles' não encontrada no ficheiro JSON")
+        buffer += chunk
+    
+    while True:
+        match = _NON_SEPARATOR.search(buffer, pos)
+        if match is None:
+            chunk = file.read(IMPORT_READ_SIZE)
+            if not chunk:
+                raise ValueError("Fim inesperado do ficheiro JSON")
+            buffer, pos = chunk, 0
+            continue
+        pos = match.start()
+        if buffer[pos] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            # Objeto cortado no fim do bloco lido: juntar o bloco seguinte. Com um bloco
+            # inteiro à frente (ou no fim do ficheiro) o objeto está mal formado: segue-se
+            # para o próximo objeto (ou para o fim da lista)
+            chunk = file.read(IMPORT_READ_SIZE) if len(buffer) - pos < IMPORT_READ_SIZE else ''
+            if chunk:
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield e
+            match = _NEXT_RECORD.search(buffer, pos + 1)
+            buffer, pos = (buffer, match.start()) if match else ('', 0)
+            continue
+        yield record
+        pos = end
+
+def import_records(filename, format_type):
+    readers = {'csv': _iter_csv_records, 'json': _iter_json_records, 'jsonl': _iter_jsonl_records}
+    if format_type not in readers:
+        raise ValueError(f"Formato não suportado: {format_type}")
+    newline = '' if format_type == 'csv' else None
+    with open(filename, 'r', newline=newline, encoding='utf-8', buffering=IMPORT_READ_SIZE) as file:
+        yield from readers[format_type](file)
+
+# ==================== GERADOR SINTÉTICO ====================
+# Pesos por omissão; todos podem ser substituídos nos argumentos de generate_vehicles
+SYNTHETIC_TYPE_MIX = {'Vehicle': 0.5, 'ElectricCar': 0.3, 'Truck': 0.2}
+SYNTHETIC_BRANDS = {
+    'Vehicle': {
+        'Toyota': ('Corolla', 'Yaris', 'C-HR'), 'Volkswagen': ('Golf', 'Polo', 'Passat'),
+        'Ford': ('Focus', 'Fiesta', 'Kuga'), 'BMW': ('3 Series', '5 Series', 'X1'),
+        'Renault': ('Clio', 'Megane', 'Captur'), 'Peugeot': ('208', '308', '3008')
+    },
+    'ElectricCar': {
+        'Tesla': ('Model 3', 'Model Y', 'Model S'), 'Nissan': ('Leaf', 'Ariya'),
+        'Hyundai': ('Kona Electric', 'Ioniq 5'), 'Renault': ('Zoe', 'Megane E-Tech'),
+        'BMW': ('i4', 'iX3')
+    },
+    'Truck': {
+        'Mercedes': ('Actros', 'Arocs'), 'Volvo': ('FH', 'FM'), 'MAN': ('TGX', 'TGS'),
+        'Scania': ('R 450', 'S 500'), 'DAF': ('XF', 'CF')
+    }
+}
+SYNTHETIC_BRAND_WEIGHTS = {
+    'Vehicle': {'Toyota': 25, 'Volkswagen': 20, 'Ford': 15, 'BMW': 10, 'Renault': 15, 'Peugeot': 15},
+    'ElectricCar': {'Tesla': 35, 'Nissan': 15, 'Hyundai': 20, 'Renault': 15, 'BMW': 15},
+    'Truck': {'Mercedes': 30, 'Volvo': 25, 'MAN': 20, 'Scania': 15, 'DAF': 10}
+}
+SYNTHETIC_PRICES = {'Vehicle': (15000, 60000), 'ElectricCar': (25000, 90000), 'Truck': (60000, 160000)}
+SYNTHETIC_YEARS = (2012, 2024)
+SYNTHETIC_EPOCH = 1704067200  # 01-01-2024 00:00:00 UTC: datas de registo independentes do relógio
+
+def _cumulative(weights):
+    # (nomes, pesos acumulados normalizados) para sortear com bisect
+    names = list(weights)
+    total = sum(weights.values())
+    running = 0
+    cumulative = []
+    for name in names:
+        running += weights[name]
+        cumulative.append(running / total)
+    return names, cumulative
+
+def generate_vehicles(count, seed=0, type_mix=None, brand_weights=None, price_ranges=None, year_range=SYNTHETIC_YEARS):
+    # Gerador preguiçoso: nada é guardado, por isso serve para milhões de registos.
+    # A mesma seed (e os mesmos parâmetros) produz sempre os mesmos veículos.
+    rng = random.Random(seed)
+    types, type_cumulative = _cumulative(type_mix or SYNTHETIC_TYPE_MIX)
+    for vehicle_type in types:
+        if vehicle_type not in VEHICLE_CLASSES:
+            raise ValueError(f"Tipo desconhecido: {vehicle_type}")
+    price_ranges = {**SYNTHETIC_PRICES, **(price_ranges or {})}
+    brand_weights = brand_weights or SYNTHETIC_BRAND_WEIGHTS
+    brands = {}
+    for vehicle_type in types:
+        weights = brand_weights.get(vehicle_type) or dict.fromkeys(SYNTHETIC_BRANDS[vehicle_type], 1)
+        brands[vehicle_type] = _cumulative(weights)
+    first_year, last_year = year_range
+    
+    random_value = rng.random
+    for i in range(count):
+        vehicle_type = types[min(bisect_left(type_cumulative, random_value()), len(types) - 1)]
+        names, cumulative = brands[vehicle_type]
+        brand = names[min(bisect_left(cumulative, random_value()), len(names) - 1)]
+        models = SYNTHETIC_BRANDS[vehicle_type].get(brand, (brand,))
+        model = models[int(random_value() * len(models))]
+        low, high = price_ranges[vehicle_type]
+        price = round((low + random_value() * (high - low)) / 50) * 50.0
+        year = first_year + int(random_value() * (last_year - first_year + 1))
+        
+        if vehicle_type == 'ElectricCar':
+            battery = round(40 + random_value() * 60, 1)
+            vehicle = ElectricCar(brand, model, price, year, battery, round(battery * (5.5 + random_value() * 1.5)))
+        elif vehicle_type == 'Truck':
+            vehicle = Truck(brand, model, price, year, round(8 + random_value() * 18, 1), round(7 + random_value() * 9.5, 1))
+        else:
+            vehicle = Vehicle(brand, model, price, year)
+        # Um registo por segundo a partir de SYNTHETIC_EPOCH, pela ordem de geração
+        vehicle._registration_ts = SYNTHETIC_EPOCH + i
+        yield vehicle
+
+def export_synthetic(filename, count, format_type='csv', seed=0, **options):
+    # Escreve diretamente no ficheiro, sem construir a frota em memória
+    return export_vehicles(generate_vehicles(count, seed, **options), filename, format_type)
+
+# ==================== CENÁRIOS DE PREÇO ====================
+class PricingScenario:
+    # Desconto (percentagem positiva) ou agravamento (negativa), opcionalmente restrito
+    # por tipo, marca e ano mínimo. É só uma sobreposição: a frota não é copiada nem
+    # alterada até commit(), e vários cenários podem ser comparados sobre a mesma frota.
+    def __init__(self, fleet, percentage, vehicle_type=None, brand=None, min_year=None, name=None):
+        self.fleet = fleet
+        self.percentage = percentage
+        self.factor = 1 - percentage/100
+        self.vehicle_type = vehicle_type
+        self.brand = brand
+        self.brand_key = brand.casefold() if brand else None
+        self.min_year = min_year
+        self.name = name or f"{-percentage:+g}%"
+        self.version = getattr(fleet, 'version', None)
+    
+    def matches(self, vehicle):
+        return ((self.vehicle_type is None or vehicle.__class__.__name__ == self.vehicle_type)
+                and (self.brand_key is None or vehicle.brand.casefold() == self.brand_key)
+                and (self.min_year is None or vehicle.year >= self.min_year))
+    
+    def new_price(self, vehicle):
+        return vehicle.price * self.factor if self.matches(vehicle) else vehicle.price
+    
+    def totals(self, job=None):
+        # Antes/depois dos veículos abrangidos, por tipo e no total (sem o arredondamento do commit)
+        summary = {'name': self.name, 'count': 0, 'old_value': 0, 'new_value': 0, 'old_tax': 0, 'new_tax': 0, 'by_type': {}}
+        for vehicle_type, (count, value, tax) in self.fleet._scenario_totals(self, job).items():
+            row = {'count': count, 'old_value': value, 'new_value': value * self.factor,
+                   'old_tax': tax, 'new_tax': tax * self.factor}
+            summary['by_type'][vehicle_type] = row
+            for key, amount in row.items():
+                summary[key] += amount
+        summary['delta_value'] = summary['new_value'] - summary['old_value']
+        summary['delta_tax'] = summary['new_tax'] - summary['old_tax']
+        return summary
+    
+    def commit(self):
+        # Devolve o número de veículos alterados
+        if self.version is not None and self.version != self.fleet.version:
+            raise ValueError("A frota foi alterada depois de o cenário ser criado")
+        return self.fleet._commit_scenario(self)
+
+def compare_scenarios(scenarios, job=None):
+    # Um resumo por cenário, todos sobre o mesmo estado da frota
+    return [scenario.totals(job) for scenario in scenarios]
+
+# ==================== EVENTOS DA FROTA ====================
+FLEET_EVENTS = ('added', 'removed', 'repriced', 'reset')
+
+class ChangeNotifier:
+    # Os subscritores recebem (evento, veículos); veículos é None quando o
+    # evento abrange a frota inteira (desconto global, limpeza)
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+    
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+    
+    def _emit(self, event, vehicles=None):
+        for callback in list(self._listeners):
+            callback(event, vehicles)
+
+# ==================== GESTÃO DA FROTA ====================
+class Fleet(ChangeNotifier):
+    # columnar=True guarda os campos numéricos em colunas contíguas (VehicleColumns)
+    # debug=True confirma os totais acumulados contra um recálculo completo
+    # journal=True regista as alterações num FleetJournal (snapshots baratos e undo)
+    def __init__(self, columnar=False, debug=False, journal=True):
+        # vehicles é o vetor de posições (a ordem muda nas remoções);
+        # _by_id mapeia id estável -> veículo e mantém a ordem de inserção
+        self.vehicles = []
+        self._by_id = {}
+        self._next_id = 1
+        self.columns = VehicleColumns() if columnar else None
+        self.indexes = FleetIndexes()
+        self.debug = debug
+        # version incrementa a cada alteração; o snapshot é reutilizado enquanto não mudar
+        self.version = 0
+        self._snapshot = None
+        self.journal = FleetJournal() if journal else None
+        # Muitos leitores ou um escritor; leituras longas (exportações, tarefas) usam snapshot()
+        self.lock = ReadWriteLock()
+        self._listeners = []
+        self.metrics = OperationMetrics()
+        self._reset_totals()
+        tax_rules.subscribe(self)
+    
+    def __len__(self):
+        return len(self.vehicles)
+    
+    @log_operation
+    @write_locked
+    def add_vehicle(self, vehicle):
+        self._attach(vehicle)
+        self.indexes.add(vehicle)
+        self._account(vehicle, 1)
+        self._record('add', (vehicle.id, [vehicle], array('d', [vehicle.price])))
+        self._emit('added', [vehicle])
+        return True
+    
+    # Remoção por posição em self.vehicles (mantida por compatibilidade)
+    @log_operation
+    @write_locked
+    def remove_vehicle(self, index):
+        if 0 <= index < len(self.vehicles):
+            vehicle = self.vehicles[index]
+            self._remove(vehicle)
+            self._record('remove', array('q', [vehicle.id]))
+            self._emit('removed', [vehicle])
+            return vehicle
+        return None
+    
+    @log_operation
+    @write_locked
+    def remove_vehicles(self, vehicle_ids):
+        removed = []
+        for vehicle_id in vehicle_ids:
+            vehicle = self._by_id.get(vehicle_id)
+            if vehicle is not None:
+                self._remove(vehicle)
+                removed.append(vehicle)
+        if removed:
+            self._record('remove', array('q', [vehicle.id for vehicle in removed]), len(removed))
+            self._emit('removed', removed)
+        return removed
+    
+    def get_vehicle(self, vehicle_id):
+        return self._by_id.get(vehicle_id)
+    
+    def iter_vehicles(self):
+        # Percorre a frota por ordem de inserção. É uma vista viva: com escritas noutras
+        # threads, percorra snapshot().iter_vehicles()
+        return iter(self._by_id.values())
+    
+    @read_locked
+    def window(self, start, stop):
+        # Fatia por posição, usada pelas tabelas virtualizadas
+        return self.vehicles[start:stop]
+    
+    @read_locked
+    def recent(self, count=5):
+        # Últimos veículos adicionados, do mais antigo para o mais recente
+        return list(islice(reversed(self._by_id.values()), count))[::-1]
+    
+    @write_locked
+    def clear(self):
+        for vehicle in self.vehicles:
+            self._detach(vehicle)
+        self.vehicles.clear()
+        self._by_id.clear()
+        self.indexes = FleetIndexes()
+        if self.columns is not None:
+            self.columns = VehicleColumns()
+        self._reset_totals()
+        self.version += 1
+        self._record('reset', None, 0)
+        self._emit('reset')
+    
+    def _attach(self, vehicle, vehicle_id=None):
+        # vehicle_id só é dado ao repor um estado do diário (o id original é mantido)
+        if vehicle._fleet is not None:
+            raise ValueError("O veículo já pertence a uma frota")
+        self.version += 1
+        if vehicle_id is None:
+            vehicle_id = self._next_id
+            self._next_id += 1
+        vehicle.id = vehicle_id
+        self._by_id[vehicle.id] = vehicle
+        vehicle._row = len(self.vehicles)
+        self.vehicles.append(vehicle)
+        if self.columns is not None:
+            self.columns.append(vehicle)
+            vehicle._store = self.columns
+        vehicle._fleet = self
+    
+    def _remove(self, vehicle):
+        # Troca com o último e encurta: O(1), só o veículo movido muda de posição
+        self.version += 1
+        slot = vehicle._row
+        del self._by_id[vehicle.id]
+        self.indexes.remove(vehicle)
+        last = self.vehicles.pop()
+        if last is not vehicle:
+            self.vehicles[slot] = last
+        self._account(vehicle, -1)
+        self._detach(vehicle)
+        if self.columns is not None:
+            self.columns.swap_remove(slot)
+        if last is not vehicle:
+            last._row = slot
+    
+    @staticmethod
+    def _detach(vehicle):
+        # O veículo volta a guardar o próprio preço ao sair da frota
+        vehicle._fleet = None
+        if vehicle._store is not None:
+            price = vehicle.price
+            vehicle._store = None
+            vehicle.price = price
+        vehicle._row = -1
+        vehicle._tax = None
+    
+    # ---------- Totais acumulados ----------
+    def _reset_totals(self):
+        self._total_value = 0
+        self._total_tax = 0
+        self._count_by_type = {}
+        self._value_by_type = {}
+    
+    def _account(self, vehicle, sign):
+        if not self.vehicles:
+            # Frota vazia: recomeçar do zero elimina o erro de arredondamento acumulado
+            self._reset_totals()
+            return
+        vehicle_type = vehicle.__class__.__name__
+        price = vehicle.price
+        self._total_value += sign * price
+        self._total_tax += sign * vehicle.calculate_tax()
+        count = self._count_by_type.get(vehicle_type, 0) + sign
+        if count:
+            self._count_by_type[vehicle_type] = count
+            self._value_by_type[vehicle_type] = self._value_by_type.get(vehicle_type, 0) + sign * price
+        else:
+            del self._count_by_type[vehicle_type]
+            del self._value_by_type[vehicle_type]
+    
+    def _price_changed(self, vehicle, old_price, old_tax):
+        # Chamado pelo setter de Vehicle.price para alterações diretas de preço
+        self.version += 1
+        delta = vehicle.price - old_price
+        self._total_value += delta
+        self._total_tax += vehicle.calculate_tax() - old_tax
+        self._value_by_type[vehicle.__class__.__name__] += delta
+        self.indexes.reprice(vehicle, old_price, old_tax)
+        self._record('price', (vehicle.id, vehicle.price))
+        self._emit('repriced', [vehicle])
+    
+    # ---------- Impostos ----------
+    @write_locked
+    def _rates_changed(self):
+        # Chamado por tax_rules quando as taxas mudam
+        self.recompute_taxes()
+        self.version += 1
+        self._emit('repriced')
+    
+    @write_locked
+    def recompute_taxes(self):
+        # Recalcula todos os impostos numa passagem (vetorizada na versão colunar)
+        self.indexes.drop_sorted('tax')
+        if self.columns is not None:
+            self.columns.recompute_tax(tax_rules)
+            self._total_tax = self.columns.total_tax() if self.vehicles else 0
+            return
+        total = 0
+        rates = {}
+        for vehicle in self.vehicles:
+            key = (vehicle.__class__.__name__, vehicle.year)
+            rate = rates.get(key)
+            if rate is None:
+                rate = rates[key] = tax_rules.rate(*key)
+            vehicle._tax = vehicle._price * rate
+            total += vehicle._tax
+        self._total_tax = total
+    
+    @log_operation
+    @write_locked
+    def apply_global_discount(self, percentage):
+        # Criar e aplicar o cenário na mesma escrita: nenhuma outra alteração pelo meio
+        self.scenario(percentage).commit()
+        return len(self.vehicles)
+    
+    @log_operation
+    @write_locked
+    def set_prices(self, prices):
+        # Vários preços (id -> preço) numa só escrita: uma entrada no diário e um evento.
+        # Ids que não estão na frota são ignorados; devolve o número de veículos alterados
+        changed = []
+        for vehicle_id, price in dict(prices).items():
+            vehicle = self._by_id.get(vehicle_id)
+            if vehicle is None:
+                continue
+            old_price, old_tax = vehicle.price, vehicle.calculate_tax()
+            vehicle._set_price(price)
+            self._total_value += price - old_price
+            self._total_tax += vehicle.calculate_tax() - old_tax
+            self._value_by_type[vehicle.__class__.__name__] += price - old_price
+            self.indexes.reprice(vehicle, old_price, old_tax)
+            changed.append(vehicle)
+        if changed:
+            self.version += 1
+            changes = (array('q', [vehicle.id for vehicle in changed]), array('d', [vehicle.price for vehicle in changed]))
+            self._record('scale', changes, len(changed))
+            self._emit('repriced', changed)
+        return len(changed)
+    
+    # ---------- Cenários de preço ----------
+    def scenario(self, percentage, vehicle_type=None, brand=None, min_year=None, name=None):
+        return PricingScenario(self, percentage, vehicle_type, brand, min_year, name)
+    
+    def _vectorized(self):
+        return self.columns is not None and self.columns.np is not None
+    
+    def _scenario_vehicles(self, scenario):
+        # O planeador de consultas escolhe o índice mais seletivo entre os critérios
+        if not scenario.brand and not scenario.vehicle_type and scenario.min_year is None:
+            return self.vehicles
+        return list(self.query(brand=scenario.brand, vehicle_type=scenario.vehicle_type, year=(scenario.min_year, None)))
+    
+    @read_locked
+    def _scenario_totals(self, scenario, job=None):
+        if self._vectorized():
+            return self.columns.totals_by_type(self.columns.select(scenario.vehicle_type, scenario.brand_key, scenario.min_year))
+        vehicles = self._scenario_vehicles(scenario)
+        if job is not None:
+            vehicles = job.track(vehicles, len(vehicles))
+        totals = {}
+        for vehicle in vehicles:
+            vehicle_type = vehicle.__class__.__name__
+            count, value, tax = totals.get(vehicle_type, (0, 0, 0))
+            totals[vehicle_type] = (count + 1, value + vehicle.price, tax + vehicle.calculate_tax())
+        return totals
+    
+    @write_locked
+    def _commit_scenario(self, scenario):
+        # Tudo ou nada: os novos preços (arredondados ao cêntimo, sem deriva acumulada)
+        # são calculados antes de qualquer escrita. Impostos e totais só mudam nas linhas
+        # abrangidas, como em _price_changed
+        if self._vectorized():
+            mask = self.columns.select(scenario.vehicle_type, scenario.brand_key, scenario.min_year)
+            count = int(mask.sum())
+            ids = self.columns._view(self.columns.vehicle_id)
+            views, moved = self._unsort(lambda: map(self._by_id.__getitem__, ids[mask].tolist()), count)
+            before = self.columns.totals_by_type(mask)
+            self.columns.scale_selected(mask, scenario.factor)
+            self.columns.recompute_tax(tax_rules, mask)
+            for vehicle_type, (_, value, tax) in self.columns.totals_by_type(mask).items():
+                _, old_value, old_tax = before[vehicle_type]
+                self._total_value += value - old_value
+                self._total_tax += tax - old_tax
+                self._value_by_type[vehicle_type] += value - old_value
+            changes = self.columns.selected(mask) if count else None
+        else:
+            selected = self._scenario_vehicles(scenario)
+            count = len(selected)
+            views, moved = self._unsort(lambda: selected, count)
+            new_prices = array('d', [round(vehicle.price * scenario.factor, 2) for vehicle in selected])
+            for vehicle, price in zip(selected, new_prices):
+                old_price, old_tax = vehicle.price, vehicle.calculate_tax()
+                vehicle._set_price(price)
+                self._total_value += price - old_price
+                self._total_tax += vehicle.calculate_tax() - old_tax
+                self._value_by_type[vehicle.__class__.__name__] += price - old_price
+            changes = (array('q', [vehicle.id for vehicle in selected]), new_prices)
+        for view in views:
+            for vehicle in moved:
+                view.add(vehicle)
+        self.version += 1
+        if count:
+            self._record('scale', changes, count)
+        self._emit('repriced')
+        return count
+    
+    def _unsort(self, selected, count):
+        # Vistas de preço e imposto antes de um cenário: poucos veículos saem agora e voltam
+        # a entrar com as chaves novas no fim do commit; muitos descartam as vistas
+        views = [self.indexes.sorted[name] for name in ('price', 'tax') if name in self.indexes.sorted]
+        if not views or not count:
+            return views, ()
+        if count > len(self.vehicles) // SORTED_REBUILD_FRACTION:
+            self.indexes.drop_sorted('price', 'tax')
+            return [], ()
+        moved = list(selected())
+        for view in views:
+            for vehicle in moved:
+                view.remove(vehicle)
+        return views, moved
+    
+    # Filtros servidos pelos índices: custo proporcional ao número de resultados
+    @read_locked
+    def filter_by_brand(self, brand):
+        return self.indexes.with_brand(brand)
+    
+    @read_locked
+    def filter_by_year(self, min_year):
+        return self.indexes.with_min_year(min_year)
+    
+    @read_locked
+    def filter_by_type(self, vehicle_type):
+        return self.indexes.with_type(vehicle_type)
+    
+    @read_locked
+    def search(self, text, prefix=False):
+        # Pesquisa em marca e modelo por substring (ou prefixo de palavra); ver TextIndex
+        return self.indexes.text.search(text, prefix)
+    
+    @read_locked
+    def sorted_by(self, name, low=None, high=None, reverse=False):
+        # Veículos por preço, ano ou imposto (SORT_KEYS), opcionalmente só low..high.
+        # A vista ordenada é criada no primeiro pedido e mantida a cada alteração
+        return SortedRange(self.indexes.sorted_view(name, self.iter_vehicles()), low, high, reverse, lock=self.lock)
+    
+    @read_locked
+    def query(self, brand=None, vehicle_type=None, search=None, prefix=False, **ranges):
+        # Critérios combinados (todos têm de se verificar); intervalos como year=(2018, 2022)
+        # ou price=(None, 30000). Ver FleetQuery para o plano e explain()
+        if not self._vectorized() and tuple(ranges.get('price') or (None, None)) != (None, None):
+            # Intervalo de preço servido pela vista ordenada (criada uma vez)
+            self.indexes.sorted_view('price', self.iter_vehicles())
+        return FleetQuery(self.indexes, self.vehicles, self.columns if self._vectorized() else None,
+                          brand=brand, vehicle_type=vehicle_type, search=search, prefix=prefix, **ranges)
+    
+    # Inserção em massa: um único registo para o lote. Lotes grandes face à frota refazem
+    # índices e totais no fim; os pequenos atualizam-nos veículo a veículo
+    @log_operation
+    @write_locked
+    def add_vehicles(self, vehicles):
+        # Tudo ou nada: se a fonte falhar a meio (ou o job for cancelado), os veículos já
+        # ligados saem e a frota fica como estava, como no rollback de SQLiteFleet
+        added = []
+        previous = len(self.vehicles)
+        next_id = self._next_id
+        try:
+            for chunk in _chunks(vehicles, IMPORT_BATCH_SIZE):
+                for vehicle in chunk:
+                    self._attach(vehicle)
+                    added.append(vehicle)
+        except BaseException:
+            self._unattach(previous, next_id)
+            raise
+        if len(added) * IMPORT_REBUILD_FRACTION > previous:
+            self._rebuild_derived()
+        else:
+            for vehicle in added:
+                self.indexes.add(vehicle)
+                self._account(vehicle, 1)
+        # Uma única entrada no diário e um único evento para o lote inteiro
+        if added:
+            if self.columns is not None:
+                prices = self.columns.price[len(self.vehicles) - len(added):]
+            else:
+                prices = array('d', [vehicle._price for vehicle in added])
+            self._record('add', (added[0].id, added, prices), len(added))
+            self._emit('added', added)
+        return len(added)
+    
+    def _unattach(self, count, next_id):
+        # Desfaz os _attach a partir da posição count (ainda sem índices, totais nem diário)
+        for vehicle in self.vehicles[count:]:
+            self._by_id.pop(vehicle.id, None)
+            self._detach(vehicle)
+            vehicle.id = None
+        del self.vehicles[count:]
+        if self.columns is not None:
+            for column in self.columns._columns():
+                del column[count:]
+        self._next_id = next_id
+        self.version += 1
+    
+    def _rebuild_derived(self):
+        self.indexes = FleetIndexes()
+        for vehicle in self.vehicles:
+            self.indexes.add(vehicle)
+        
+        self._load_totals()
+    
+    def _load_totals(self):
+        # Totais acumulados refeitos de raiz (também elimina erro de arredondamento acumulado)
+        self._reset_totals()
+        if self.vehicles:
+            summary = self.recompute_summary()
+            self._total_value = summary['total_value']
+            self._total_tax = summary['total_tax']
+            self._count_by_type = summary['by_type']
+            self._value_by_type = summary['value_by_type']
+    
+    # Importação de ficheiros produzidos por export_inventory
+    def import_inventory(self, filename, format_type=None):
+        format_type = format_type or os.path.splitext(filename)[1].lstrip('.').lower()
+        report = {'imported': 0, 'rejected': 0, 'errors': [], 'seconds': 0, 'rows_per_sec': 0}
+        
+        def parsed_vehicles(records):
+            for number, record in enumerate(records, 1):
+                try:
+                    if isinstance(record, Exception):
+                        raise record
+                    yield vehicle_from_row(record)
+                except (AttributeError, KeyError, TypeError, ValueError) as e:
+                    report['rejected'] += 1
+                    if len(report['errors']) < IMPORT_MAX_ERRORS:
+                        report['errors'].append((number, f"{type(e).__name__}: {e}"))
+        
+        start = time.perf_counter()
+        try:
+            report['imported'] = self.add_vehicles(parsed_vehicles(import_records(filename, format_type)))
+        except Exception as e:
+            return False, f"Erro ao importar: {str(e)}", report
+        report['seconds'] = time.perf_counter() - start
+        report['rows_per_sec'] = report['imported'] / report['seconds'] if report['seconds'] else 0
+        
+        message = (f"Importados {report['imported']} veículos de '{filename}' "
+                   f"({report['rows_per_sec']:,.0f} linhas/s)")
+        if report['rejected']:
+            message += f", {report['rejected']} linha(s) rejeitada(s)"
+        return True, message, report
+    
+    # Exportação para ficheiros (numa só passagem, ver export_vehicles);
+    # com job, o progresso é reportado e a exportação pode ser cancelada
+    def export_inventory(self, filename, format_type='csv', job=None):
+        if not len(self):
+            return False, "Não há veículos para exportar!"
+        if format_type not in EXPORT_FORMATS:
+            return False, "Formato não suportado!"
+        
+        # Lida de um snapshot: a exportação não bloqueia escritas nem vê alterações a meio
+        try:
+            with self.snapshot() as source:
+                vehicles = source.iter_vehicles()
+                if job is not None:
+                    vehicles = job.track(vehicles, len(source))
+                export_vehicles(vehicles, filename, format_type)
+            return True, f"Inventário exportado para '{filename}'!"
+        except Exception as e:
+            return False, f"Erro ao exportar: {str(e)}"
+    
+    @read_locked
+    def snapshot(self):
+        # Estado congelado para leituras longas (p. ex. em segundo plano). Com diário custa O(1):
+        # o snapshot só é materializado na primeira leitura, na thread que o lê
+        if self._snapshot is None or self._snapshot.version != self.version:
+            if self.journal is not None:
+                self._snapshot = self.journal.snapshot(self.version, self.get_summary())
+            else:
+                vehicles = list(self._by_id.values())
+                prices = array('d', [vehicle.price for vehicle in vehicles])
+                self._snapshot = FleetSnapshot(vehicles, array('q', self._by_id), prices, self.get_summary(), self.version)
+        return self._snapshot
+    
+    # ---------- Diário e anulação ----------
+    def _record(self, operation, data, changes=1):
+        if self.journal is not None and self.journal.record(self.version, operation, data, changes, len(self.vehicles)):
+            checkpoint = self.journal.snapshot(self.version, self.get_summary())
+            checkpoint._load(taxes=False)
+            self.journal.checkpoint(checkpoint)
+    
+    @write_locked
+    def reset_journal(self):
+        # O estado atual passa a ser o início do diário (p. ex. depois de carregar dados
+        # iniciais): undo e rollback deixam de recuar para antes dele
+        if self.journal is None:
+            return
+        checkpoint = self.journal.snapshot(self.version, self.get_summary())
+        checkpoint._load(taxes=False)
+        self.journal = FleetJournal(self.journal.min_checkpoint, self.journal.max_checkpoints)
+        self.journal.checkpoints = [checkpoint]
+    
+    @read_locked
+    def history(self):
+        # (versão, operação, veículos afetados) de cada alteração ainda no diário
+        return self.journal.history() if self.journal is not None else []
+    
+    @log_operation
+    @write_locked
+    def rollback(self, version):
+        # Repõe o estado de uma versão anterior (checkpoint + entradas do diário). A reposição
+        # fica registada como 'restore', por isso também pode ser desfeita
+        if self.journal is None:
+            raise ValueError("Esta frota não tem diário de alterações")
+        if version > self.version:
+            raise ValueError(f"A versão {version} ainda não existe (atual: {self.version})")
+        snapshot = self.journal.snapshot(version)
+        changed = self.journal.changed_ids(version)
+        if changed is not None and len(changed) <= len(self.vehicles) // 2:
+            self._restore_changed(snapshot, changed)
+        else:
+            changed = None
+            self._restore(snapshot)
+        self.version += 1
+        self._record('restore', (snapshot, changed), 0)
+        self._emit('reset')
+        return len(self.vehicles)
+    
+    @write_locked
+    def undo(self):
+        version = self.journal.undo_version() if self.journal is not None else None
+        if version is None:
+            return False, "Não há alterações para desfazer!"
+        self.rollback(version)
+        return True, f"Alteração desfeita: {len(self.vehicles)} veículos (versão {version})"
+    
+    def _restore(self, snapshot):
+        # Reposição completa: a frota é reconstruída a partir do snapshot
+        snapshot._load(taxes=False)
+        for vehicle in self.vehicles:
+            self._detach(vehicle)
+        self.vehicles = []
+        self._by_id = {}
+        if self.columns is not None:
+            self.columns = VehicleColumns()
+        for vehicle, vehicle_id, price in zip(snapshot._vehicles, snapshot._ids, snapshot._prices):
+            if vehicle._fleet is not None:  # entretanto passou para outra frota
+                vehicle = vehicle.copy()
+            vehicle.price = price
+            self._attach(vehicle, vehicle_id)
+        self._rebuild_derived()
+    
+    def _restore_changed(self, snapshot, changed):
+        # Reposição incremental: só os ids tocados depois da versão, O(alterações · log n);
+        # os ids do snapshot estão ordenados, por isso cada um é procurado por bisseção
+        snapshot._load(taxes=False)
+        ids = snapshot._ids
+        reinserted = False
+        for vehicle_id in changed:
+            index = bisect_left(ids, vehicle_id)
+            target = snapshot._vehicles[index] if index < len(ids) and ids[index] == vehicle_id else None
+            current = self._by_id.get(vehicle_id)
+            if target is None:
+                if current is not None:
+                    self._remove(current)
+            elif current is None:
+                if target._fleet is not None:
+                    target = target.copy()
+                target.price = snapshot._prices[index]
+                self._attach(target, vehicle_id)
+                self.indexes.add(target)
+                self._account(target, 1)
+                reinserted = True
+            elif current.price != snapshot._prices[index]:
+                # Preço reposto sem passar por _price_changed (sem entrada nem evento próprios)
+                old_price, old_tax = current.price, current.calculate_tax()
+                self._account(current, -1)
+                current._fleet = None
+                current.price = snapshot._prices[index]
+                current._fleet = self
+                self._account(current, 1)
+                self.indexes.reprice(current, old_price, old_tax)
+        if reinserted:
+            # _by_id volta à ordem dos ids, que é a ordem de inserção original (as chaves são
+            # duas sequências já ordenadas, que o sort junta em tempo quase linear)
+            by_id = self._by_id
+            self._by_id = {vehicle_id: by_id[vehicle_id] for vehicle_id in sorted(by_id)}
+    
+    def save_snapshot(self, filename):
+        try:
+            with self.snapshot() as source:
+                write_snapshot(filename, source.iter_vehicles(), len(source), source.get_summary())
+            return True, f"Snapshot guardado em '{filename}'!"
+        except Exception as e:
+            return False, f"Erro ao guardar snapshot: {str(e)}"
+    
+    # Resumo em tempo constante a partir dos totais acumulados
+    def operation_metrics(self):
+        # Latência por operação: chamadas, média e percentis p50/p95/p99 (ms)
+        return self.metrics.summary()
+    
+    @read_locked
+    def get_summary(self):
+        if self.debug:
+            self.verify_summary()
+        return {
+            'total': len(self.vehicles),
+            'total_value': self._total_value,
+            'total_tax': self._total_tax,
+            'by_type': dict(self._count_by_type),
+            'value_by_type': dict(self._value_by_type)
+        }
+    
+    @read_locked
+    def recompute_summary(self):
+        if self.columns is not None:
+            summary = {
+                'total': len(self.vehicles),
+                'total_value': self.columns.total_value(),
+                'total_tax': self.columns.total_tax(),
+                'by_type': self.columns.count_by_type(),
+                'value_by_type': {}
+            }
+        else:
+            summary = {
+                'total': len(self.vehicles),
+                'total_value': sum(v.price for v in self.vehicles),
+                'total_tax': sum(v.calculate_tax() for v in self.vehicles),
+                'by_type': {},
+                'value_by_type': {}
+            }
+            for vehicle in self.vehicles:
+                vehicle_type = vehicle.__class__.__name__
+                summary['by_type'][vehicle_type] = summary['by_type'].get(vehicle_type, 0) + 1
+        
+        for vehicle in self.vehicles:
+            vehicle_type = vehicle.__class__.__name__
+            summary['value_by_type'][vehicle_type] = summary['value_by_type'].get(vehicle_type, 0) + vehicle.price
+        return summary
+    
+    @read_locked
+    def verify_summary(self):
+        expected = self.recompute_summary()
+        close = lambda a, b: math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+        problems = [key for key in ('total_value', 'total_tax') if not close(getattr(self, '_' + key), expected[key])]
+        if self._count_by_type != expected['by_type']:
+            problems.append('by_type')
+        if self._value_by_type.keys() != expected['value_by_type'].keys() or not all(
+                close(self._value_by_type[t], expected['value_by_type'][t]) for t in self._value_by_type):
+            problems.append('value_by_type')
+        if problems:
+            raise AssertionError(f"Totais acumulados inconsistentes: {', '.join(problems)}")
+        return True
+
+# ==================== VISTA CONGELADA DA FROTA ====================
+class FleetSnapshot:
+    # Os campos de um veículo não mudam depois de criado, exceto o preço: basta guardar
+    # as referências, os ids e uma cópia dos preços. Os impostos saem das regras congeladas
+    # no instante do snapshot. Cada veículo lido é uma cópia desligada com esses valores.
+    # Os snapshots do diário são preguiçosos (ver replay): materializados na primeira leitura.
+    def __init__(self, vehicles, ids, prices, summary=None, version=0, rules=None):
+        self._vehicles = vehicles
+        self._ids = ids
+        self._prices = prices
+        self._taxes = None
+        self._summary = summary
+        self.version = version
+        self.rules = rules or tax_rules.frozen()
+        self._pending = None
+        self._lock = threading.Lock()
+        self._indexes = None
+        self._positions = None
+    
+    @classmethod
+    def replay(cls, base, entries, start, stop, version, summary=None):
+        # Estado = checkpoint base + entries[start:stop]. Criar custa O(1); as listas de
+        # entradas do diário nunca são alteradas nessas posições, por isso a leitura pode
+        # acontecer noutra thread enquanto a frota continua a mudar
+        snapshot = cls(None, None, None, summary, version)
+        snapshot._pending = (base, entries, start, stop)
+        return snapshot
+    
+    def _load(self, taxes=True):
+        with self._lock:
+            if self._pending is not None:
+                self._replay(*self._pending)
+                self._pending = None
+            if taxes and self._taxes is None:
+                rates = {}
+                column = array('d')
+                for vehicle, price in zip(self._vehicles, self._prices):
+                    key = (vehicle.__class__.__name__, vehicle.year)
+                    rate = rates.get(key)
+                    if rate is None:
+                        rate = rates[key] = self.rules.rate(*key)
+                    column.append(price * rate)
+                self._taxes = column
+        return self
+    
+    def _replay(self, base, entries, start, stop):
+        # Cópia na escrita: as listas da base só são copiadas quando uma entrada as altera
+        # (um desconto copia os preços, mas partilha veículos e ids com a base). Os ids estão
+        # sempre ordenados (os novos são maiores e os removidos ficam como None até ao fim),
+        # por isso a posição de cada id é encontrada por bisseção
+        vehicles, ids, prices = base._vehicles, base._ids, base._prices
+        own_rows = own_prices = removed = False
+        for version, operation, data in entries[start:stop]:
+            if operation in ('reset', 'restore'):
+                vehicles, ids, prices = ([], array('q'), array('d')) if data is None else (data[0]._vehicles, data[0]._ids, data[0]._prices)
+                own_rows = own_prices = removed = False
+            elif operation == 'add':
+                first_id, added, added_prices = data
+                if not own_rows:
+                    vehicles, ids, own_rows = list(vehicles), array('q', ids), True
+                if not own_prices:
+                    prices, own_prices = array('d', prices), True
+                vehicles.extend(added)
+                ids.extend(range(first_id, first_id + len(added)))
+                prices.extend(added_prices)
+            elif operation == 'remove':
+                if not own_rows:
+                    vehicles, own_rows = list(vehicles), True
+                    ids = array('q', ids)
+                for vehicle_id in data:
+                    vehicles[bisect_left(ids, vehicle_id)] = None
+                removed = True
+            else:
+                changed_ids, changed_prices = ((data[0],), (data[1],)) if operation == 'price' else data
+                if not own_prices:
+                    prices, own_prices = array('d', prices), True
+                for vehicle_id, price in zip(changed_ids, changed_prices):
+                    prices[bisect_left(ids, vehicle_id)] = price
+        if removed:
+            keep = [vehicle is not None for vehicle in vehicles]
+            vehicles = list(compress(vehicles, keep))
+            ids = array('q', compress(ids, keep))
+            prices = array('d', compress(prices, keep))
+        self._vehicles, self._ids, self._prices = vehicles, ids, prices
+    
+    def __len__(self):
+        if self._summary is not None:
+            return self._summary['total']
+        return len(self._load(taxes=False)._vehicles)
+    
+    def _frozen(self, index):
+        vehicle = self._vehicles[index]._clone()
+        vehicle.id = self._ids[index]
+        vehicle._store = None
+        vehicle._row = -1
+        vehicle._fleet = None
+        vehicle._price = self._prices[index]
+        vehicle._tax = self._taxes[index]
+        return vehicle
+    
+    def iter_vehicles(self):
+        return map(self._frozen, range(len(self._load()._vehicles)))
+    
+    def window(self, start, stop):
+        self._load()
+        return [self._frozen(index) for index in range(start, min(stop, len(self._vehicles)))]
+    
+    def snapshot(self):
+        return self
+    
+    # Só memória: fechar não liberta nada (e o snapshot pode estar em cache na frota), mas
+    # todos os snapshots se usam da mesma forma, com "with fleet.snapshot() as source"
+    def close(self):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def get_summary(self):
+        if self._summary is None:
+            self._load()
+            summary = {'total': len(self._vehicles), 'total_value': sum(self._prices), 'total_tax': sum(self._taxes),
+                       'by_type': {}, 'value_by_type': {}}
+            for vehicle, price in zip(self._vehicles, self._prices):
+                vehicle_type = vehicle.__class__.__name__
+                summary['by_type'][vehicle_type] = summary['by_type'].get(vehicle_type, 0) + 1
+                summary['value_by_type'][vehicle_type] = summary['value_by_type'].get(vehicle_type, 0) + price
+            self._summary = summary
+        return copy.deepcopy(self._summary)
+    
+    # Cenários avaliados sobre os preços e impostos do snapshot (só leitura: sem commit)
+    scenario = Fleet.scenario
+    
+    def _commit_scenario(self, scenario):
+        raise TypeError("Um snapshot é só de leitura: crie o cenário na frota")
+    
+    def _scenario_totals(self, scenario, job=None):
+        self._load()
+        rows = zip(self._vehicles, self._prices, self._taxes)
+        if job is not None:
+            rows = job.track(rows, len(self))
+        totals = {}
+        for vehicle, price, tax in rows:
+            if scenario.matches(vehicle):
+                vehicle_type = vehicle.__class__.__name__
+                count, value, total_tax = totals.get(vehicle_type, (0, 0, 0))
+                totals[vehicle_type] = (count + 1, value + price, total_tax + tax)
+        return totals
+    
+    # Filtros: os índices são construídos uma vez por snapshot, na primeira consulta
+    def _lookup(self):
+        self._load()
+        if self._indexes is None:
+            indexes = FleetIndexes()
+            for vehicle in self._vehicles:
+                indexes.add(vehicle)
+            positions = self._positions = {vehicle: index for index, vehicle in enumerate(self._vehicles)}
+            # Vistas ordenadas pelos preços e impostos congelados
+            indexes.sort_keys = dict(SORT_KEYS, price=lambda vehicle: self._prices[positions[vehicle]],
+                                     tax=lambda vehicle: self._taxes[positions[vehicle]])
+            self._indexes = indexes
+        return self._indexes
+    
+    def _freeze(self, vehicles):
+        return [self._frozen(self._positions[vehicle]) for vehicle in vehicles]
+    
+    def filter_by_brand(self, brand):
+        return self._freeze(self._lookup().with_brand(brand))
+    
+    def filter_by_year(self, min_year):
+        return self._freeze(self._lookup().with_min_year(min_year))
+    
+    def filter_by_type(self, vehicle_type):
+        return self._freeze(self._lookup().with_type(vehicle_type))
+    
+    def search(self, text, prefix=False):
+        return self._freeze(self._lookup().text.search(text, prefix))
+    
+    def sorted_by(self, name, low=None, high=None, reverse=False):
+        indexes = self._lookup()
+        positions = self._positions
+        return SortedRange(indexes.sorted_view(name, self._vehicles), low, high, reverse,
+                           lambda vehicle: self._frozen(positions[vehicle]))
+    
+    def query(self, brand=None, vehicle_type=None, search=None, prefix=False, **ranges):
+        # Os preços do snapshot podem diferir dos atuais: o intervalo de preço usa os congelados
+        indexes = self._lookup()
+        positions = self._positions
+        return FleetQuery(indexes, self._vehicles, None, lambda vehicle: self._prices[positions[vehicle]],
+                          lambda vehicle: self._frozen(positions[vehicle]),
+                          brand=brand, vehicle_type=vehicle_type, search=search, prefix=prefix, **ranges)
+    
+    export_inventory = Fleet.export_inventory
+
+# ==================== DIÁRIO DE ALTERAÇÕES ====================
+JOURNAL_MIN_CHECKPOINT = 1024
+JOURNAL_MAX_CHECKPOINTS = 4
+
+class FleetJournal:
+    # Diário só de acréscimo: cada alteração da Fleet é uma entrada imutável (versão, operação,
+    # dados) com o estado novo - 'add' (primeiro id, veículos, preços), 'remove' (ids),
+    # 'price' (id, preço), 'scale' (ids, preços), 'reset' e 'restore' (snapshot reposto e
+    # ids alterados, ou None se a frota foi reconstruída).
+    # Qualquer versão é um checkpoint mais as entradas seguintes. Há um checkpoint novo
+    # quando os veículos alterados desde o último passam o tamanho da frota (custo
+    # amortizado O(1) por alteração); ficam os últimos max_checkpoints e as entradas
+    # anteriores ao mais antigo são descartadas.
+    def __init__(self, min_checkpoint=JOURNAL_MIN_CHECKPOINT, max_checkpoints=JOURNAL_MAX_CHECKPOINTS):
+        self.min_checkpoint = min_checkpoint
+        self.max_checkpoints = max_checkpoints
+        self.entries = []
+        self.versions = []
+        self.checkpoints = [FleetSnapshot([], array('q'), array('d'))]
+        self._changes = 0
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def record(self, version, operation, data, changes, size):
+        # Devolve True quando está na altura de um checkpoint
+        self.entries.append((version, operation, data))
+        self.versions.append(version)
+        self._changes += changes
+        return self._changes > max(self.min_checkpoint, size)
+    
+    def checkpoint(self, snapshot):
+        self.checkpoints.append(snapshot)
+        self._changes = 0
+        if len(self.checkpoints) > self.max_checkpoints:
+            # Compactação: as listas são substituídas e não cortadas no lugar, por isso os
+            # snapshots preguiçosos que ainda as referenciam continuam válidos
+            del self.checkpoints[0]
+            start = bisect_right(self.versions, self.checkpoints[0].version)
+            self.entries = self.entries[start:]
+            self.versions = self.versions[start:]
+    
+    def oldest_version(self):
+        return self.checkpoints[0].version
+    
+    def snapshot(self, version, summary=None):
+        if version < self.oldest_version():
+            raise ValueError(f"A versão {version} já saiu do diário (a mais antiga é {self.oldest_version()})")
+        base = next(checkpoint for checkpoint in reversed(self.checkpoints) if checkpoint.version <= version)
+        start = bisect_right(self.versions, base.version)
+        return FleetSnapshot.replay(base, self.entries, start, bisect_right(self.versions, version), version, summary)
+    
+    def undo_version(self):
+        # Versão anterior à última alteração ainda não desfeita. As reposições feitas por
+        # undo são saltadas, para que undo repetido continue a recuar em vez de alternar
+        stop = len(self.entries)
+        while stop and self.entries[stop - 1][1] == 'restore':
+            stop = bisect_right(self.versions, self.entries[stop - 1][2][0].version)
+        if not stop:
+            return None
+        return self.versions[stop - 2] if stop > 1 else self.oldest_version()
+    
+    def history(self):
+        sizes = {'add': lambda data: len(data[1]), 'remove': len, 'price': lambda data: 1,
+                 'scale': lambda data: len(data[0]), 'reset': lambda data: 0,
+                 'restore': lambda data: len(data[0] if data[1] is None else data[1])}
+        return [(version, operation, sizes[operation](data)) for version, operation, data in self.entries]
+    
+    def changed_ids(self, version):
+        # Ids tocados pelas entradas posteriores à versão; None se alguma reconstruiu a frota
+        changed = set()
+        for _, operation, data in self.entries[bisect_right(self.versions, version):]:
+            if operation == 'add':
+                changed.update(range(data[0], data[0] + len(data[1])))
+            elif operation == 'remove':
+                changed.update(data)
+            elif operation == 'price':
+                changed.add(data[0])
+            elif operation == 'scale':
+                changed.update(data[0])
+            elif operation == 'restore' and data[1] is not None:
+                changed.update(data[1])
+            else:
+                return None
+        return changed
+
+# ==================== FROTA PERSISTENTE (SQLITE) ====================
+SQLITE_COLUMNS = ('id', 'type', 'brand', 'model', 'price', 'year', 'battery_capacity',
+                  'autonomy', 'load_capacity', 'length', 'registration_ts')
+SQLITE_SELECT = f"SELECT {', '.join(SQLITE_COLUMNS)} FROM vehicles"
+SQLITE_INSERT = ("INSERT INTO vehicles (type, brand, brand_key, model, price, year, battery_capacity, "
+                 "autonomy, load_capacity, length, registration_ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vehicles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    brand TEXT NOT NULL,
+    brand_key TEXT NOT NULL,
+    model TEXT NOT NULL,
+    price REAL NOT NULL,
+    year INTEGER NOT NULL,
+    battery_capacity REAL,
+    autonomy REAL,
+    load_capacity REAL,
+    length REAL,
+    registration_ts INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_vehicles_brand ON vehicles (brand_key);
+CREATE INDEX IF NOT EXISTS idx_vehicles_year ON vehicles (year);
+CREATE INDEX IF NOT EXISTS idx_vehicles_type ON vehicles (type);
+CREATE INDEX IF NOT EXISTS idx_vehicles_price ON vehicles (price);
+"""
+
+class SQLiteQuery:
+    # Mesma interface que FleetQuery; o plano fica a cargo do SQLite (EXPLAIN QUERY PLAN)
+    def __init__(self, fleet, brand=None, vehicle_type=None, search=None, prefix=False, **ranges):
+        brand, vehicle_type, search, ranges, self.empty = query_criteria(brand, vehicle_type, search, **ranges)
+        self.fleet = fleet
+        self.cost = None  # o SQLite não expõe a estimativa do plano
+        clauses, params = [], []
+        if brand:
+            clauses.append("brand_key = ?")
+            params.append(brand.casefold())
+        if vehicle_type:
+            clauses.append("type = ?")
+            params.append(vehicle_type)
+        for name, (low, high) in ranges.items():
+            if low is not None:
+                clauses.append(f"{name} >= ?")
+                params.append(low)
+            if high is not None:
+                clauses.append(f"{name} <= ?")
+                params.append(high)
+        if search:
+            search_clauses, search_params = fleet._search_clauses(search, prefix)
+            clauses.extend(search_clauses)
+            params.extend(search_params)
+        self.where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        self.params = params
+    
+    def explain(self):
+        if self.empty:
+            return "1. critérios incompatíveis: nenhum resultado"
+        rows = self.fleet.db.execute(f"EXPLAIN QUERY PLAN {SQLITE_SELECT} {self.where} ORDER BY id", self.params)
+        return "\n".join(f"{number}. {row[-1]}" for number, row in enumerate(rows, 1))
+    
+    def __iter__(self):
+        return iter(()) if self.empty else self.fleet._query(self.where, self.params)
+    
+    def fetch(self, offset=0, limit=None):
+        if self.empty:
+            return iter(())
+        order = f"id LIMIT {-1 if limit is None else int(limit)} OFFSET {int(offset)}"
+        return self.fleet._query(self.where, self.params, order)
+    
+    def count(self):
+        if self.empty:
+            return 0
+        return self.fleet.db.execute(f"SELECT COUNT(*) FROM vehicles {self.where}", self.params).fetchone()[0]
+
+# Expressão SQL de cada chave de SORT_KEYS (preço e ano com índice; o imposto ordena a tabela)
+SQLITE_SORT_EXPRESSIONS = {'price': 'price', 'year': 'year', 'tax': 'price * tax_rate(type, year)'}
+
+class SQLiteSortedRange:
+    # Mesma interface que SortedRange, com ORDER BY ... LIMIT/OFFSET
+    def __init__(self, fleet, name, low=None, high=None, reverse=False):
+        expression = SQLITE_SORT_EXPRESSIONS[name]
+        clauses, self.params = [], []
+        if low is not None:
+            clauses.append(f"{expression} >= ?")
+            self.params.append(low)
+        if high is not None:
+            clauses.append(f"{expression} <= ?")
+            self.params.append(high)
+        self.fleet = fleet
+        self.where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        direction = " DESC" if reverse else ""
+        self.order = f"{expression}{direction}, id{direction}"
+    
+    def __len__(self):
+        return self.fleet.db.execute(f"SELECT COUNT(*) FROM vehicles {self.where}", self.params).fetchone()[0]
+    
+    def __iter__(self):
+        return self.fleet._query(self.where, self.params, self.order)
+    
+    def window(self, start, stop):
+        start = max(start, 0)
+        return list(self.fleet._query(self.where, self.params, f"{self.order} LIMIT {max(stop - start, 0)} OFFSET {start}"))
+
+class SQLiteFleet(ChangeNotifier):
+    # Mesma interface que Fleet, com os veículos guardados numa base SQLite.
+    # A ligação só é aberta no primeiro acesso; os veículos devolvidos pelas
+    # consultas ficam ligados à base, por isso alterar o preço é persistido.
+    def __init__(self, path='frota.db'):
+        self.path = path
+        self._db = None
+        # O SQLite isola as transações; o lock só torna atómicas as alterações de preço
+        # feitas através dos veículos (ver Vehicle.price)
+        self.lock = ReadWriteLock()
+        self._listeners = []
+        self.metrics = OperationMetrics()
+        self.rules = tax_rules
+        # Conta as escritas feitas por esta frota (os cenários recusam-se a aplicar sobre
+        # um estado que já mudou); escritas de outros processos na base não são vistas
+        self.version = 0
+        tax_rules.subscribe(self)
+    
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, cached_statements=256)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SQLITE_SCHEMA)
+            self._register_functions(self._db)
+        return self._db
+    
+    def _register_functions(self, db):
+        db.create_function("search_term", 2, search_term, deterministic=True)
+        # As taxas podem mudar entre consultas: não determinística
+        db.create_function("tax_rate", 2, self.rules.rate)
+    
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def snapshot(self):
+        # Ligação própria com uma transação de leitura: fechar o snapshot (close ou with)
+        # termina-a, para não atrasar os checkpoints do WAL
+        return SQLiteSnapshot(self.path)
+    
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM vehicles").fetchone()[0]
+    
+    @property
+    def vehicles(self):
+        return list(self.iter_vehicles())
+    
+    # ---------- Conversão entre linhas e veículos ----------
+    @staticmethod
+    def _to_record(vehicle):
+        return (
+            vehicle.__class__.__name__, vehicle.brand, vehicle.brand.casefold(), vehicle.model,
+            vehicle.price, vehicle.year,
+            getattr(vehicle, 'battery_capacity', None), getattr(vehicle, 'autonomy', None),
+            getattr(vehicle, 'load_capacity', None), getattr(vehicle, 'length', None),
+            vehicle._registration_ts
+        )
+    
+    def _to_vehicle(self, record):
+        vehicle_id, vehicle_type, brand, model, price, year, battery, autonomy, load, length, timestamp = record
+        if vehicle_type == 'ElectricCar':
+            vehicle = ElectricCar(brand, model, price, year, battery, autonomy)
+        elif vehicle_type == 'Truck':
+            vehicle = Truck(brand, model, price, year, load, length)
+        else:
+            vehicle = Vehicle(brand, model, price, year)
+        vehicle.id = vehicle_id
+        vehicle._registration_ts = timestamp
+        vehicle._fleet = self
+        return vehicle
+    
+    def _query(self, where="", params=(), order="id"):
+        cursor = self.db.execute(f"{SQLITE_SELECT} {where} ORDER BY {order}", params)
+        return map(self._to_vehicle, cursor)
+    
+    # ---------- Operações da frota ----------
+    @log_operation
+    def add_vehicle(self, vehicle):
+        if vehicle._fleet is not None:
+            raise ValueError("O veículo já pertence a uma frota")
+        with self.db:
+            vehicle.id = self.db.execute(SQLITE_INSERT, self._to_record(vehicle)).lastrowid
+        # Como os veículos lidos da base: alterar o preço passa a ser persistido
+        vehicle._fleet = self
+        self.version += 1
+        self._emit('added', [vehicle])
+        return True
+    
+    @log_operation
+    def add_vehicles(self, vehicles):
+        # executemany em lotes, tudo dentro de uma única transação. Com uma só ligação a
+        # escrever, os ids de cada lote são consecutivos e terminam em last_insert_rowid()
+        added = []
+        try:
+            with self.db:
+                for chunk in _chunks(vehicles, IMPORT_BATCH_SIZE):
+                    if any(vehicle._fleet is not None for vehicle in chunk):
+                        raise ValueError("O veículo já pertence a uma frota")
+                    self.db.executemany(SQLITE_INSERT, map(self._to_record, chunk))
+                    last = self.db.execute("SELECT last_insert_rowid()").fetchone()[0]
+                    for vehicle_id, vehicle in enumerate(chunk, last - len(chunk) + 1):
+                        vehicle.id = vehicle_id
+                    added.extend(chunk)
+        except BaseException:
+            # A transação foi desfeita: os ids atribuídos não existem na base
+            for vehicle in added:
+                vehicle.id = None
+            raise
+        for vehicle in added:
+            vehicle._fleet = self
+        if added:
+            self.version += 1
+            self._emit('added', added)
+        return len(added)
+    
+    @log_operation
+    def remove_vehicle(self, index):
+        if index < 0:
+            return None
+        row = self.db.execute("SELECT id FROM vehicles ORDER BY id LIMIT 1 OFFSET ?", (index,)).fetchone()
+        if row is None:
+            return None
+        return self._remove_ids([row[0]])[0]
+    
+    @log_operation
+    def remove_vehicles(self, vehicle_ids):
+        return self._remove_ids(vehicle_ids)
+    
+    def _remove_ids(self, vehicle_ids):
+        # Sem log_operation: remove_vehicle e remove_vehicles registam uma única operação
+        vehicle_ids = list(vehicle_ids)
+        removed = []
+        with self.db:
+            for chunk in _chunks(vehicle_ids, 500):
+                marks = ", ".join("?" * len(chunk))
+                removed.extend(self._query(f"WHERE id IN ({marks})", chunk))
+                self.db.execute(f"DELETE FROM vehicles WHERE id IN ({marks})", chunk)
+        for vehicle in removed:
+            vehicle._fleet = None
+        if removed:
+            self.version += 1
+            self._emit('removed', removed)
+        return removed
+    
+    def get_vehicle(self, vehicle_id):
+        return next(self._query("WHERE id = ?", (vehicle_id,)), None)
+    
+    def iter_vehicles(self):
+        return self._query()
+    
+    def window(self, start, stop):
+        cursor = self.db.execute(f"{SQLITE_SELECT} ORDER BY id LIMIT ? OFFSET ?", (max(stop - start, 0), start))
+        return [self._to_vehicle(record) for record in cursor]
+    
+    def recent(self, count=5):
+        cursor = self.db.execute(f"{SQLITE_SELECT} ORDER BY id DESC LIMIT ?", (count,))
+        return [self._to_vehicle(record) for record in cursor][::-1]
+    
+    def clear(self):
+        with self.db:
+            self.db.execute("DELETE FROM vehicles")
+        self.version += 1
+        self._emit('reset')
+    
+    def _price_changed(self, vehicle, old_price, old_tax):
+        with self.db:
+            self.db.execute("UPDATE vehicles SET price = ? WHERE id = ?", (vehicle.price, vehicle.id))
+        self.version += 1
+        self._emit('repriced', [vehicle])
+    
+    def _rates_changed(self):
+        # Os impostos são calculados nas consultas: basta avisar os subscritores
+        self.version += 1
+        self._emit('repriced')
+    
+    @log_operation
+    def apply_global_discount(self, percentage):
+        return self.scenario(percentage).commit()
+    
+    @log_operation
+    def set_prices(self, prices):
+        with self.db:
+            cursor = self.db.executemany("UPDATE vehicles SET price = ? WHERE id = ?",
+                                         [(price, vehicle_id) for vehicle_id, price in dict(prices).items()])
+        if cursor.rowcount:
+            self.version += 1
+            self._emit('repriced')
+        return cursor.rowcount
+    
+    def filter_by_brand(self, brand):
+        return list(self._query("WHERE brand_key = ?", (brand.casefold(),)))
+    
+    def filter_by_year(self, min_year):
+        return list(self._query("WHERE year >= ?", (min_year,), "year, id"))
+    
+    def filter_by_type(self, vehicle_type):
+        return list(self._query("WHERE type = ?", (vehicle_type,)))
+    
+    @staticmethod
+    def _search_clauses(text, prefix=False):
+        # A mesma normalização da Fleet, como função SQL (percorre a tabela)
+        words = normalize_text(text).split()
+        term = "' ' || search_term(brand, model)" if prefix else "search_term(brand, model)"
+        return [f"instr({term}, ?) > 0"] * len(words), [' ' + word if prefix else word for word in words]
+    
+    def search(self, text, prefix=False):
+        clauses, params = self._search_clauses(text, prefix)
+        if not clauses:
+            return list(self.iter_vehicles())
+        return list(self._query(f"WHERE {' AND '.join(clauses)}", params, "search_term(brand, model), id"))
+    
+    def sorted_by(self, name, low=None, high=None, reverse=False):
+        return SQLiteSortedRange(self, name, low, high, reverse)
+    
+    def query(self, brand=None, vehicle_type=None, search=None, prefix=False, **ranges):
+        return SQLiteQuery(self, brand=brand, vehicle_type=vehicle_type, search=search, prefix=prefix, **ranges)
+    
+    # ---------- Cenários de preço (agregados e commit em SQL) ----------
+    scenario = Fleet.scenario
+    
+    @staticmethod
+    def _scenario_where(scenario):
+        clauses, params = [], []
+        if scenario.vehicle_type:
+            clauses.append("type = ?")
+            params.append(scenario.vehicle_type)
+        if scenario.brand_key:
+            clauses.append("brand_key = ?")
+            params.append(scenario.brand_key)
+        if scenario.min_year is not None:
+            clauses.append("year >= ?")
+            params.append(scenario.min_year)
+        return ("WHERE " + " AND ".join(clauses) if clauses else ""), params
+    
+    def _scenario_totals(self, scenario, job=None):
+        where, params = self._scenario_where(scenario)
+        rows = self.db.execute(f"SELECT type, year, COUNT(*), SUM(price) FROM vehicles {where} "
+                               "GROUP BY type, year ORDER BY MIN(id)", params)
+        totals = {}
+        for vehicle_type, year, count, value in rows:
+            old_count, old_value, old_tax = totals.get(vehicle_type, (0, 0, 0))
+            totals[vehicle_type] = (old_count + count, old_value + value,
+                                    old_tax + value * self.rules.rate(vehicle_type, year))
+        return totals
+    
+    def _commit_scenario(self, scenario):
+        where, params = self._scenario_where(scenario)
+        with self.db:
+            cursor = self.db.execute(f"UPDATE vehicles SET price = ROUND(price * ?, 2) {where}", [scenario.factor, *params])
+        self.version += 1
+        self._emit('repriced')
+        return cursor.rowcount
+    
+    def operation_metrics(self):
+        # Latência por operação: chamadas, média e percentis p50/p95/p99 (ms)
+        return self.metrics.summary()
+    
+    def get_summary(self):
+        summary = {'total': 0, 'total_value': 0, 'total_tax': 0, 'by_type': {}, 'value_by_type': {}}
+        # Agrupado também por ano, porque a taxa pode depender do ano
+        rows = self.db.execute("SELECT type, year, COUNT(*), SUM(price) FROM vehicles GROUP BY type, year ORDER BY MIN(id)")
+        for vehicle_type, year, count, value in rows:
+            summary['total'] += count
+            summary['total_value'] += value
+            summary['total_tax'] += value * self.rules.rate(vehicle_type, year)
+            summary['by_type'][vehicle_type] = summary['by_type'].get(vehicle_type, 0) + count
+            summary['value_by_type'][vehicle_type] = summary['value_by_type'].get(vehicle_type, 0) + value
+        return summary
+    
+    # Exportação e importação partilham a implementação de Fleet
+    export_inventory = Fleet.export_inventory
+    import_inventory = Fleet.import_inventory
+    save_snapshot = Fleet.save_snapshot
+
+class SQLiteSnapshot(SQLiteFleet):
+    # Em modo WAL uma transação de leitura aberta vê sempre o mesmo estado, mesmo com
+    # escritas na ligação principal. A ligação é só de leitura e as taxas ficam as do
+    # momento do snapshot. Os snapshots deste snapshot partilham a ligação
+    # (não abrem outra) e o close() deles não a fecha
+    def __init__(self, path):
+        self.path = path
+        self.lock = ReadWriteLock()
+        self._listeners = []
+        self.metrics = OperationMetrics()
+        self.rules = tax_rules.frozen()
+        self.version = 0
+        self._owner = True
+        uri = pathlib.Path(path).resolve().as_uri() + "?mode=ro"
+        self._db = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False)
+        self._register_functions(self._db)
+        self._db.execute("BEGIN")
+        self._db.execute("SELECT COUNT(*) FROM vehicles").fetchone()
+    
+    def _to_vehicle(self, record):
+        # Cópias desligadas, como as do FleetSnapshot: alterar o preço não chega à base
+        vehicle = super()._to_vehicle(record)
+        vehicle._fleet = None
+        vehicle._tax = vehicle.price * self.rules.rate(vehicle.__class__.__name__, vehicle.year)
+        return vehicle
+    
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Um snapshot é só de leitura: altere a frota")
+    
+    add_vehicle = add_vehicles = remove_vehicle = remove_vehicles = _read_only
+    apply_global_discount = set_prices = _commit_scenario = clear = _price_changed = _read_only
+    
+    def snapshot(self):
+        view = copy.copy(self)
+        view._owner = False
+        return view
+    
+    def close(self):
+        if self._owner:
+            super().close()
+
+# ==================== SNAPSHOT BINÁRIO (MMAP) ====================
+# Cabeçalho com o resumo pré-calculado, registos de largura fixa e tabela de textos
+SNAPSHOT_MAGIC = b'FROTASNP'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<8sIIQQQdd3Q3d')
+# O byte a seguir ao tipo marca os campos numéricos que eram int (bit 0 preço, 1 bateria,
+# 2 autonomia, 3 carga, 4 comprimento), para a leitura devolver 537 e não 537.0.
+# Era enchimento a zeros: snapshots antigos continuam válidos e são lidos como float
+SNAPSHOT_RECORD = struct.Struct('<qdqddddiiqbB6x')
+SNAPSHOT_STRING_LENGTH = struct.Struct('<I')
+
+def write_snapshot(filename, vehicles, count, summary):
+    strings = {}
+    intern_id = lambda text: strings.setdefault(text, len(strings))
+    nan = float('nan')
+    
+    records_offset = SNAPSHOT_HEADER.size
+    strings_offset = records_offset + count * SNAPSHOT_RECORD.size
+    buffer = bytearray(strings_offset)
+    offset = records_offset
+    written = 0
+    for vehicle in vehicles:
+        if written == count:
+            raise ValueError("A frota tem mais veículos do que o indicado")
+        code = vehicle_type_code(vehicle)
+        numbers = (vehicle.price, vehicle.battery_capacity if code == 1 else nan, vehicle.autonomy if code == 1 else nan,
+                   vehicle.load_capacity if code == 2 else nan, vehicle.length if code == 2 else nan)
+        ints = sum(1 << bit for bit, number in enumerate(numbers) if type(number) is int)
+        SNAPSHOT_RECORD.pack_into(
+            buffer, offset, vehicle.id or 0, numbers[0], vehicle.year, *numbers[1:],
+            intern_id(vehicle.brand), intern_id(vehicle.model), vehicle._registration_ts, code, ints)
+        offset += SNAPSHOT_RECORD.size
+        written += 1
+    if written != count:
+        raise ValueError("A frota tem menos veículos do que o indicado")
+    
+    for text in strings:
+        encoded = text.encode('utf-8')
+        buffer += SNAPSHOT_STRING_LENGTH.pack(len(encoded)) + encoded
+    
+    counts = [summary['by_type'].get(name, 0) for name in VEHICLE_TYPES]
+    values = [summary['value_by_type'].get(name, 0) for name in VEHICLE_TYPES]
+    SNAPSHOT_HEADER.pack_into(
+        buffer, 0, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, SNAPSHOT_RECORD.size, count,
+        strings_offset, len(buffer) - strings_offset,
+        summary['total_value'], summary['total_tax'], *counts, *values)
+    
+    # Uma única escrita do ficheiro completo
+    with open(filename, 'wb') as file:
+        file.write(buffer)
+
+class MappedFleet:
+    # Frota só de leitura sobre um snapshot mapeado em memória: abrir é quase
+    # instantâneo e cada registo só é descodificado quando é acedido
+    def __init__(self, filename):
+        self.filename = filename
+        self._owner = True
+        self._file = open(filename, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        header = SNAPSHOT_HEADER.unpack_from(self._map, 0)
+        magic, version, record_size, self._count, strings_offset, strings_length = header[:6]
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or record_size != SNAPSHOT_RECORD.size:
+            self.close()
+            raise ValueError(f"'{filename}' não é um snapshot de frota válido")
+        total_value, total_tax = header[6:8]
+        counts, values = header[8:11], header[11:14]
+        self._summary = {
+            'total': self._count,
+            'total_value': total_value,
+            'total_tax': total_tax,
+            'by_type': {name: n for name, n in zip(VEHICLE_TYPES, counts) if n},
+            'value_by_type': {name: v for name, v, n in zip(VEHICLE_TYPES, values, counts) if n}
+        }
+        
+        self._strings = []
+        offset, end = strings_offset, strings_offset + strings_length
+        while offset < end:
+            (length,) = SNAPSHOT_STRING_LENGTH.unpack_from(self._map, offset)
+            offset += SNAPSHOT_STRING_LENGTH.size
+            self._strings.append(sys.intern(self._map[offset:offset + length].decode('utf-8')))
+            offset += length
+    
+    def close(self):
+        if self._map is not None and self._owner:
+            self._map.close()
+            self._file.close()
+            self._map = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def __len__(self):
+        return self._count
+    
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("Índice fora do snapshot")
+        record = SNAPSHOT_RECORD.unpack_from(self._map, SNAPSHOT_HEADER.size + index * SNAPSHOT_RECORD.size)
+        vehicle_id, price, year, battery, autonomy, load, length, brand_id, model_id, timestamp, code, ints = record
+        if ints:
+            price, battery, autonomy, load, length = (int(number) if ints >> bit & 1 else number for bit, number in
+                                                      enumerate((price, battery, autonomy, load, length)))
+        brand, model = self._strings[brand_id], self._strings[model_id]
+        if code == 1:
+            vehicle = ElectricCar(brand, model, price, year, battery, autonomy)
+        elif code == 2:
+            vehicle = Truck(brand, model, price, year, load, length)
+        else:
+            vehicle = Vehicle(brand, model, price, year)
+        vehicle.id = vehicle_id
+        vehicle._registration_ts = timestamp
+        return vehicle
+    
+    def _id_at(self, index):
+        return struct.unpack_from('<q', self._map, SNAPSHOT_HEADER.size + index * SNAPSHOT_RECORD.size)[0]
+    
+    def iter_vehicles(self):
+        return (self[index] for index in range(self._count))
+    
+    __iter__ = iter_vehicles
+    
+    def window(self, start, stop):
+        return [self[index] for index in range(start, min(stop, self._count))]
+    
+    def get_vehicle(self, vehicle_id):
+        # Os registos estão por ordem crescente de id: pesquisa binária
+        index = bisect_left(range(self._count), vehicle_id, key=self._id_at)
+        if index < self._count and self._id_at(index) == vehicle_id:
+            return self[index]
+        return None
+    
+    def recent(self, count=5):
+        return [self[index] for index in range(max(self._count - count, 0), self._count)]
+    
+    def get_summary(self):
+        # Respondido a partir do cabeçalho, sem ler os registos
+        summary = dict(self._summary)
+        summary['by_type'] = dict(summary['by_type'])
+        summary['value_by_type'] = dict(summary['value_by_type'])
+        return summary
+    
+    def snapshot(self):
+        # O ficheiro mapeado não muda: o snapshot é uma vista que partilha o mapa e cujo
+        # close() não o fecha (quem fecha é quem abriu a frota)
+        view = copy.copy(self)
+        view._owner = False
+        return view
+    
+    def to_fleet(self, columnar=False):
+        fleet = Fleet(columnar=columnar)
+        fleet.add_vehicles(self.iter_vehicles())
+        return fleet
+    
+    export_inventory = Fleet.export_inventory
+
+# ==================== FROTA PARTICIONADA (PROCESSOS) ====================
+SHARD_CHUNK_SIZE = 10000  # veículos ou linhas por mensagem entre processos
+
+# Estado de cada processo de partição (ver _shard_start): a sua Fleet, a posição entre as
+# partições e os cortes abertos para exportação. O id global de um veículo é
+# (id local - 1) * partições + índice da partição + 1: a partição sai do próprio id e, com
+# inserções à vez, os ids globais são os mesmos que uma Fleet única daria
+_shard = None
+_shard_index = 0
+_shard_count = 1
+_shard_cursors = {}
+
+def _shard_start(index, count, columnar, rates):
+    global _shard, _shard_index, _shard_count
+    import signal
+    # Ctrl+C chega a todo o grupo de processos: quem termina as partições é o processo principal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Os processos escreveriam todos no mesmo ficheiro de registo: fica desligado
+    operation_log.sample_every = 0
+    _shard_rates(*rates)
+    _shard_index, _shard_count = index, count
+    _shard = Fleet(columnar=columnar)
+
+def _shard_rates(base_rate, multipliers, year_rates, rules):
+    # As regras adicionais chegam por pickle (validadas em TaxRules.add_rule)
+    tax_rules.base_rate = base_rate
+    tax_rules.multipliers = dict(multipliers)
+    tax_rules.year_rates = dict(year_rates)
+    tax_rules.rules = list(rules)
+    tax_rules._changed()
+
+def _shard_id(local_id):
+    return (local_id - 1) * _shard_count + _shard_index + 1
+
+def _shard_local(vehicle_id):
+    return (vehicle_id - 1) // _shard_count + 1
+
+def _shard_global(vehicle):
+    # Cópia desligada com o id global, para enviar ao processo principal
+    clone = vehicle.copy()
+    clone.id = _shard_id(vehicle.id)
+    return clone
+
+def _shard_add(vehicles):
+    # Os ids locais são consecutivos: basta devolver o primeiro
+    first = _shard._next_id
+    _shard.add_vehicles(vehicles)
+    return first
+
+def _shard_generate(count, seed):
+    _shard.add_vehicles(generate_vehicles(count, seed))
+
+def _shard_remove(vehicle_ids):
+    removed = _shard.remove_vehicles([_shard_local(vehicle_id) for vehicle_id in vehicle_ids])
+    return [_shard_global(vehicle) for vehicle in removed]
+
+def _shard_get(vehicle_id):
+    vehicle = _shard.get_vehicle(_shard_local(vehicle_id))
+    return _shard_global(vehicle) if vehicle is not None else None
+
+def _shard_summary(recompute):
+    return _shard.recompute_summary() if recompute else _shard.get_summary()
+
+def _shard_fetch(criteria, limit):
+    # Os primeiros limit resultados por ordem de id (o plano pode percorrer por outra ordem)
+    matches = _shard.query(**criteria)
+    key = attrgetter('id')
+    selected = sorted(matches, key=key) if limit is None else heapq.nsmallest(limit, matches, key=key)
+    return [_shard_global(vehicle) for vehicle in selected]
+
+def _shard_count_matches(criteria):
+    return _shard.query(**criteria).count()
+
+def _shard_explain(criteria):
+    return _shard.query(**criteria).explain()
+
+def _shard_scenario(percentage, vehicle_type, brand, min_year, commit):
+    scenario = _shard.scenario(percentage, vehicle_type, brand, min_year)
+    return scenario.commit() if commit else _shard._scenario_totals(scenario)
+
+def _shard_sorted(name, low, high, reverse, stop):
+    # Total do intervalo e os stop primeiros como (chave, id global, veículo)
+    ranked = _shard.sorted_by(name, low, high, reverse)
+    key = SORT_KEYS[name]
+    vehicles = [_shard_global(vehicle) for vehicle in ranked.window(0, stop)] if stop else []
+    return len(ranked), [(key(vehicle), vehicle.id, vehicle) for vehicle in vehicles]
+
+def _shard_open(token):
+    _shard_cursors[token] = _shard.snapshot()
+
+def _shard_row(vehicle):
+    # Linha de exportação preparada na partição; o processo principal só a escreve
+    return _shard_id(vehicle.id), vehicle_row(vehicle)
+
+def _shard_vehicle(vehicle):
+    # Os veículos do snapshot já são cópias: só falta o id global
+    vehicle.id = _shard_id(vehicle.id)
+    return vehicle.id, vehicle
+
+def _shard_next(token, size, rows):
+    cursor = _shard_cursors.get(token)
+    if cursor is None:
+        return []
+    if isinstance(cursor, FleetSnapshot):
+        cursor = _shard_cursors[token] = map(_shard_row if rows else _shard_vehicle, cursor.iter_vehicles())
+    chunk = list(islice(cursor, size))
+    if len(chunk) < size:
+        del _shard_cursors[token]
+    return chunk
+
+def _shard_close(token):
+    _shard_cursors.pop(token, None)
+
+def _shutdown_shards(pools):
+    for pool in pools:
+        pool.shutdown(cancel_futures=True)
+
+class ShardedFleet:
+    # Frota repartida por vários processos, cada um com a sua Fleet (uma partição). As
+    # operações são map-reduce: a mesma função corre em todas as partições ao mesmo tempo e
+    # os resultados juntam-se aqui. Sem depósito, os veículos são distribuídos à vez e os ids
+    # globais seguem a ordem de inserção; com depósito, vão todos para a partição desse
+    # depósito. Os veículos vivem nos processos: os objetos devolvidos são cópias.
+    def __init__(self, shards=None, columnar=False):
+        # multiprocessing e concurrent.futures só são importados por quem usa partições
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        self.shards = shards or os.cpu_count() or 1
+        # Um processo por partição, para o estado ficar sempre no mesmo processo; spawn
+        # arranca processos novos, sem herdar as threads e os locks deste
+        context = multiprocessing.get_context('spawn')
+        rates = self._rates()
+        self._pools = [ProcessPoolExecutor(1, context, _shard_start, (index, self.shards, columnar, rates))
+                       for index in range(self.shards)]
+        # Os processos terminam com close() ou quando a frota deixa de ser usada
+        self._finalizer = weakref.finalize(self, _shutdown_shards, self._pools)
+        self._sizes = [0] * self.shards
+        self._next = 0  # veículos já distribuídos à vez
+        self._tokens = iter(range(1, 1 << 62))  # next() é atómico: tokens únicos entre threads
+        self.version = 0
+        self.lock = ReadWriteLock()
+        self.metrics = OperationMetrics()
+        tax_rules.subscribe(self)
+    
+    def __len__(self):
+        return sum(self._sizes)
+    
+    def __enter__(self):
+        return self
     
-    def calculate_tax(self):
-        return self.price * 0.23
+    def __exit__(self, *exc_info):
+        self.close()
     
-    def __str__(self):
-        return f"{self.brand} {self.model} - €{self.price:.2f} (Ano: {self.year})"
+    def close(self):
+        self._finalizer()
     
-    def to_dict(self):
-        return {
-            'type': self.__class__.__name__,
-            'brand': self.brand,
-            'model': self.model,
-            'price': self.price,
-            'year': self.year,
-            'tax': self.calculate_tax(),
-            'registration_date': self.registration_date.strftime('%d-%m-%Y %H:%M:%S')
-        }
-
-class ElectricCar(Vehicle):
-    def __init__(self, brand, model, price, year, battery_capacity, autonomy):
-        super().__init__(brand, model, price, year)
-        self.battery_capacity = battery_capacity
-        self.autonomy = autonomy
+    @staticmethod
+    def _rates():
+        return tax_rules.base_rate, tax_rules.multipliers, tax_rules.year_rates, tax_rules.rules
     
-    def calculate_tax(self):
-        return super().calculate_tax() * 0.5
+    def depot_shard(self, depot):
+        # crc32 e não hash(), que muda de processo para processo
+        return zlib.crc32(str(depot).encode('utf-8')) % self.shards
     
-    def __str__(self):
-        return f"{self.brand} {self.model} (Elétrico) - €{self.price:.2f} - Bateria: {self.battery_capacity}kWh - Autonomia: {self.autonomy}km"
-
-class Truck(Vehicle):
-    def __init__(self, brand, model, price, year, load_capacity, length):
-        super().__init__(brand, model, price, year)
-        self.load_capacity = load_capacity
-        self.length = length
+    def _map(self, func, *args):
+        # Fase map: a mesma chamada em todas as partições, em paralelo; um resultado por partição
+        futures = [pool.submit(func, *args) for pool in self._pools]
+        return [future.result() for future in futures]
     
-    def calculate_tax(self):
-        return super().calculate_tax() * 1.3
+    @read_locked
+    def _read(self, func, *args):
+        return self._map(func, *args)
     
-    def __str__(self):
-        return f"{self.brand} {self.model} (Camião) - €{self.price:.2f} - Carga: {self.load_capacity}t - Comprimento: {self.length}m"
-
-# ==================== GESTÃO DA FROTA ====================
-class Fleet:
-    def __init__(self):
-        self.vehicles = []
+    # ---------- Inserção e remoção ----------
+    def _partition(self, vehicles, depot):
+        if depot is not None:
+            parts = [[] for _ in self._pools]
+            parts[self.depot_shard(depot)] = vehicles
+            return parts
+        start = self._next
+        self._next += len(vehicles)
+        return [vehicles[(shard - start) % self.shards::self.shards] for shard in range(self.shards)]
+    
+    def _settle(self, pending, added):
+        # Todas as partes são esperadas antes de propagar um erro: a anulação tem de as conhecer
+        error = None
+        for shard, part, future in pending:
+            try:
+                first = future.result()
+            except BaseException as e:
+                error = e
+                continue
+            for offset, vehicle in enumerate(part):
+                vehicle.id = (first + offset - 1) * self.shards + shard + 1
+            self._sizes[shard] += len(part)
+            added.extend(part)
+        if error is not None:
+            raise error
     
     @log_operation
-    def add_vehicle(self, vehicle):
-        self.vehicles.append(vehicle)
+    @write_locked
+    def add_vehicles(self, vehicles, depot=None):
+        # Por lotes: enquanto as partições inserem um lote, o seguinte já é repartido e enviado.
+        # Tudo ou nada, como Fleet.add_vehicles: se a fonte falhar a meio, o que as partições
+        # já inseriram é retirado
+        pending = []
+        added = []
+        start = self._next
+        try:
+            for chunk in _chunks(vehicles, SHARD_CHUNK_SIZE * self.shards):
+                if any(vehicle._fleet is not None for vehicle in chunk):
+                    raise ValueError("O veículo já pertence a uma frota")
+                submitted = [(shard, part, self._pools[shard].submit(_shard_add, part))
+                             for shard, part in enumerate(self._partition(chunk, depot)) if part]
+                settling, pending = pending, submitted
+                self._settle(settling, added)
+            settling, pending = pending, []
+            self._settle(settling, added)
+        except BaseException:
+            try:
+                self._settle(pending, added)
+            except BaseException:
+                pass
+            self.remove_vehicles([vehicle.id for vehicle in added])
+            for vehicle in added:
+                vehicle.id = None
+            self._next = start
+            raise
+        if added:
+            self.version += 1
+        return len(added)
+    
+    def add_vehicle(self, vehicle, depot=None):
+        self.add_vehicles([vehicle], depot)
         return True
     
     @log_operation
-    def remove_vehicle(self, index):
-        if 0 <= index < len(self.vehicles):
-            return self.vehicles.pop(index)
-        return None
+    @write_locked
+    def add_synthetic(self, count, seed=0):
+        # Cada partição gera a sua parte com uma seed própria: nenhum veículo atravessa processos
+        # (a frota é determinística para a mesma seed e o mesmo número de partições)
+        shares = [len(range((shard - self._next) % self.shards, count, self.shards)) for shard in range(self.shards)]
+        futures = [pool.submit(_shard_generate, share, seed * self.shards + shard) for shard, (pool, share) in enumerate(zip(self._pools, shares))]
+        for future in futures:
+            future.result()
+        self._next += count
+        self._sizes = [size + share for size, share in zip(self._sizes, shares)]
+        self.version += 1
+        return count
     
-    # Função lambda para aplicar desconto
-    def apply_global_discount(self, percentage):
-        adjust_price = lambda price, perc: price * (1 - perc/100)
-        for vehicle in self.vehicles:
-            vehicle.price = adjust_price(vehicle.price, percentage)
-        return len(self.vehicles)
+    @log_operation
+    @write_locked
+    def remove_vehicles(self, vehicle_ids):
+        groups = {}
+        for vehicle_id in vehicle_ids:
+            groups.setdefault((vehicle_id - 1) % self.shards, []).append(vehicle_id)
+        futures = [(shard, self._pools[shard].submit(_shard_remove, ids)) for shard, ids in groups.items()]
+        removed = []
+        for shard, future in futures:
+            vehicles = future.result()
+            self._sizes[shard] -= len(vehicles)
+            removed.extend(vehicles)
+        if removed:
+            self.version += 1
+        return removed
+    
+    @read_locked
+    def get_vehicle(self, vehicle_id):
+        return self._pools[(vehicle_id - 1) % self.shards].submit(_shard_get, vehicle_id).result()
+    
+    # Importação partilhada com Fleet (usa add_vehicles)
+    import_inventory = Fleet.import_inventory
+    
+    # ---------- Agregações ----------
+    @staticmethod
+    def _merge_summaries(summaries):
+        merged = {'total': 0, 'total_value': 0, 'total_tax': 0, 'by_type': {}, 'value_by_type': {}}
+        for summary in summaries:
+            for key in ('total', 'total_value', 'total_tax'):
+                merged[key] += summary[key]
+            for key in ('by_type', 'value_by_type'):
+                for vehicle_type, value in summary[key].items():
+                    merged[key][vehicle_type] = merged[key].get(vehicle_type, 0) + value
+        return merged
+    
+    def get_summary(self):
+        return self._merge_summaries(self._read(_shard_summary, False))
+    
+    def recompute_summary(self):
+        # Recalculado de raiz em cada partição, em paralelo
+        return self._merge_summaries(self._read(_shard_summary, True))
+    
+    def operation_metrics(self):
+        # Latência das operações desta frota (map-reduce completo, vista do processo principal)
+        return self.metrics.summary()
+    
+    # ---------- Filtros e consultas ----------
+    def query(self, brand=None, vehicle_type=None, search=None, prefix=False, **ranges):
+        # Critérios validados aqui, antes de chegarem às partições
+        query_criteria(brand, vehicle_type, search, **ranges)
+        return ShardedQuery(self, dict(brand=brand, vehicle_type=vehicle_type, search=search, prefix=prefix, **ranges))
     
-    # Compreensão de listas para filtros
     def filter_by_brand(self, brand):
-        return [v for v in self.vehicles if v.brand.lower() == brand.lower()]
+        return list(self.query(brand=brand).fetch())
     
     def filter_by_year(self, min_year):
-        return [v for v in self.vehicles if v.year >= min_year]
+        return list(self.query(year=(min_year, None)).fetch())
     
     def filter_by_type(self, vehicle_type):
-        return [v for v in self.vehicles if v.__class__.__name__ == vehicle_type]
+        return list(self.query(vehicle_type=vehicle_type).fetch())
     
-    # Exportação para ficheiros
-    def export_inventory(self, filename, format_type='csv'):
-        if not self.vehicles:
+    def search(self, text, prefix=False):
+        return list(self.query(search=text, prefix=prefix).fetch())
+    
+    def sorted_by(self, name, low=None, high=None, reverse=False):
+        if name not in SORT_KEYS:
+            raise ValueError(f"Ordenação desconhecida: {name}")
+        return ShardedSortedRange(self, name, low, high, reverse)
+    
+    # ---------- Cenários de preço ----------
+    def scenario(self, percentage, vehicle_type=None, brand=None, min_year=None, name=None):
+        return PricingScenario(self, percentage, vehicle_type, brand, min_year, name)
+    
+    def _scenario_totals(self, scenario, job=None):
+        totals = {}
+        for part in self._read(_shard_scenario, scenario.percentage, scenario.vehicle_type, scenario.brand, scenario.min_year, False):
+            for vehicle_type, (count, value, tax) in part.items():
+                old_count, old_value, old_tax = totals.get(vehicle_type, (0, 0, 0))
+                totals[vehicle_type] = (old_count + count, old_value + value, old_tax + tax)
+        return totals
+    
+    @write_locked
+    def _commit_scenario(self, scenario):
+        count = sum(self._map(_shard_scenario, scenario.percentage, scenario.vehicle_type, scenario.brand, scenario.min_year, True))
+        self.version += 1
+        return count
+    
+    @log_operation
+    @write_locked
+    def apply_global_discount(self, percentage):
+        self.scenario(percentage).commit()
+        return len(self)
+    
+    @write_locked
+    def _rates_changed(self):
+        self._map(_shard_rates, *self._rates())
+    
+    # ---------- Leitura completa e exportação ----------
+    @read_locked
+    def snapshot(self):
+        return ShardedSnapshot(self)
+    
+    def iter_vehicles(self):
+        # Por ordem de id global, a partir de um snapshot
+        with self.snapshot() as source:
+            yield from source.iter_vehicles()
+    
+    def export_inventory(self, filename, format_type='csv', job=None):
+        if not len(self):
             return False, "Não há veículos para exportar!"
+        if format_type not in EXPORT_FORMATS:
+            return False, "Formato não suportado!"
         
+        # As partições preparam as linhas em paralelo; aqui só se juntam por ordem de id e escrevem
         try:
-            if format_type == 'txt':
-                self._export_txt(filename)
-            elif format_type == 'csv':
-                self._export_csv(filename)
-            elif format_type == 'json':
-                self._export_json(filename)
-            else:
-                return False, "Formato não suportado!"
-            
+            with self.snapshot() as source:
+                rows = source.iter_rows()
+                if job is not None:
+                    rows = job.track(rows, len(source))
+                export_rows(rows, filename, format_type)
             return True, f"Inventário exportado para '{filename}'!"
         except Exception as e:
             return False, f"Erro ao exportar: {str(e)}"
+
+class ShardedQuery:
+    # Mesma interface que FleetQuery: cada partição planeia e filtra a sua parte
+    def __init__(self, fleet, criteria):
+        self.fleet = fleet
+        self.criteria = criteria
     
-    def _export_txt(self, filename):
-        with open(filename, 'w', encoding='utf-8') as file:
-            file.write("=" * 50 + "\n")
-            file.write("INVENTÁRIO DA FROTA\n")
-            file.write(f"Data de exportação: {datetime.datetime.now().strftime('%d-%m-%Y %H:%M:%S')}\n")
-            file.write("=" * 50 + "\n\n")
-            
-            for i, vehicle in enumerate(self.vehicles, 1):
-                file.write(f"VEÍCULO {i}:\n")
-                file.write(f"  Tipo: {vehicle.__class__.__name__}\n")
-                file.write(f"  Marca: {vehicle.brand}\n")
-                file.write(f"  Modelo: {vehicle.model}\n")
-                file.write(f"  Preço: €{vehicle.price:.2f}\n")
-                file.write(f"  Imposto: €{vehicle.calculate_tax():.2f}\n")
-                file.write(f"  Ano: {vehicle.year}\n")
-                
-                if isinstance(vehicle, ElectricCar):
-                    file.write(f"  Capacidade da bateria: {vehicle.battery_capacity}kWh\n")
-                    file.write(f"  Autonomia: {vehicle.autonomy}km\n")
-                elif isinstance(vehicle, Truck):
-                    file.write(f"  Capacidade de carga: {vehicle.load_capacity}t\n")
-                    file.write(f"  Comprimento: {vehicle.length}m\n")
-                
-                file.write("\n" + "-" * 40 + "\n\n")
-            
-            # Resumo
-            total_value = sum(v.price for v in self.vehicles)
-            total_tax = sum(v.calculate_tax() for v in self.vehicles)
-            
-            file.write("=" * 50 + "\n")
-            file.write("RESUMO DA FROTA\n")
-            file.write(f"Total de veículos: {len(self.vehicles)}\n")
-            file.write(f"Valor total da frota: €{total_value:.2f}\n")
-            file.write(f"Imposto total: €{total_tax:.2f}\n")
-            file.write("=" * 50 + "\n")
-    
-    def _export_csv(self, filename):
-        with open(filename, 'w', newline='', encoding='utf-8') as file:
-            fields = ['type', 'brand', 'model', 'price', 'tax', 'year', 
-                     'battery_capacity', 'autonomy', 'load_capacity', 
-                     'length', 'registration_date']
-            
-            writer = csv.DictWriter(file, fieldnames=fields)
-            writer.writeheader()
-            
-            for vehicle in self.vehicles:
-                data = vehicle.to_dict()
-                # Adicionar campos específicos
-                if isinstance(vehicle, ElectricCar):
-                    data['battery_capacity'] = vehicle.battery_capacity
-                    data['autonomy'] = vehicle.autonomy
-                elif isinstance(vehicle, Truck):
-                    data['load_capacity'] = vehicle.load_capacity
-                    data['length'] = vehicle.length
-                writer.writerow(data)
-    
-    def _export_json(self, filename):
-        data = {
-            'export_date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'total_vehicles': len(self.vehicles),
-            'total_value': sum(v.price for v in self.vehicles),
-            'total_tax': sum(v.calculate_tax() for v in self.vehicles),
-            'vehicles': [vehicle.to_dict() for vehicle in self.vehicles]
-        }
-        
-        with open(filename, 'w', encoding='utf-8') as file:
-            json.dump(data, file, indent=4, ensure_ascii=False)
+    def explain(self):
+        plans = self.fleet._read(_shard_explain, self.criteria)
+        return "\n".join(f"Partição {shard}:\n  " + plan.replace("\n", "\n  ") for shard, plan in enumerate(plans))
     
-    def get_summary(self):
-        if not self.vehicles:
-            return {'total': 0, 'total_value': 0, 'total_tax': 0, 'by_type': {}}
-        
-        summary = {
-            'total': len(self.vehicles),
-            'total_value': sum(v.price for v in self.vehicles),
-            'total_tax': sum(v.calculate_tax() for v in self.vehicles),
-            'by_type': {}
-        }
-        
-        for vehicle in self.vehicles:
-            vehicle_type = vehicle.__class__.__name__
-            summary['by_type'][vehicle_type] = summary['by_type'].get(vehicle_type, 0) + 1
-        
-        return summary
-
-# ==================== INTERFACE GRÁFICA ====================
-class FleetManagementApp(ctk.CTk):
-    def __init__(self):
-        super().__init__()
-        self.fleet = Fleet()
-        self.setup_ui()
-        self.load_sample_data()
-    
-    def setup_ui(self):
-        self.title("Sistema de Gestão de Frotas")
-        self.geometry("1200x700")
-        self.minsize(1000, 600)
-        
-        # Container principal
-        self.main_container = ctk.CTkFrame(self)
-        self.main_container.pack(fill="both", expand=True, padx=10, pady=10)
-        
-        self.create_sidebar()
-        self.create_main_content()
-        self.create_status_bar()
-        self.show_dashboard()
-    
-    def create_sidebar(self):
-        sidebar = ctk.CTkFrame(self.main_container, width=200, corner_radius=10)
-        sidebar.pack(side="left", fill="y", padx=(0, 10), pady=10)
-        
-        ctk.CTkLabel(sidebar, text="Gestor de Frotas", font=ctk.CTkFont(size=20, weight="bold")).pack(pady=(20, 30))
-        
-        # Botões de navegação (removida a opção Definições)
-        buttons = [
-            ("📊 Dashboard", self.show_dashboard),
-            ("🚗 Adicionar Veículo", self.show_add_vehicle),
-            ("🗑️ Remover Veículo", self.show_remove_vehicle),
-            ("💰 Aplicar Desconto", self.show_discount),
-            ("🔍 Filtrar", self.show_inventory),  # Alterado de "📋 Inventário" para "🔍 Filtrar"
-            ("📤 Exportar", self.show_export)
-        ]
-        
-        for text, command in buttons:
-            btn = ctk.CTkButton(sidebar, text=text, command=command, height=40, corner_radius=8)
-            btn.pack(pady=5, padx=10)
+    def __iter__(self):
+        return iter(self.fetch())
     
-    def create_main_content(self):
-        self.content_frame = ctk.CTkFrame(self.main_container, corner_radius=10)
-        self.content_frame.pack(side="right", fill="both", expand=True, pady=10)
-        
-        self.content_title = ctk.CTkLabel(self.content_frame, text="Dashboard", font=ctk.CTkFont(size=24, weight="bold"))
-        self.content_title.pack(pady=(20, 10))
-        
-        self.content_container = ctk.CTkScrollableFrame(self.content_frame, corner_radius=10)
-        self.content_container.pack(fill="both", expand=True, padx=20, pady=(0, 20))
+    def fetch(self, offset=0, limit=None):
+        # Cada partição devolve os seus primeiros offset + limit por ordem de id; a junção mantém a ordem
+        stop = None if limit is None else offset + limit
+        parts = self.fleet._read(_shard_fetch, self.criteria, stop)
+        return islice(heapq.merge(*parts, key=attrgetter('id')), offset, stop)
     
-    def create_status_bar(self):
-        status_bar = ctk.CTkFrame(self, height=30)
-        status_bar.pack(side="bottom", fill="x")
-        
-        self.status_label = ctk.CTkLabel(status_bar, text="Pronto", font=ctk.CTkFont(size=12))
-        self.status_label.pack(side="left", padx=10)
-        
-        self.update_status()
+    def count(self):
+        return sum(self.fleet._read(_shard_count_matches, self.criteria))
+
+class ShardedSortedRange:
+    # Os stop primeiros de cada partição chegam para a janela [start, stop) da frota inteira
+    def __init__(self, fleet, name, low=None, high=None, reverse=False):
+        self.fleet = fleet
+        self.arguments = (name, low, high, reverse)
+        self.reverse = reverse
     
-    def update_status(self, message="Pronto"):
-        self.status_label.configure(text=message)
+    def __len__(self):
+        return sum(count for count, _ in self.fleet._read(_shard_sorted, *self.arguments, 0))
     
-    def clear_content(self):
-        for widget in self.content_container.winfo_children():
-            widget.destroy()
+    def __iter__(self):
+        return iter(self.window(0, len(self)))
     
-    # ==================== VIEWS ====================
+    def window(self, start, stop):
+        parts = self.fleet._read(_shard_sorted, *self.arguments, stop)
+        merged = heapq.merge(*(ranked for _, ranked in parts), key=itemgetter(0, 1), reverse=self.reverse)
+        return [vehicle for _, _, vehicle in islice(merged, start, stop)]
+
+class ShardedSnapshot:
+    # Corte consistente de todas as partições: pedido sob o lock da frota e executado em cada
+    # partição pela ordem das operações recebidas. Lê-se uma vez, por ordem de id global;
+    # close() liberta os cortes que não foram lidos até ao fim
+    def __init__(self, fleet):
+        # Guarda a frota (e não só os processos): enquanto o snapshot é lido, as partições vivem
+        self.fleet = fleet
+        self._size = len(fleet)
+        self._token = next(fleet._tokens)
+        for pool in self.fleet._pools:
+            pool.submit(_shard_open, self._token)
     
-    def show_dashboard(self):
-        self.clear_content()
-        self.content_title.configure(text="Dashboard")
-        
-        summary = self.fleet.get_summary()
-        
-        # Estatísticas
-        stats_frame = ctk.CTkFrame(self.content_container, corner_radius=10)
-        stats_frame.pack(fill="x", pady=(0, 20))
-        
-        stats_data = [
-            ("Total Veículos", f"{summary['total']}", "#4CC9F0"),
-            ("Valor Total", f"€{summary['total_value']:,.2f}", "#4361EE"),
-            ("Imposto Total", f"€{summary['total_tax']:,.2f}", "#3A0CA3"),
-            ("Valor Médio", f"€{summary['total_value']/max(summary['total'], 1):,.2f}", "#7209B7")
-        ]
-        
-        row_frame = ctk.CTkFrame(stats_frame)
-        row_frame.pack(fill="x", padx=20, pady=20)
-        
-        for title, value, color in stats_data:
-            card = ctk.CTkFrame(row_frame, height=100, corner_radius=10)
-            card.pack(side="left", padx=10, expand=True, fill="both")
-            
-            ctk.CTkLabel(card, text=title, font=ctk.CTkFont(size=14)).pack(pady=(15, 5))
-            ctk.CTkLabel(card, text=value, font=ctk.CTkFont(size=22, weight="bold"), text_color=color).pack(pady=5)
-        
-        # Distribuição por tipo
-        if summary['by_type']:
-            dist_frame = ctk.CTkFrame(self.content_container, corner_radius=10)
-            dist_frame.pack(fill="x", pady=(0, 20))
-            
-            ctk.CTkLabel(dist_frame, text="Distribuição por Tipo", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=(15, 10))
-            
-            for vehicle_type, count in summary['by_type'].items():
-                type_frame = ctk.CTkFrame(dist_frame, height=40)
-                type_frame.pack(fill="x", padx=20, pady=5)
-                
-                ctk.CTkLabel(type_frame, text=vehicle_type, font=ctk.CTkFont(size=14)).pack(side="left", padx=10)
-                
-                progress = (count / summary['total']) * 100
-                progress_bar = ctk.CTkProgressBar(type_frame)
-                progress_bar.pack(side="left", padx=10, expand=True, fill="x")
-                progress_bar.set(progress / 100)
-                
-                ctk.CTkLabel(type_frame, text=f"{count} ({progress:.1f}%)", font=ctk.CTkFont(size=14)).pack(side="right", padx=10)
-        
-        # Veículos recentes
-        if self.fleet.vehicles:
-            recent_frame = ctk.CTkFrame(self.content_container, corner_radius=10)
-            recent_frame.pack(fill="x")
-            
-            ctk.CTkLabel(recent_frame, text="Veículos Recentes", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=(15, 10))
-            
-            for vehicle in self.fleet.vehicles[-5:]:
-                vehicle_frame = ctk.CTkFrame(recent_frame, height=50)
-                vehicle_frame.pack(fill="x", padx=20, pady=5)
-                
-                ctk.CTkLabel(vehicle_frame, text=str(vehicle), font=ctk.CTkFont(size=12)).pack(side="left", padx=10)
-                ctk.CTkLabel(vehicle_frame, text=f"Imposto: €{vehicle.calculate_tax():.2f}", font=ctk.CTkFont(size=12)).pack(side="right", padx=10)
+    def __len__(self):
+        return self._size
     
-    def show_add_vehicle(self):
-        self.clear_content()
-        self.content_title.configure(text="Adicionar Veículo")
-        
-        form_frame = ctk.CTkFrame(self.content_container, corner_radius=10)
-        form_frame.pack(fill="x", pady=(0, 20), padx=20)
-        
-        # Tipo de veículo
-        ctk.CTkLabel(form_frame, text="Tipo de Veículo:", font=ctk.CTkFont(size=14)).grid(row=0, column=0, padx=20, pady=20, sticky="w")
-        self.vehicle_type = ctk.StringVar(value="Vehicle")
-        type_combo = ctk.CTkComboBox(form_frame, values=["Vehicle", "ElectricCar", "Truck"], variable=self.vehicle_type, command=self.update_form_fields, width=200)
-        type_combo.grid(row=0, column=1, padx=20, pady=20, sticky="w")
-        
-        # Campos comuns
-        self.entries = {}
-        fields = [("Marca:", "brand"), ("Modelo:", "model"), ("Preço (€):", "price"), ("Ano:", "year")]
-        
-        for i, (label, key) in enumerate(fields, 1):
-            ctk.CTkLabel(form_frame, text=label, font=ctk.CTkFont(size=14)).grid(row=i, column=0, padx=20, pady=10, sticky="w")
-            entry = ctk.CTkEntry(form_frame, width=200)
-            entry.grid(row=i, column=1, padx=20, pady=10, sticky="w")
-            self.entries[key] = entry
-        
-        # Campos específicos
-        self.special_frame = ctk.CTkFrame(form_frame, corner_radius=10)
-        self.special_frame.grid(row=5, column=0, columnspan=2, padx=20, pady=20, sticky="ew")
-        
-        # Botões
-        button_frame = ctk.CTkFrame(form_frame)
-        button_frame.grid(row=6, column=0, columnspan=2, pady=30)
-        
-        ctk.CTkButton(button_frame, text="Adicionar Veículo", command=self.add_vehicle, height=40, width=150).pack(side="left", padx=20)
-        ctk.CTkButton(button_frame, text="Limpar Formulário", command=self.clear_form, height=40, width=150, fg_color="gray").pack(side="left", padx=20)
-        
-        self.update_form_fields()
+    def __enter__(self):
+        return self
     
-    def update_form_fields(self):
-        for widget in self.special_frame.winfo_children():
-            widget.destroy()
-        
-        vehicle_type = self.vehicle_type.get()
-        
-        if vehicle_type == "ElectricCar":
-            fields = [("Capacidade Bateria (kWh):", "battery"), ("Autonomia (km):", "autonomy")]
-        elif vehicle_type == "Truck":
-            fields = [("Capacidade Carga (ton):", "load"), ("Comprimento (m):", "length")]
-        else:
-            return
-        
-        for i, (label, key) in enumerate(fields):
-            ctk.CTkLabel(self.special_frame, text=label, font=ctk.CTkFont(size=14)).grid(row=i, column=0, padx=20, pady=10, sticky="w")
-            entry = ctk.CTkEntry(self.special_frame, width=200)
-            entry.grid(row=i, column=1, padx=20, pady=10, sticky="w")
-            self.entries[key] = entry
+    def __exit__(self, *exc_info):
+        self.close()
     
-    def add_vehicle(self):
-        try:
-            brand = self.entries['brand'].get()
-            model = self.entries['model'].get()
-            price = float(self.entries['price'].get())
-            year = int(self.entries['year'].get())
-            
-            vehicle_type = self.vehicle_type.get()
-            
-            if vehicle_type == "Vehicle":
-                vehicle = Vehicle(brand, model, price, year)
-            elif vehicle_type == "ElectricCar":
-                battery = float(self.entries['battery'].get())
-                autonomy = float(self.entries['autonomy'].get())
-                vehicle = ElectricCar(brand, model, price, year, battery, autonomy)
-            elif vehicle_type == "Truck":
-                load = float(self.entries['load'].get())
-                length = float(self.entries['length'].get())
-                vehicle = Truck(brand, model, price, year, load, length)
-            
-            self.fleet.add_vehicle(vehicle)
-            messagebox.showinfo("Sucesso", f"Veículo adicionado!\n\n{vehicle}")
-            self.clear_form()
-            self.update_status(f"Adicionado {brand} {model}")
-            self.show_dashboard()
-            
-        except ValueError:
-            messagebox.showerror("Erro", "Por favor, introduza valores válidos!")
-        except Exception as e:
-            messagebox.showerror("Erro", f"Ocorreu um erro: {str(e)}")
+    def _stream(self, rows):
+        def shard_items(pool):
+            pending = pool.submit(_shard_next, self._token, SHARD_CHUNK_SIZE, rows)
+            while True:
+                chunk = pending.result()
+                if len(chunk) < SHARD_CHUNK_SIZE:
+                    yield from chunk
+                    return
+                # O bloco seguinte é pedido já: a partição prepara-o enquanto este é escrito
+                pending = pool.submit(_shard_next, self._token, SHARD_CHUNK_SIZE, rows)
+                yield from chunk
+        
+        return map(itemgetter(1), heapq.merge(*map(shard_items, self.fleet._pools), key=itemgetter(0)))
     
-    def clear_form(self):
-        for entry in self.entries.values():
-            entry.delete(0, 'end')
+    def iter_vehicles(self):
+        return self._stream(False)
     
-    def show_remove_vehicle(self):
-        self.clear_content()
-        self.content_title.configure(text="Remover Veículo")
-        
-        if not self.fleet.vehicles:
-            ctk.CTkLabel(self.content_container, text="Não há veículos na frota!", font=ctk.CTkFont(size=16)).pack(pady=50)
-            return
-        
-        # Tabela de veículos
-        list_frame = ctk.CTkFrame(self.content_container, corner_radius=10)
-        list_frame.pack(fill="both", expand=True, padx=20, pady=20)
-        
-        columns = ("#", "Tipo", "Marca", "Modelo", "Preço", "Ano", "Imposto")
-        self.tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=15)
-        
-        for col in columns:
-            self.tree.heading(col, text=col)
-            self.tree.column(col, width=100)
-        
-        self.tree.column("#", width=50)
-        self.tree.column("Tipo", width=100)
-        self.tree.column("Marca", width=100)
-        self.tree.column("Modelo", width=150)
-        
-        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        self.tree.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-        
-        # Preencher tabela
-        for i, vehicle in enumerate(self.fleet.vehicles, 1):
-            self.tree.insert("", "end", values=(
-                i,
-                vehicle.__class__.__name__,
-                vehicle.brand,
-                vehicle.model,
-                f"€{vehicle.price:.2f}",
-                vehicle.year,
-                f"€{vehicle.calculate_tax():.2f}"
-            ))
-        
-        # Botão de remover
-        button_frame = ctk.CTkFrame(self.content_container)
-        button_frame.pack(pady=20)
-        
-        ctk.CTkButton(button_frame, text="Remover Veículo Selecionado", command=self.remove_selected, height=40, width=200, fg_color="#D32F2F").pack(pady=10)
+    def iter_rows(self):
+        return self._stream(True)
     
-    def remove_selected(self):
-        selection = self.tree.selection()
-        if not selection:
-            messagebox.showwarning("Aviso", "Selecione um veículo para remover!")
-            return
-        
-        item = self.tree.item(selection[0])
-        index = int(item['values'][0]) - 1
-        
-        if messagebox.askyesno("Confirmar", f"Remover {item['values'][2]} {item['values'][3]}?"):
-            vehicle = self.fleet.remove_vehicle(index)
-            if vehicle:
-                self.tree.delete(selection[0])
-                self.update_status(f"Removido {vehicle.brand} {vehicle.model}")
-                messagebox.showinfo("Sucesso", "Veículo removido!")
-                
-                # Renumerar itens
-                for i, item_id in enumerate(self.tree.get_children(), 1):
-                    values = list(self.tree.item(item_id, 'values'))
-                    values[0] = i
-                    self.tree.item(item_id, values=values)
-    
-    def show_discount(self):
-        self.clear_content()
-        self.content_title.configure(text="Aplicar Desconto/Imposto")
-        
-        discount_frame = ctk.CTkFrame(self.content_container, corner_radius=10)
-        discount_frame.pack(fill="x", padx=100, pady=50)
-        
-        ctk.CTkLabel(discount_frame, text="Aplicar percentagem de desconto (positivo) ou imposto (negativo) a todos os veículos", font=ctk.CTkFont(size=14), wraplength=400).pack(pady=(30, 20))
-        
-        input_frame = ctk.CTkFrame(discount_frame)
-        input_frame.pack(pady=20)
-        
-        ctk.CTkLabel(input_frame, text="Percentagem:", font=ctk.CTkFont(size=14)).pack(side="left", padx=(0, 10))
-        self.percentage_entry = ctk.CTkEntry(input_frame, width=100)
-        self.percentage_entry.pack(side="left")
-        ctk.CTkLabel(input_frame, text="%", font=ctk.CTkFont(size=14)).pack(side="left", padx=(5, 20))
-        
-        ctk.CTkLabel(discount_frame, text="Exemplo: +10% = 10% desconto, -5% = 5% imposto extra", font=ctk.CTkFont(size=12), text_color="gray").pack(pady=10)
-        
-        button_frame = ctk.CTkFrame(discount_frame)
-        button_frame.pack(pady=30)
-        
-        ctk.CTkButton(button_frame, text="Aplicar a Todos", command=self.apply_discount, height=40, width=200).pack(side="left", padx=10)
-        ctk.CTkButton(button_frame, text="Pré-visualizar", command=self.preview_discount, height=40, width=200, fg_color="gray").pack(side="left", padx=10)
+    def close(self):
+        for pool in self.fleet._pools:
+            pool.submit(_shard_close, self._token)
+
+# ==================== TAREFAS EM SEGUNDO PLANO ====================
+class JobCancelled(BaseException):
+    # BaseException, como asyncio.CancelledError: não é apanhada por "except Exception"
+    pass
+
+class Job:
+    def __init__(self, description=""):
+        self.description = description
+        self.progress = 0.0
+        self.future = None
+        self._cancel = threading.Event()
     
-    def apply_discount(self):
-        try:
-            percentage = float(self.percentage_entry.get())
-            
-            if messagebox.askyesno("Confirmar", f"Aplicar {percentage}% {'desconto' if percentage > 0 else 'imposto extra'} a todos os veículos?"):
-                count = self.fleet.apply_global_discount(percentage)
-                messagebox.showinfo("Sucesso", f"Aplicado a {count} veículos!")
-                self.update_status(f"Aplicado {percentage}% a todos")
-                self.show_dashboard()
-        except ValueError:
-            messagebox.showerror("Erro", "Introduza uma percentagem válida!")
-    
-    def preview_discount(self):
-        try:
-            percentage = float(self.percentage_entry.get())
-            
-            preview_window = ctk.CTkToplevel(self)
-            preview_window.title("Pré-visualização de Desconto")
-            preview_window.geometry("600x400")
-            
-            columns = ("Marca", "Modelo", "Preço Antigo", "Preço Novo", "Variação")
-            tree = ttk.Treeview(preview_window, columns=columns, show="headings", height=15)
-            
-            for col in columns:
-                tree.heading(col, text=col)
-                tree.column(col, width=120)
-            
-            scrollbar = ttk.Scrollbar(preview_window, orient="vertical", command=tree.yview)
-            tree.configure(yscrollcommand=scrollbar.set)
-            tree.pack(side="left", fill="both", expand=True, padx=10, pady=10)
-            scrollbar.pack(side="right", fill="y")
-            
-            # Calcular novos preços
-            adjust_price = lambda price, perc: price * (1 - perc/100)
-            
-            for vehicle in self.fleet.vehicles:
-                new_price = adjust_price(vehicle.price, percentage)
-                change = new_price - vehicle.price
-                change_percent = (change / vehicle.price) * 100 if vehicle.price != 0 else 0
-                
-                tree.insert("", "end", values=(
-                    vehicle.brand,
-                    vehicle.model,
-                    f"€{vehicle.price:.2f}",
-                    f"€{new_price:.2f}",
-                    f"{change_percent:+.1f}%"
-                ))
-            
-            # Resumo
-            total_old = sum(v.price for v in self.fleet.vehicles)
-            total_new = sum(adjust_price(v.price, percentage) for v in self.fleet.vehicles)
-            
-            ctk.CTkLabel(preview_window, text=f"Variação total: €{total_new - total_old:+.2f}", font=ctk.CTkFont(size=14, weight="bold")).pack(pady=10)
-            
-        except ValueError:
-            messagebox.showerror("Erro", "Introduza uma percentagem válida!")
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
     
-    def show_inventory(self):
-        self.clear_content()
-        self.content_title.configure(text="Filtrar")  # Alterado de "Inventário" para "Filtrar"
-        
-        inventory_frame = ctk.CTkFrame(self.content_container, corner_radius=10)
-        inventory_frame.pack(fill="both", expand=True, padx=20, pady=20)
-        
-        # Filtros
-        filters_frame = ctk.CTkFrame(inventory_frame)
-        filters_frame.pack(fill="x", pady=20, padx=20)
-        
-        # Filtro por marca
-        brand_frame = ctk.CTkFrame(filters_frame)
-        brand_frame.pack(fill="x", pady=10)
-        ctk.CTkLabel(brand_frame, text="Filtrar por Marca:", font=ctk.CTkFont(size=14)).pack(side="left", padx=(0, 10))
-        self.brand_filter = ctk.CTkEntry(brand_frame, width=150)
-        self.brand_filter.pack(side="left")
-        ctk.CTkButton(brand_frame, text="Filtrar", command=lambda: self.filter_inventory('brand'), width=80).pack(side="left", padx=10)
-        
-        # Filtro por ano
-        year_frame = ctk.CTkFrame(filters_frame)
-        year_frame.pack(fill="x", pady=10)
-        ctk.CTkLabel(year_frame, text="Filtrar por Ano (mínimo):", font=ctk.CTkFont(size=14)).pack(side="left", padx=(0, 10))
-        self.year_filter = ctk.CTkEntry(year_frame, width=150)
-        self.year_filter.pack(side="left")
-        ctk.CTkButton(year_frame, text="Filtrar", command=lambda: self.filter_inventory('year'), width=80).pack(side="left", padx=10)
-        
-        # Filtro por tipo
-        type_frame = ctk.CTkFrame(filters_frame)
-        type_frame.pack(fill="x", pady=10)
-        ctk.CTkLabel(type_frame, text="Filtrar por Tipo:", font=ctk.CTkFont(size=14)).pack(side="left", padx=(0, 10))
-        self.type_filter = ctk.StringVar(value="Todos")
-        ctk.CTkComboBox(type_frame, values=["Todos", "Vehicle", "ElectricCar", "Truck"], variable=self.type_filter, width=150).pack(side="left")
-        ctk.CTkButton(type_frame, text="Filtrar", command=lambda: self.filter_inventory('type'), width=80).pack(side="left", padx=10)
-        
-        ctk.CTkButton(filters_frame, text="Mostrar Todos", command=lambda: self.filter_inventory('all'), width=150, fg_color="gray").pack(pady=20)
-        
-        # Tabela de resultados
-        self.results_frame = ctk.CTkFrame(inventory_frame)
-        self.results_frame.pack(fill="both", expand=True, pady=20, padx=20)
-        
-        self.filter_inventory('all')
+    def cancel(self):
+        self._cancel.set()
+        if self.future is not None:
+            self.future.cancel()
     
-    def filter_inventory(self, filter_type):
-        for widget in self.results_frame.winfo_children():
-            widget.destroy()
-        
-        if filter_type == 'brand':
-            brand = self.brand_filter.get()
-            vehicles = self.fleet.filter_by_brand(brand) if brand else self.fleet.vehicles
-        elif filter_type == 'year':
-            try:
-                year = int(self.year_filter.get())
-                vehicles = self.fleet.filter_by_year(year)
-            except:
-                vehicles = self.fleet.vehicles
-        elif filter_type == 'type':
-            vehicle_type = self.type_filter.get()
-            vehicles = self.fleet.vehicles if vehicle_type == "Todos" else self.fleet.filter_by_type(vehicle_type)
-        else:
-            vehicles = self.fleet.vehicles
-        
-        if not vehicles:
-            ctk.CTkLabel(self.results_frame, text="Nenhum veículo encontrado", font=ctk.CTkFont(size=14)).pack(pady=50)
-            return
-        
-        # Criar tabela
-        columns = ("Marca", "Modelo", "Tipo", "Preço", "Ano", "Imposto")
-        tree = ttk.Treeview(self.results_frame, columns=columns, show="headings", height=10)
-        
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=100)
-        
-        tree.column("Marca", width=120)
-        tree.column("Modelo", width=150)
-        
-        scrollbar = ttk.Scrollbar(self.results_frame, orient="vertical", command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
-        tree.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-        
-        for vehicle in vehicles:
-            tree.insert("", "end", values=(
-                vehicle.brand,
-                vehicle.model,
-                vehicle.__class__.__name__,
-                f"€{vehicle.price:.2f}",
-                vehicle.year,
-                f"€{vehicle.calculate_tax():.2f}"
-            ))
-        
-        ctk.CTkLabel(self.results_frame, text=f"Encontrados {len(vehicles)} veículo(s)", font=ctk.CTkFont(size=12)).pack(pady=10)
+    def done(self):
+        return self.future.done()
     
-    def show_export(self):
-        self.clear_content()
-        self.content_title.configure(text="Exportar Inventário")
-        
-        export_frame = ctk.CTkFrame(self.content_container, corner_radius=10)
-        export_frame.pack(fill="both", expand=True, padx=50, pady=50)
-        
-        # Formato
-        ctk.CTkLabel(export_frame, text="Formato de Exportação:", font=ctk.CTkFont(size=16)).pack(pady=(0, 20))
-        
-        self.export_format = ctk.StringVar(value="csv")
-        formats = [("CSV (Excel)", "csv"), ("Texto (legível)", "txt"), ("JSON (estruturado)", "json")]
-        
-        for text, value in formats:
-            ctk.CTkRadioButton(export_frame, text=text, variable=self.export_format, value=value).pack(pady=5)
-        
-        # Nome do ficheiro
-        file_frame = ctk.CTkFrame(export_frame)
-        file_frame.pack(pady=20)
-        
-        ctk.CTkLabel(file_frame, text="Nome do Ficheiro:", font=ctk.CTkFont(size=14)).pack(side="left", padx=(0, 10))
-        self.filename = ctk.CTkEntry(file_frame, width=200)
-        self.filename.pack(side="left")
-        self.filename.insert(0, f"frota_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}")
-        
-        # Botões
-        button_frame = ctk.CTkFrame(export_frame)
-        button_frame.pack(pady=30)
-        
-        ctk.CTkButton(button_frame, text="Exportar", command=self.export_data, height=40, width=200).pack(pady=10)
-        ctk.CTkButton(button_frame, text="Pré-visualizar", command=self.preview_export, height=40, width=200, fg_color="gray").pack(pady=10)
+    def result(self):
+        return self.future.result()
     
-    def export_data(self):
-        filename = self.filename.get()
-        format_type = self.export_format.get()
-        
-        if not filename.endswith(f'.{format_type}'):
-            filename += f'.{format_type}'
-        
-        success, message = self.fleet.export_inventory(filename, format_type)
-        
-        if success:
-            messagebox.showinfo("Sucesso", message)
-            self.update_status(f"Exportado para {filename}")
-        else:
-            messagebox.showerror("Erro", message)
+    def track(self, iterable, total, step=1000):
+        # Atualiza o progresso e verifica o cancelamento a cada step itens
+        for count, item in enumerate(iterable, 1):
+            if count % step == 0:
+                if self._cancel.is_set():
+                    raise JobCancelled()
+                self.progress = count / total if total else 0.0
+            yield item
+        self.progress = 1.0
+
+class JobScheduler:
+    # func recebe o Job como primeiro argumento e corre numa thread do pool
+    def __init__(self, max_workers=2):
+        # concurrent.futures (e o logging que arrasta) só é importado por quem usa tarefas
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="frota-job")
     
-    def preview_export(self):
-        if not self.fleet.vehicles:
-            messagebox.showinfo("Info", "Não há veículos para pré-visualizar!")
-            return
-        
-        preview_window = ctk.CTkToplevel(self)
-        preview_window.title("Pré-visualização de Exportação")
-        preview_window.geometry("800x500")
-        
-        text_widget = ctk.CTkTextbox(preview_window, font=ctk.CTkFont(family="Courier", size=12))
-        text_widget.pack(fill="both", expand=True, padx=10, pady=10)
-        
-        preview_text = "PRÉ-VISUALIZAÇÃO DE EXPORTAÇÃO\n"
-        preview_text += "=" * 50 + "\n\n"
-        
-        for i, vehicle in enumerate(self.fleet.vehicles[:5], 1):
-            preview_text += f"Veículo {i}:\n"
-            preview_text += f"  Tipo: {vehicle.__class__.__name__}\n"
-            preview_text += f"  Marca: {vehicle.brand}\n"
-            preview_text += f"  Modelo: {vehicle.model}\n"
-            preview_text += f"  Preço: €{vehicle.price:.2f}\n"
-            preview_text += f"  Imposto: €{vehicle.calculate_tax():.2f}\n"
-            preview_text += f"  Ano: {vehicle.year}\n"
-            
-            if isinstance(vehicle, ElectricCar):
-                preview_text += f"  Bateria: {vehicle.battery_capacity}kWh\n"
-                preview_text += f"  Autonomia: {vehicle.autonomy}km\n"
-            elif isinstance(vehicle, Truck):
-                preview_text += f"  Carga: {vehicle.load_capacity}t\n"
-                preview_text += f"  Comprimento: {vehicle.length}m\n"
-            
-            preview_text += "\n"
-        
-        if len(self.fleet.vehicles) > 5:
-            preview_text += f"... e mais {len(self.fleet.vehicles) - 5} veículos\n\n"
-        
-        summary = self.fleet.get_summary()
-        preview_text += "=" * 50 + "\n"
-        preview_text += f"Total veículos: {summary['total']}\n"
-        preview_text += f"Valor total: €{summary['total_value']:.2f}\n"
-        preview_text += f"Imposto total: €{summary['total_tax']:.2f}\n"
-        preview_text += "=" * 50
-        
-        text_widget.insert("1.0", preview_text)
-        text_widget.configure(state="disabled")
+    def submit(self, description, func, *args):
+        job = Job(description)
+        job.future = self._executor.submit(self._run, job, func, args)
+        return job
     
-    def load_sample_data(self):
-        self.fleet.vehicles.clear()
-        
-        sample_vehicles = [
-            Vehicle("Toyota", "Corolla", 25000, 2022),
-            Vehicle("Ford", "Focus", 22000, 2021),
-            ElectricCar("Tesla", "Model 3", 45000, 2023, 75, 500),
-            ElectricCar("Nissan", "Leaf", 32000, 2022, 40, 270),
-            Truck("Mercedes", "Actros", 85000, 2020, 18, 12.5),
-            Truck("Volvo", "FH", 92000, 2021, 20, 13.2),
-            Vehicle("BMW", "3 Series", 42000, 2023),
-            ElectricCar("Hyundai", "Kona Electric", 38000, 2022, 64, 450),
-            Vehicle("Volkswagen", "Golf", 28000, 2021),
-            Truck("MAN", "TGX", 78000, 2019, 16, 11.8)
-        ]
-        
-        for vehicle in sample_vehicles:
-            self.fleet.add_vehicle(vehicle)
-        
-        self.update_status("Dados de exemplo carregados")
-        messagebox.showinfo("Dados de Exemplo", "10 veículos de exemplo carregados com sucesso!")
+    @staticmethod
+    def _run(job, func, args):
+        if job.cancelled:
+            raise JobCancelled()
+        return func(job, *args)
+    
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 # ==================== EXERCÍCIOS DE PREPARAÇÃO ====================
 def preparation_exercises():
@@ -812,11 +3598,279 @@ def preparation_exercises():
     
     print("=" * 50)
 
-# ==================== EXECUÇÃO PRINCIPAL ====================
-def main():
-    preparation_exercises()
-    app = FleetManagementApp()
+# ==================== LINHA DE COMANDOS ====================
+def apply_rate_options(options):
+    # "Truck=0.3" muda a taxa do tipo; "Truck:2019=0.25" só a desse ano
+    multipliers = {}
+    year_rates = {}
+    for option in options:
+        target, _, rate = option.partition('=')
+        vehicle_type, _, year = target.partition(':')
+        if vehicle_type not in VEHICLE_TYPES or not rate:
+            raise ValueError(f"Taxa inválida: {option} (use TIPO=TAXA ou TIPO:ANO=TAXA)")
+        if year:
+            year_rates[(vehicle_type, int(year))] = float(rate)
+        else:
+            multipliers[vehicle_type] = float(rate) / tax_rules.base_rate
+    tax_rules.configure(multipliers=multipliers, year_rates=year_rates)
+
+def open_fleet(args):
+    # Origem dos veículos: snapshot binário, ficheiro exportado, gerador sintético ou base SQLite
+    if args.snapshot:
+        return MappedFleet(args.snapshot)
+    if args.shards:
+        return _sharded_fleet(args)
+    if args.input:
+        fleet = Fleet(columnar=args.columnar)
+        success, message, report = fleet.import_inventory(args.input, args.input_format)
+        if not success:
+            raise ValueError(message)
+        print(message, file=sys.stderr)
+        return fleet
+    if args.synthetic is not None:
+        fleet = Fleet(columnar=args.columnar)
+        fleet.add_vehicles(generate_vehicles(args.synthetic, args.seed))
+        return fleet
+    if args.db:
+        return SQLiteFleet(args.db)
+    # Sem origem: frota vazia em memória (não cria nenhuma base no disco)
+    return Fleet(columnar=args.columnar)
+
+def _sharded_fleet(args):
+    # Frota repartida por args.shards processos; só para ficheiros exportados e dados sintéticos
+    if args.input is None and args.synthetic is None:
+        raise ValueError("--shards só é suportado com --input ou --synthetic")
+    fleet = ShardedFleet(args.shards, columnar=args.columnar)
+    if args.synthetic is not None:
+        fleet.add_synthetic(args.synthetic, args.seed)
+        return fleet
+    success, message, report = fleet.import_inventory(args.input, args.input_format)
+    if not success:
+        fleet.close()
+        raise ValueError(message)
+    print(message, file=sys.stderr)
+    return fleet
+
+def _editable(fleet):
+    # O snapshot binário é só de leitura: filtros e descontos trabalham sobre uma cópia
+    return fleet.to_fleet() if isinstance(fleet, MappedFleet) else fleet
+
+def _filtered(fleet, args):
+    # Todos os critérios numa só consulta; o planeador escolhe por onde começar
+    query = fleet.query(brand=args.brand, vehicle_type=args.type, search=args.search, prefix=args.prefix,
+                        year=(args.year, args.max_year), price=(args.min_price, args.max_price),
+                        autonomy=(args.min_autonomy, None), load_capacity=(args.min_load, None))
+    if args.explain:
+        print(query.explain(), file=sys.stderr)
+    return list(query.fetch(args.offset, args.limit))
+
+def command_summary(args):
+    summary = open_fleet(args).get_summary()
+    if args.json:
+        print(json.dumps(summary, indent=4))
+        return 0
+    print(f"Total de veículos: {summary['total']}")
+    print(f"Valor total da frota: €{summary['total_value']:,.2f}")
+    print(f"Imposto total: €{summary['total_tax']:,.2f}")
+    for vehicle_type, count in summary['by_type'].items():
+        print(f"  {vehicle_type}: {count} (€{summary['value_by_type'][vehicle_type]:,.2f})")
+    return 0
+
+def command_export(args):
+    format_type = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+    success, message = open_fleet(args).export_inventory(args.output, format_type)
+    print(message, file=sys.stdout if success else sys.stderr)
+    return 0 if success else 1
+
+def command_import(args):
+    success, message, report = SQLiteFleet(args.db).import_inventory(args.file, args.format)
+    print(message, file=sys.stdout if success else sys.stderr)
+    for number, error in report['errors']:
+        print(f"  linha {number}: {error}", file=sys.stderr)
+    return 0 if success else 1
+
+def command_filter(args):
+    vehicles = _filtered(_editable(open_fleet(args)), args)
+    if args.output:
+        format_type = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+        export_vehicles(vehicles, args.output, format_type)
+        print(f"{len(vehicles)} veículo(s) exportado(s) para '{args.output}'")
+        return 0
+    for vehicle in vehicles:
+        print(vehicle)
+    print(f"Encontrados {len(vehicles)} veículo(s)", file=sys.stderr)
+    return 0
+
+def command_top(args):
+    # Os maiores (ou, com --ascending, os menores) valores da chave escolhida
+    ranked = _editable(open_fleet(args)).sorted_by(args.by, args.min, args.max, reverse=not args.ascending)
+    vehicles = ranked.window(0, args.count)
+    for vehicle in vehicles:
+        value = SORT_KEYS[args.by](vehicle)
+        print(f"{value:>12}  {vehicle}" if args.by == 'year' else f"{value:>12,.2f}  {vehicle}")
+    print(f"{len(vehicles)} de {len(ranked)} veículo(s)", file=sys.stderr)
+    return 0
+
+def _print_scenario(totals):
+    print(f"{totals['name']:>10}: {totals['count']} veículos, valor €{totals['old_value']:,.2f} -> €{totals['new_value']:,.2f} "
+          f"({totals['delta_value']:+,.2f}), imposto {totals['delta_tax']:+,.2f}")
+
+def command_discount(args):
+    fleet = _editable(open_fleet(args))
+    scenario = fleet.scenario(args.percentage, args.type, args.brand, args.year)
+    if args.dry_run:
+        _print_scenario(scenario.totals())
+        return 0
+    count = scenario.commit()
+    print(f"Aplicado {args.percentage}% a {count} veículos")
+    if args.output:
+        format_type = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+        success, message = fleet.export_inventory(args.output, format_type)
+        print(message, file=sys.stdout if success else sys.stderr)
+        return 0 if success else 1
+    return 0
+
+def command_scenarios(args):
+    # Vários cenários comparados sobre a mesma frota, sem a alterar
+    fleet = _editable(open_fleet(args))
+    scenarios = [fleet.scenario(percentage, args.type, args.brand, args.year) for percentage in args.percentages]
+    for totals in compare_scenarios(scenarios):
+        _print_scenario(totals)
+    return 0
+
+def command_gui(args):
+    # customtkinter só é importado aqui: os restantes comandos não precisam de Tk nem de ecrã
+    sys.modules.setdefault("main", sys.modules[__name__])
+    from gui import FleetManagementApp
+    fleet = SQLiteFleet(args.db) if args.db else None
+    app = FleetManagementApp(fleet, args.sample)
     app.mainloop()
+    return 0
+
+def command_serve(args):
+    # Serviço HTTP/JSON (service.py): asyncio só é importado aqui
+    sys.modules.setdefault("main", sys.modules[__name__])
+    import asyncio
+    from service import run_service
+    fleet = _editable(open_fleet(args))
+    try:
+        asyncio.run(run_service(fleet, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def command_exercises(args):
+    preparation_exercises()
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description="Sistema de Gestão de Frotas")
+    parser.add_argument("--log", action="store_true", help=f"registar as operações em {LOG_FILE} (ou no ficheiro de {LOG_ENV})")
+    commands = parser.add_subparsers(dest="command")
+    
+    # Opções comuns: de onde vêm os veículos
+    source = argparse.ArgumentParser(add_help=False)
+    origin = source.add_mutually_exclusive_group()
+    origin.add_argument("--db", help="base SQLite (sem origem a frota começa vazia, em memória)")
+    origin.add_argument("--snapshot", help="snapshot binário criado por save_snapshot")
+    origin.add_argument("--input", help="ficheiro exportado (csv, json ou jsonl)")
+    origin.add_argument("--synthetic", type=int, metavar="N", help="N veículos sintéticos")
+    source.add_argument("--input-format", choices=('csv', 'json', 'jsonl'))
+    source.add_argument("--seed", type=int, default=0)
+    source.add_argument("--columnar", action="store_true")
+    source.add_argument("--shards", type=int, metavar="N", help="repartir a frota por N processos (com --input ou --synthetic)")
+    source.add_argument("--rate", action="append", default=[], metavar="TIPO[:ANO]=TAXA",
+                        help="taxa de imposto por tipo (e opcionalmente por ano); pode repetir-se")
+    
+    summary = commands.add_parser("summary", parents=[source], help="resumo da frota")
+    summary.add_argument("--json", action="store_true")
+    summary.set_defaults(func=command_summary)
+    
+    export = commands.add_parser("export", parents=[source], help="exportar o inventário")
+    export.add_argument("output")
+    export.add_argument("--format", choices=EXPORT_FORMATS)
+    export.set_defaults(func=command_export)
+    
+    import_ = commands.add_parser("import", help="importar um ficheiro para a base SQLite")
+    import_.add_argument("file")
+    import_.add_argument("--format", choices=('csv', 'json', 'jsonl'))
+    import_.add_argument("--db", default="frota.db")
+    import_.set_defaults(func=command_import)
+    
+    filter_ = commands.add_parser("filter", parents=[source], help="filtrar por texto, marca, tipo e intervalos (combinados)")
+    filter_.add_argument("--search", help="texto em marca/modelo (substring, sem acentos)")
+    filter_.add_argument("--prefix", action="store_true", help="--search só no início das palavras")
+    filter_.add_argument("--brand")
+    filter_.add_argument("--year", type=int, help="ano mínimo")
+    filter_.add_argument("--max-year", type=int)
+    filter_.add_argument("--type", choices=VEHICLE_TYPES)
+    filter_.add_argument("--min-price", type=float)
+    filter_.add_argument("--max-price", type=float)
+    filter_.add_argument("--min-autonomy", type=float, help="só ElectricCar")
+    filter_.add_argument("--min-load", type=float, help="só Truck")
+    filter_.add_argument("--offset", type=int, default=0)
+    filter_.add_argument("--limit", type=int)
+    filter_.add_argument("--explain", action="store_true", help="mostrar o plano escolhido")
+    filter_.add_argument("--output")
+    filter_.add_argument("--format", choices=EXPORT_FORMATS)
+    filter_.set_defaults(func=command_filter)
+    
+    top = commands.add_parser("top", parents=[source], help="veículos ordenados por preço, ano ou imposto")
+    top.add_argument("--by", choices=tuple(SORT_KEYS), default="price")
+    top.add_argument("--count", type=int, default=10)
+    top.add_argument("--ascending", action="store_true", help="do menor para o maior (p. ex. os mais antigos)")
+    top.add_argument("--min", type=float, help="só valores a partir de")
+    top.add_argument("--max", type=float, help="só valores até")
+    top.set_defaults(func=command_top)
+    
+    # Âmbito dos cenários de preço
+    scope = argparse.ArgumentParser(add_help=False)
+    scope.add_argument("--brand")
+    scope.add_argument("--year", type=int, help="ano mínimo")
+    scope.add_argument("--type", choices=VEHICLE_TYPES)
+    
+    discount = commands.add_parser("discount", parents=[source, scope], help="aplicar desconto (positivo) ou imposto (negativo)")
+    discount.add_argument("percentage", type=float)
+    discount.add_argument("--dry-run", action="store_true", help="só mostrar o efeito, sem aplicar")
+    discount.add_argument("--output")
+    discount.add_argument("--format", choices=EXPORT_FORMATS)
+    discount.set_defaults(func=command_discount)
+    
+    scenarios = commands.add_parser("scenarios", parents=[source, scope], help="comparar várias percentagens sem alterar a frota")
+    scenarios.add_argument("percentages", type=float, nargs="+")
+    scenarios.set_defaults(func=command_scenarios)
+    
+    gui = commands.add_parser("gui", help="interface gráfica (comando por omissão)")
+    gui.add_argument("--db", help="usar uma base SQLite em vez da frota em memória")
+    gui.add_argument("--sample", type=int, metavar="N", help="carregar N veículos sintéticos")
+    gui.set_defaults(func=command_gui)
+    
+    serve = commands.add_parser("serve", parents=[source], help="serviço HTTP/JSON local para vários clientes")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080, help="0 escolhe uma porta livre")
+    serve.set_defaults(func=command_serve)
+    
+    exercises = commands.add_parser("exercises", help="exercícios de preparação (escreve frota_exportada.txt)")
+    exercises.set_defaults(func=command_exercises)
+    return parser
+
+# ==================== EXECUÇÃO PRINCIPAL ====================
+def main(argv=None):
+    parser = build_parser()
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = parser.parse_args(argv)
+    if args.command is None:
+        # Sem comando abre a interface, mantendo as opções gerais (--log, ...)
+        args = parser.parse_args([*argv, "gui"])
+    if args.log:
+        operation_log.sample_every = 1
+    try:
+        if getattr(args, 'rate', None):
+            apply_rate_options(args.rate)
+        return args.func(args)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
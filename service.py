@@ -0,0 +1,438 @@
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from main import (SQLiteFleet, EXPORT_FORMATS, EXPORT_BUFFER_SIZE, EXPORT_CHUNK_SIZE, VEHICLE_TYPES, JobScheduler,
+                  JobCancelled, LatencyHistogram, OperationMetrics, vehicle_row, vehicle_from_row,
+                  write_rows, write_vehicles)
+
+# Serviço HTTP/JSON local sobre uma Fleet (ou SQLiteFleet), para várias ferramentas ao mesmo tempo.
+# O ciclo de eventos só lê pedidos e escreve respostas: todo o acesso à frota corre num pool de
+# threads (sob o lock da frota) e as exportações em tarefas do JobScheduler.
+#
+#   GET    /summary                 resumo da frota
+#   GET    /metrics                 latência por operação e por pedido, atraso do ciclo de eventos
+#   GET    /vehicles?brand=&type=&search=&prefix=1&year=&max_year=&min_price=&max_price=
+#                    &min_autonomy=&min_load=&offset=&limit=
+#                                   veículos em JSON Lines (em chunks), pelos critérios de "main.py filter"
+#   POST   /vehicles                um veículo, uma lista ou JSON Lines (application/x-ndjson)
+#   GET    /vehicles/<id>           um veículo
+#   DELETE /vehicles/<id>           remover um veículo
+#   POST   /discount                {"percentage": 10, "type": ..., "brand": ..., "year": ..., "dry_run": true}
+#   GET    /export?format=csv       inventário completo (csv, txt, json ou jsonl) em chunks
+
+# ==================== CONFIGURAÇÃO ====================
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8080
+SERVICE_WORKERS = 4
+SERVICE_EXPORT_WORKERS = 2
+SERVICE_MAX_BODY = 16 << 20
+SERVICE_STREAM_QUEUE = 8  # blocos de exportação à espera de um cliente lento
+SERVICE_LAG_INTERVAL = 0.01
+
+HTTP_STATUS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+JSON_LINES = 'application/x-ndjson'
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'txt': 'text/plain; charset=utf-8',
+                        'json': 'application/json', 'jsonl': JSON_LINES}
+# Parâmetro do pedido -> (intervalo da consulta, limite inferior 0 ou superior 1)
+QUERY_RANGE_PARAMS = {'year': ('year', 0), 'max_year': ('year', 1), 'min_price': ('price', 0),
+                      'max_price': ('price', 1), 'min_autonomy': ('autonomy', 0), 'min_load': ('load_capacity', 0)}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class StreamAborted(Exception):
+    # Erro depois de enviados os cabeçalhos: já não há resposta possível, só fechar a ligação
+    pass
+
+def vehicle_json(vehicle):
+    return {'id': vehicle.id, **vehicle_row(vehicle)}
+
+def _number(params, name, convert=float):
+    try:
+        return convert(params[name])
+    except ValueError:
+        raise HTTPError(400, f"Valor inválido para {name}: {params[name]}")
+
+def _vehicle_type(vehicle_type):
+    if vehicle_type is not None and vehicle_type not in VEHICLE_TYPES:
+        raise HTTPError(400, f"Tipo desconhecido: {vehicle_type}")
+    return vehicle_type
+
+def query_arguments(params):
+    arguments = {'brand': params.get('brand'), 'vehicle_type': _vehicle_type(params.get('type')),
+                 'search': params.get('search'), 'prefix': params.get('prefix') in ('1', 'true')}
+    for param, (name, side) in QUERY_RANGE_PARAMS.items():
+        if param in params:
+            bounds = list(arguments.get(name, (None, None)))
+            bounds[side] = _number(params, param, int if name == 'year' else float)
+            arguments[name] = tuple(bounds)
+    return arguments
+
+def parse_vehicles(body, content_type):
+    try:
+        if content_type.startswith(JSON_LINES):
+            records = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            records = json.loads(body)
+            if not isinstance(records, list):
+                records = [records]
+    except ValueError as e:
+        raise HTTPError(400, f"JSON inválido: {e}")
+    # Tudo ou nada: os veículos só são adicionados se todos forem válidos
+    vehicles = []
+    for number, record in enumerate(records, 1):
+        try:
+            vehicles.append(vehicle_from_row(record))
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            raise HTTPError(400, f"Veículo {number}: {type(e).__name__}: {e}")
+    return vehicles
+
+# ==================== EXPORTAÇÃO EM CHUNKS ====================
+class ChunkStream:
+    # Objeto com write() para write_vehicles, usado numa thread: junta o texto em blocos de
+    # EXPORT_BUFFER_SIZE e entrega-os ao ciclo de eventos por uma fila limitada, por isso
+    # um cliente lento trava a exportação em vez de a acumular em memória
+    def __init__(self, loop):
+        self.queue = asyncio.Queue(SERVICE_STREAM_QUEUE)
+        self.job = None  # definido pela tarefa que escreve
+        self._loop = loop
+        self._parts = []
+        self._size = 0
+    
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= EXPORT_BUFFER_SIZE:
+            self.flush()
+    
+    def flush(self):
+        if self._parts:
+            data = "".join(self._parts).encode('utf-8')
+            self._parts = []
+            self._size = 0
+            self._put(data)
+    
+    def finish(self, error=None):
+        # None no fim do fluxo; uma exceção se a exportação falhou
+        if not self.job.cancelled:
+            self._put(error)
+    
+    def _put(self, item):
+        if self.job.cancelled:
+            raise JobCancelled()
+        asyncio.run_coroutine_threadsafe(self.queue.put(item), self._loop).result()
+    
+    def discard(self):
+        # Chamado no ciclo de eventos depois de cancelar: liberta uma escrita bloqueada na fila cheia
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+# ==================== SERVIÇO ====================
+class FleetService:
+    def __init__(self, fleet, workers=SERVICE_WORKERS):
+        self.fleet = fleet
+        # A ligação SQLite pertence a uma só thread: as operações sobre a base ficam em série
+        workers = 1 if isinstance(fleet, SQLiteFleet) else workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frota-service")
+        self.jobs = JobScheduler(max_workers=SERVICE_EXPORT_WORKERS)
+        self.metrics = OperationMetrics()
+        self.loop_lag = LatencyHistogram()
+        self.server = None
+        self._watcher = None
+        self._routes = {
+            'summary': {'GET': self.get_summary},
+            'metrics': {'GET': self.get_metrics},
+            'vehicles': {'GET': self.list_vehicles, 'POST': self.add_vehicles},
+            'vehicle': {'GET': self.get_vehicle, 'DELETE': self.remove_vehicle},
+            'discount': {'POST': self.discount},
+            'export': {'GET': self.export},
+        }
+    
+    async def start(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self._watcher = asyncio.create_task(self._watch_loop())
+        return self.server.sockets[0].getsockname()[:2]
+    
+    async def close(self):
+        self._watcher.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+        self.jobs.shutdown()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _call(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+    
+    async def _watch_loop(self):
+        # Atraso do ciclo de eventos: quanto um sleep curto demora a mais do que o pedido
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(SERVICE_LAG_INTERVAL)
+            self.loop_lag.record((loop.time() - start - SERVICE_LAG_INTERVAL) * 1e9)
+    
+    # ---------- HTTP/1.1 ----------
+    async def handle(self, reader, writer):
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    # O corpo pode ter ficado por ler: responder e fechar a ligação
+                    await self._respond(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, params, headers, body, keep_alive = request
+                start = time.perf_counter_ns()
+                name = method
+                try:
+                    handler, name, args = self._route(method, path)
+                    status, payload = await handler(writer, params, headers, body, keep_alive, *args)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except (KeyError, ValueError) as e:
+                    status, payload = 400, {'error': str(e)}
+                except (StreamAborted, ConnectionError):
+                    break
+                except Exception as e:
+                    status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+                if status is not None:
+                    await self._respond(writer, status, payload, keep_alive)
+                self.metrics.record(name, time.perf_counter_ns() - start)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(400, "Cabeçalhos demasiado grandes")
+        lines = head.decode('latin-1').split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            raise HTTPError(400, f"Pedido inválido: {lines[0]}")
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+        if 'transfer-encoding' in headers:
+            raise HTTPError(411, "Corpo em chunks não suportado: indique Content-Length")
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HTTPError(400, "Content-Length inválido")
+        if length > SERVICE_MAX_BODY:
+            raise HTTPError(413, f"Corpo maior do que {SERVICE_MAX_BODY} bytes")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        return method, url.path, dict(parse_qsl(url.query)), headers, body, keep_alive
+    
+    def _route(self, method, path):
+        parts = path.strip('/').split('/')
+        args = ()
+        if len(parts) == 2 and parts[0] == 'vehicles' and parts[1].isdigit():
+            parts, args = ['vehicle'], (int(parts[1]),)
+        methods = self._routes.get(parts[0]) if len(parts) == 1 else None
+        if methods is None:
+            raise HTTPError(404, f"Recurso desconhecido: {path}")
+        if method not in methods:
+            raise HTTPError(405, f"Método {method} não suportado em {path}")
+        route = f"{method} /{parts[0]}" if not args else f"{method} /vehicles/<id>"
+        return methods[method], route, args
+    
+    @staticmethod
+    def _head(status, content_type, keep_alive, length=None):
+        lines = [f"HTTP/1.1 {status} {HTTP_STATUS[status]}", f"Content-Type: {content_type}",
+                 f"Content-Length: {length}" if length is not None else "Transfer-Encoding: chunked",
+                 "Connection: keep-alive" if keep_alive else "Connection: close"]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+    
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write(self._head(status, 'application/json', keep_alive, len(body)) + body)
+        await writer.drain()
+    
+    def _start_stream(self, writer, content_type, keep_alive):
+        writer.write(self._head(200, content_type, keep_alive))
+    
+    async def _send_chunk(self, writer, data):
+        if data:
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            await writer.drain()
+    
+    async def _end_stream(self, writer):
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+    
+    # ---------- Leituras ----------
+    def _reading(self, func, *args):
+        # Corre no pool: vê um estado entre duas escritas completas
+        lock = self.fleet.lock
+        lock.acquire_read()
+        try:
+            return func(*args)
+        finally:
+            lock.release_read()
+    
+    async def get_summary(self, writer, params, headers, body, keep_alive):
+        return 200, await self._call(self.fleet.get_summary)
+    
+    async def get_metrics(self, writer, params, headers, body, keep_alive):
+        operations = await self._call(self.fleet.operation_metrics)
+        return 200, {'operations': operations, 'requests': self.metrics.summary(), 'loop_lag': self.loop_lag.summary()}
+    
+    def _vehicle(self, vehicle_id):
+        vehicle = self.fleet.get_vehicle(vehicle_id)
+        return vehicle_json(vehicle) if vehicle is not None else None
+    
+    async def get_vehicle(self, writer, params, headers, body, keep_alive, vehicle_id):
+        vehicle = await self._call(self._reading, self._vehicle, vehicle_id)
+        if vehicle is None:
+            raise HTTPError(404, f"Veículo {vehicle_id} não encontrado")
+        return 200, vehicle
+    
+    def _select(self, arguments, offset, limit):
+        return list(self.fleet.query(**arguments).fetch(offset, limit))
+    
+    def _encode(self, vehicles):
+        dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+        return "".join(dumps(vehicle_json(vehicle)) + "\n" for vehicle in vehicles).encode('utf-8')
+    
+    async def list_vehicles(self, writer, params, headers, body, keep_alive):
+        arguments = query_arguments(params)
+        offset = _number(params, 'offset', int) if 'offset' in params else 0
+        limit = _number(params, 'limit', int) if 'limit' in params else None
+        # A seleção é feita de uma vez sob o lock (os índices mudam com as escritas); as linhas
+        # são serializadas em blocos, cada um sob o lock, e enviadas à medida
+        vehicles = await self._call(self._reading, self._select, arguments, offset, limit)
+        self._start_stream(writer, JSON_LINES, keep_alive)
+        try:
+            for start in range(0, len(vehicles), EXPORT_CHUNK_SIZE):
+                chunk = vehicles[start:start + EXPORT_CHUNK_SIZE]
+                await self._send_chunk(writer, await self._call(self._reading, self._encode, chunk))
+            await self._end_stream(writer)
+        except Exception as e:
+            raise StreamAborted(e)
+        return None, None
+    
+    def _export(self, job, stream, format_type):
+        stream.job = job
+        # Lida de um snapshot: o inventário exportado é o de um único instante
+        try:
+            with self.fleet.snapshot() as source:
+                if hasattr(source, 'iter_rows'):
+                    # Frota particionada: as linhas chegam já preparadas pelas partições
+                    write_rows(stream, job.track(source.iter_rows(), len(source)), format_type)
+                else:
+                    write_vehicles(stream, job.track(source.iter_vehicles(), len(source)), format_type)
+            stream.flush()
+        except Exception as e:
+            stream.finish(e)
+            return
+        stream.finish()
+    
+    async def export(self, writer, params, headers, body, keep_alive):
+        format_type = params.get('format', 'jsonl')
+        if format_type not in EXPORT_FORMATS:
+            raise HTTPError(400, f"Formato não suportado: {format_type}")
+        stream = ChunkStream(asyncio.get_running_loop())
+        job = self.jobs.submit(f"Exportação {format_type}", self._export, stream, format_type)
+        try:
+            # Os cabeçalhos só seguem com o primeiro bloco, para um erro inicial ainda ter resposta
+            item = await stream.queue.get()
+            if isinstance(item, Exception):
+                raise item
+            self._start_stream(writer, EXPORT_CONTENT_TYPES[format_type], keep_alive)
+            try:
+                while isinstance(item, bytes):
+                    await self._send_chunk(writer, item)
+                    item = await stream.queue.get()
+                if item is not None:
+                    raise item
+                await self._end_stream(writer)
+            except Exception as e:
+                raise StreamAborted(e)
+        finally:
+            if not job.done():
+                job.cancel()
+                stream.discard()
+        return None, None
+    
+    # ---------- Escritas ----------
+    def _writing(self, func, *args):
+        lock = self.fleet.lock
+        lock.acquire_write()
+        try:
+            return func(*args)
+        finally:
+            lock.release_write()
+    
+    def _add(self, vehicles):
+        if len(vehicles) == 1:
+            self.fleet.add_vehicle(vehicles[0])
+        elif vehicles:
+            self.fleet.add_vehicles(vehicles)
+        return {'added': len(vehicles), 'ids': [vehicle.id for vehicle in vehicles]}
+    
+    async def add_vehicles(self, writer, params, headers, body, keep_alive):
+        vehicles = await self._call(parse_vehicles, body, headers.get('content-type', 'application/json'))
+        # add_vehicles é uma só escrita: os leitores veem o lote inteiro ou nada dele
+        return 201, await self._call(self._add, vehicles)
+    
+    async def remove_vehicle(self, writer, params, headers, body, keep_alive, vehicle_id):
+        removed = await self._call(self.fleet.remove_vehicles, [vehicle_id])
+        if not removed:
+            raise HTTPError(404, f"Veículo {vehicle_id} não encontrado")
+        return 200, {'removed': [vehicle_id]}
+    
+    def _discount(self, percentage, vehicle_type, brand, min_year, dry_run):
+        scenario = self.fleet.scenario(percentage, vehicle_type, brand, min_year)
+        if dry_run:
+            return scenario.totals()
+        return {'count': scenario.commit()}
+    
+    async def discount(self, writer, params, headers, body, keep_alive):
+        try:
+            options = json.loads(body or b"{}")
+        except ValueError as e:
+            raise HTTPError(400, f"JSON inválido: {e}")
+        if not isinstance(options, dict) or not isinstance(options.get('percentage'), (int, float)):
+            raise HTTPError(400, "Indique a percentagem: {\"percentage\": 10}")
+        year = options.get('year')
+        if year is not None and not isinstance(year, int):
+            raise HTTPError(400, f"Ano inválido: {year}")
+        arguments = (options['percentage'], _vehicle_type(options.get('type')), options.get('brand'), year,
+                     bool(options.get('dry_run')))
+        # Cenário e commit na mesma escrita: nenhuma outra alteração pelo meio
+        run = self._reading if arguments[-1] else self._writing
+        return 200, await self._call(run, self._discount, *arguments)
+
+async def run_service(fleet, host=SERVICE_HOST, port=SERVICE_PORT):
+    service = FleetService(fleet)
+    host, port = await service.start(host, port)
+    count = await service._call(len, fleet)
+    # A primeira linha indica o endereço (benchmark.py service lê-a quando usa --port 0)
+    print(f"A servir {count} veículos em http://{host}:{port}", flush=True)
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.close()
+
+if __name__ == "__main__":
+    sys.exit("Use: python main.py serve [--synthetic N | --db frota.db | ...] [--port 8080]")
@@ -0,0 +1,1405 @@
+import asyncio
+import datetime
+import io
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+import benchmark
+import main
+import service
+from main import (EXPORT_CHUNK_SIZE, EXPORT_FORMATS, FLEET_EVENTS, IMPORT_BATCH_SIZE, SHARD_CHUNK_SIZE,
+                  SYNTHETIC_BRANDS, ElectricCar, Fleet, JobCancelled, JobScheduler, LatencyHistogram, MappedFleet,
+                  OperationLog, ShardedFleet, SQLiteFleet, Truck, Vehicle, compare_scenarios, export_synthetic,
+                  export_vehicles, generate_vehicles, normalize_text, operation_log, tax_rules, vehicle_row)
+
+# Mesmo com FROTA_LOG definido, os testes não escrevem o registo de operações
+operation_log.sample_every = 0
+
+def assert_same_summary(test, summary, expected):
+    # Contagens exatas; somas de preços e impostos só até ao arredondamento
+    test.assertEqual(summary['total'], expected['total'])
+    test.assertEqual(summary['by_type'], expected['by_type'])
+    test.assertAlmostEqual(summary['total_value'], expected['total_value'], places=4)
+    test.assertAlmostEqual(summary['total_tax'], expected['total_tax'], places=4)
+    test.assertEqual(summary['value_by_type'].keys(), expected['value_by_type'].keys())
+    for vehicle_type, value in expected['value_by_type'].items():
+        test.assertAlmostEqual(summary['value_by_type'][vehicle_type], value, places=4)
+
+def vehicle_rows(vehicles):
+    return [(vehicle.id, vehicle.__class__.__name__, vehicle.brand, vehicle.model, vehicle.price, vehicle.year)
+            for vehicle in vehicles]
+
+def without_export_date(data):
+    # A data de exportação (txt e json) muda de segundo para segundo
+    return re.sub(rb'(Data de exporta\xc3\xa7\xc3\xa3o|"export_date"): [^\n]*', rb'\1', data)
+
+class ColumnarTests(unittest.TestCase):
+    def fleets(self):
+        fleets = [Fleet(), Fleet(columnar=True)]
+        for fleet in fleets:
+            fleet.add_vehicles(generate_vehicles(2000, 21))
+        return fleets
+
+    def test_columnar_matches_object_fleet(self):
+        plain, columnar = self.fleets()
+        self.assertIsNotNone(columnar.columns)
+        for fleet in (plain, columnar):
+            fleet.remove_vehicles(range(1, 2000, 7))
+            fleet.apply_global_discount(12.5)
+            fleet.get_vehicle(10).price = 12345.67
+        assert_same_summary(self, columnar.get_summary(), plain.get_summary())
+        self.assertEqual(vehicle_rows(columnar.iter_vehicles()), vehicle_rows(plain.iter_vehicles()))
+        self.assertEqual(vehicle_rows(columnar.window(100, 150)), vehicle_rows(plain.window(100, 150)))
+        self.assertEqual(columnar.get_vehicle(10).calculate_tax(), plain.get_vehicle(10).calculate_tax())
+        self.assertTrue(columnar.verify_summary())
+
+    def test_columnar_exports_match(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        contents = []
+        for name, fleet in zip(("objetos", "colunas"), self.fleets()):
+            filename = os.path.join(directory.name, f"{name}.csv")
+            self.assertTrue(fleet.export_inventory(filename, 'csv')[0])
+            with open(filename, 'rb') as file:
+                contents.append(file.read())
+        self.assertEqual(contents[0], contents[1])
+
+class IndexTests(unittest.TestCase):
+    def test_filters_match_brute_force(self):
+        for columnar in (False, True):
+            fleet = Fleet(columnar=columnar)
+            fleet.add_vehicles(generate_vehicles(3000, 22))
+            fleet.remove_vehicles(range(1, 3000, 5))
+            fleet.add_vehicles(generate_vehicles(200, 23))
+            vehicles = list(fleet.iter_vehicles())
+            ids = lambda found: sorted(vehicle.id for vehicle in found)
+            for brand in ('BMW', 'tesla', 'Volvo', 'Inexistente'):
+                expected = [vehicle.id for vehicle in vehicles if vehicle.brand.casefold() == brand.casefold()]
+                self.assertEqual(ids(fleet.filter_by_brand(brand)), expected)
+            for vehicle_type in ('Vehicle', 'ElectricCar', 'Truck'):
+                expected = [vehicle.id for vehicle in vehicles if vehicle.__class__.__name__ == vehicle_type]
+                self.assertEqual(ids(fleet.filter_by_type(vehicle_type)), expected)
+            for min_year in (2000, 2018, 2024, 2030):
+                found = fleet.filter_by_year(min_year)
+                self.assertEqual(ids(found), [vehicle.id for vehicle in vehicles if vehicle.year >= min_year])
+                self.assertEqual([vehicle.year for vehicle in found], sorted(vehicle.year for vehicle in found))
+
+class SummaryTests(unittest.TestCase):
+    def test_running_totals_follow_every_change(self):
+        for columnar in (False, True):
+            fleet = Fleet(columnar=columnar, debug=True)
+            steps = [
+                lambda: fleet.add_vehicles(generate_vehicles(1500, 24)),
+                lambda: fleet.add_vehicle(ElectricCar("Tesla", "Model 3", 45000, 2023, 75, 500)),
+                lambda: fleet.remove_vehicles(range(1, 1500, 3)),
+                lambda: fleet.remove_vehicle(0),
+                lambda: fleet.apply_global_discount(7.5),
+                lambda: setattr(fleet.get_vehicle(2), 'price', 999.99),
+                lambda: fleet.scenario(-5, vehicle_type='Truck').commit(),
+                lambda: fleet.remove_vehicles([vehicle.id for vehicle in fleet.filter_by_type('Truck')]),
+            ]
+            for step in steps:
+                step()
+                # debug=True confirma os totais a cada get_summary
+                assert_same_summary(self, fleet.get_summary(), fleet.recompute_summary())
+                self.assertTrue(fleet.verify_summary())
+            self.assertNotIn('Truck', fleet.get_summary()['by_type'])
+            fleet.clear()
+            self.assertEqual(fleet.get_summary(), {'total': 0, 'total_value': 0, 'total_tax': 0, 'by_type': {}, 'value_by_type': {}})
+
+    def test_verify_summary_detects_drift(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(10, 25))
+        fleet._total_value += 1
+        with self.assertRaises(AssertionError):
+            fleet.verify_summary()
+
+class StableIdTests(unittest.TestCase):
+    def test_ids_survive_removals(self):
+        for columnar in (False, True):
+            fleet = Fleet(columnar=columnar)
+            vehicles = list(generate_vehicles(500, 27))
+            fleet.add_vehicles(vehicles)
+            removed = fleet.remove_vehicles([1, 250, 500, 9999])
+            self.assertEqual([vehicle.id for vehicle in removed], [1, 250, 500])
+            self.assertIsNone(fleet.get_vehicle(250))
+            # Os restantes mantêm id e posição coerentes com o vetor de veículos
+            for vehicle in vehicles:
+                if vehicle not in removed:
+                    self.assertIs(fleet.get_vehicle(vehicle.id), vehicle)
+                    self.assertIs(fleet.vehicles[vehicle._row], vehicle)
+            self.assertEqual([vehicle.id for vehicle in fleet.iter_vehicles()][:3], [2, 3, 4])
+            # Ids não são reutilizados
+            extra = next(generate_vehicles(1, 28))
+            fleet.add_vehicle(extra)
+            self.assertEqual(extra.id, 501)
+
+    def test_removed_vehicle_is_detached(self):
+        fleet = Fleet(columnar=True)
+        fleet.add_vehicles(generate_vehicles(10, 29))
+        vehicle = fleet.get_vehicle(4)
+        price = vehicle.price
+        self.assertIs(fleet.remove_vehicles([4])[0], vehicle)
+        self.assertIsNone(vehicle._fleet)
+        self.assertEqual(vehicle.price, price)
+        # Alterar o preço de um veículo removido já não mexe nos totais da frota
+        total = fleet.get_summary()['total_value']
+        vehicle.price = 1.0
+        self.assertEqual(fleet.get_summary()['total_value'], total)
+        self.assertTrue(fleet.verify_summary())
+        other = Fleet()
+        other.add_vehicle(vehicle)
+        self.assertEqual((vehicle.id, vehicle.price), (1, 1.0))
+
+class VehicleRecordTests(unittest.TestCase):
+    def test_records_are_slotted_and_interned(self):
+        vehicles = [Vehicle("Toyota", "Corolla", 25000, 2022), ElectricCar("Tesla", "Model 3", 45000, 2023, 75, 500),
+                    Truck("Volvo", "FH", 92000, 2021, 20, 13.2)]
+        for vehicle in vehicles:
+            self.assertFalse(hasattr(vehicle, '__dict__'))
+            with self.assertRaises(AttributeError):
+                vehicle.color = "azul"
+        # Textos iguais lidos de fontes diferentes passam a ser o mesmo objeto
+        brand = "".join(["Toy", "ota"])
+        self.assertIs(Vehicle(brand, "Yaris", 1, 2020).brand, vehicles[0].brand)
+
+    def test_copy_and_registration_date(self):
+        vehicle = ElectricCar("Tesla", "Model 3", 45000, 2023, 75, 500)
+        vehicle.registration_date = datetime.datetime(2024, 5, 1, 12, 30)
+        fleet = Fleet(columnar=True)
+        fleet.add_vehicle(vehicle)
+        clone = vehicle.copy()
+        self.assertIsNone(clone._fleet)
+        self.assertEqual((clone.brand, clone.autonomy, clone.price), ("Tesla", 500, 45000))
+        self.assertEqual(clone.registration_date, datetime.datetime(2024, 5, 1, 12, 30))
+        self.assertEqual(vehicle.to_dict()['registration_date'], "01-05-2024 12:30:00")
+        clone.price = 1.0
+        self.assertEqual(vehicle.price, 45000)
+
+class WindowTests(unittest.TestCase):
+    # As tabelas virtualizadas só pedem janelas (start, stop) à fonte: percorrer a fonte
+    # janela a janela tem de dar exatamente a sequência completa
+    def pages(self, source, total, size=97):
+        rows = []
+        for start in range(0, total + size, size):
+            rows.extend(source.window(start, start + size))
+        return rows
+
+    def test_windows_cover_each_source(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(2000, 33))
+        fleet.remove_vehicles(range(1, 2000, 6))
+        results = fleet.search("o")
+        sources = [(fleet, fleet.vehicles), (results, list(results)),
+                   (fleet.sorted_by('price'), list(fleet.sorted_by('price'))),
+                   (fleet.sorted_by('year', 2015, 2020, reverse=True), list(fleet.sorted_by('year', 2015, 2020, reverse=True)))]
+        for source, expected in sources:
+            self.assertGreater(len(expected), 0)
+            self.assertEqual(len(source), len(expected))
+            self.assertEqual(self.pages(source, len(expected)), expected)
+        self.assertEqual(fleet.window(len(fleet), len(fleet) + 10), [])
+        self.assertEqual(results.window(5, 5), [])
+
+class OperationLogTests(unittest.TestCase):
+    def test_histogram_percentiles(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 100001):
+            histogram.record(value * 1000)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 100000)
+        self.assertAlmostEqual(summary['mean_ms'], 50.0005, places=3)
+        # Limite superior do balde: no máximo 4% acima do valor exato
+        for key, exact in (('p50_ms', 50), ('p95_ms', 95), ('p99_ms', 99)):
+            self.assertGreaterEqual(summary[key], exact)
+            self.assertLess(summary[key], exact * 1.04)
+
+    def test_log_writes_sampled_json_lines(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        log = OperationLog(os.path.join(directory.name, "operacoes.jsonl"), sample_every=1)
+        log.set_sampling('add_vehicle', 10)
+        log.set_sampling('get_summary', 0)
+        for _ in range(25):
+            log.record('add_vehicle', 2_000_000, fleet='Fleet')
+            log.record('get_summary', 1000)
+        log.record('export_inventory', 1_500_000)
+        self.assertTrue(log.flush())
+        with open(log.filename, encoding='utf-8') as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual([record['op'] for record in records], ['add_vehicle', 'add_vehicle', 'export_inventory'])
+        self.assertEqual((records[0]['ms'], records[0]['fleet']), (2.0, 'Fleet'))
+
+    def test_disabled_log_starts_nothing(self):
+        log = OperationLog(os.devnull, sample_every=0)
+        log.record('add_vehicle', 1000)
+        self.assertIsNone(log._thread)
+        self.assertTrue(log.flush())
+
+    def test_operations_are_measured(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(100, 38))
+        fleet.apply_global_discount(5)
+        fleet.apply_global_discount(5)
+        metrics = fleet.operation_metrics()
+        self.assertEqual(metrics['add_vehicles']['count'], 1)
+        self.assertEqual(metrics['apply_global_discount']['count'], 2)
+        fleet.metrics.reset()
+        self.assertEqual(fleet.operation_metrics(), {})
+
+class GeneratorTests(unittest.TestCase):
+    def test_same_seed_same_vehicles(self):
+        first = [vehicle_row(vehicle) for vehicle in generate_vehicles(1000, 39)]
+        self.assertEqual([vehicle_row(vehicle) for vehicle in generate_vehicles(1000, 39)], first)
+        self.assertNotEqual([vehicle_row(vehicle) for vehicle in generate_vehicles(1000, 40)], first)
+
+    def test_options_are_respected(self):
+        vehicles = list(generate_vehicles(3000, 41, type_mix={'Truck': 1, 'ElectricCar': 3}, year_range=(2020, 2021),
+                                          price_ranges={'Truck': (100000, 100000)}))
+        counts = {}
+        for vehicle in vehicles:
+            counts[vehicle.__class__.__name__] = counts.get(vehicle.__class__.__name__, 0) + 1
+            self.assertIn(vehicle.year, (2020, 2021))
+            self.assertIn(vehicle.brand, SYNTHETIC_BRANDS[vehicle.__class__.__name__])
+            if isinstance(vehicle, Truck):
+                self.assertEqual(vehicle.price, 100000.0)
+        self.assertEqual(set(counts), {'Truck', 'ElectricCar'})
+        self.assertAlmostEqual(counts['ElectricCar'] / len(vehicles), 0.75, delta=0.03)
+        with self.assertRaises(ValueError):
+            next(generate_vehicles(1, type_mix={'Mota': 1}))
+
+    def test_export_synthetic_streams_to_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        filename = os.path.join(directory.name, "sinteticos.jsonl")
+        totals = export_synthetic(filename, 2000, 'jsonl', seed=42)
+        self.assertEqual(totals['total_vehicles'], 2000)
+        fleet = Fleet()
+        self.assertTrue(fleet.import_inventory(filename)[0])
+        imported = [vehicle_row(vehicle) for vehicle in fleet.window(0, 50)]
+        self.assertEqual(imported, [vehicle_row(vehicle) for vehicle in generate_vehicles(50, 42)])
+
+class BenchmarkTests(unittest.TestCase):
+    def test_suite_reports_each_operation(self):
+        with mock.patch('sys.stderr'):
+            report = benchmark.run_suite([300], formats=('csv', 'jsonl'))
+        operations = [row['operation'] for row in report['results']]
+        for operation in ('add_vehicles', 'remove_vehicle', 'apply_global_discount', 'get_summary', 'top_10[price]',
+                          'export_inventory[csv]', 'export_inventory[jsonl]'):
+            self.assertIn(operation, operations)
+        self.assertTrue(all(row['size'] == 300 and row['throughput'] > 0 for row in report['results']))
+        self.assertEqual(json.loads(json.dumps(report))['results'], report['results'])
+
+    def test_regressions_are_detected(self):
+        row = {'size': 1000, 'operation': 'get_summary', 'throughput': 1000.0, 'p50_ms': 1.0}
+        baseline = {'results': [row]}
+        same = {'results': [dict(row, p50_ms=1.05)]}
+        slower = {'results': [dict(row, p50_ms=2.0)]}
+        fewer = {'results': [dict(row, throughput=500.0)]}
+        self.assertEqual(benchmark.compare_results(baseline, same, threshold=0.1), [])
+        self.assertEqual(len(benchmark.compare_results(baseline, slower, threshold=0.1)), 1)
+        self.assertEqual(len(benchmark.compare_results(baseline, fewer, threshold=0.1)), 1)
+
+class EventTests(unittest.TestCase):
+    def test_each_change_emits_one_event(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for fleet in (Fleet(), Fleet(columnar=True), SQLiteFleet(os.path.join(directory.name, "frota.db"))):
+            events = []
+            listener = lambda event, vehicles: events.append((event, None if vehicles is None else len(vehicles)))
+            fleet.subscribe(listener)
+            fleet.add_vehicles(generate_vehicles(20, 35))
+            fleet.add_vehicle(next(generate_vehicles(1, 36)))
+            fleet.remove_vehicles([1, 2, 99])
+            fleet.remove_vehicle(0)
+            fleet.get_vehicle(5).price = 100.0
+            fleet.apply_global_discount(10)
+            fleet.clear()
+            self.assertEqual(events, [('added', 20), ('added', 1), ('removed', 2), ('removed', 1), ('repriced', 1),
+                                      ('repriced', None), ('reset', None)])
+            self.assertTrue(set(event for event, _ in events) <= set(FLEET_EVENTS))
+            # Sem alterações reais não há eventos; depois de unsubscribe também não
+            fleet.remove_vehicles([999])
+            fleet.unsubscribe(listener)
+            fleet.add_vehicle(next(generate_vehicles(1, 37)))
+            self.assertEqual(len(events), 7)
+            if isinstance(fleet, SQLiteFleet):
+                fleet.close()
+
+class JobTests(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = JobScheduler()
+        self.addCleanup(self.scheduler.shutdown)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = os.path.join(directory.name, "frota.csv")
+
+    def test_background_export_reports_progress(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(5000, 34))
+        job = self.scheduler.submit("Exportar", lambda job: fleet.export_inventory(self.filename, 'csv', job))
+        success, message = job.result()
+        self.assertTrue(success, message)
+        self.assertEqual(job.progress, 1.0)
+        self.assertTrue(job.done())
+
+    def test_cancelled_export_leaves_no_file(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(5000, 34))
+        started, release = threading.Event(), threading.Event()
+
+        def vehicles():
+            for number, vehicle in enumerate(fleet.iter_vehicles()):
+                if number == 2500:
+                    started.set()
+                    release.wait(10)
+                yield vehicle
+
+        def export(job):
+            return export_vehicles(job.track(vehicles(), len(fleet)), self.filename, 'csv')
+
+        job = self.scheduler.submit("Exportar", export)
+        self.assertTrue(started.wait(10))
+        self.assertGreater(job.progress, 0)
+        job.cancel()
+        release.set()
+        with self.assertRaises(JobCancelled):
+            job.result()
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_job_cancelled_before_start_does_not_run(self):
+        blocker = threading.Event()
+        self.addCleanup(blocker.set)
+        ran = []
+        busy = [self.scheduler.submit("Ocupar", lambda job: blocker.wait(10)) for _ in range(2)]
+        job = self.scheduler.submit("Nunca", lambda job: ran.append(job))
+        job.cancel()
+        blocker.set()
+        for other in busy:
+            other.result()
+        self.assertTrue(job.cancelled)
+        self.assertEqual(ran, [])
+
+class ExportTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.fleet = Fleet()
+        self.fleet.add_vehicles(generate_vehicles(2500, 26))
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_json_document_and_totals(self):
+        filename = self.path("frota.json")
+        totals = export_vehicles(self.fleet.iter_vehicles(), filename, 'json')
+        summary = self.fleet.get_summary()
+        self.assertEqual(totals['total_vehicles'], 2500)
+        self.assertAlmostEqual(totals['total_value'], summary['total_value'], places=4)
+        with open(filename, encoding='utf-8') as file:
+            document = json.load(file)
+        self.assertEqual(document['total_vehicles'], 2500)
+        self.assertEqual(document['vehicles'], [vehicle_row(vehicle) for vehicle in self.fleet.iter_vehicles()])
+
+    def test_formats_write_every_vehicle(self):
+        for format_type in EXPORT_FORMATS:
+            filename = self.path(f"frota.{format_type}")
+            # Um gerador só pode ser percorrido uma vez: a exportação é de uma só passagem
+            totals = export_vehicles((vehicle for vehicle in self.fleet.iter_vehicles()), filename, format_type)
+            self.assertEqual(totals['total_vehicles'], 2500, format_type)
+            with open(filename, encoding='utf-8') as file:
+                text = file.read()
+            if format_type == 'jsonl':
+                self.assertEqual(len(text.splitlines()), 2500)
+            elif format_type == 'csv':
+                self.assertEqual(len(text.splitlines()), 2501)
+            elif format_type == 'txt':
+                self.assertIn("VEÍCULO 2500:", text)
+        with self.assertRaises(ValueError):
+            export_vehicles(self.fleet.iter_vehicles(), self.path("frota.xml"), 'xml')
+
+    def test_failed_export_removes_file(self):
+        def vehicles():
+            yield from self.fleet.window(0, EXPORT_CHUNK_SIZE * 2)
+            raise OSError("fonte interrompida")
+
+        filename = self.path("frota.csv")
+        with self.assertRaises(OSError):
+            export_vehicles(vehicles(), filename, 'csv')
+        self.assertFalse(os.path.exists(filename))
+
+class SearchTests(unittest.TestCase):
+    def brute_force(self, fleet, text, prefix):
+        words = normalize_text(text).split()
+        found = []
+        for vehicle in fleet.iter_vehicles():
+            term = normalize_text(f"{vehicle.brand} {vehicle.model}")
+            if prefix:
+                matched = all(any(part.startswith(word) for part in term.split()) for word in words)
+            else:
+                matched = all(word in term for word in words)
+            if matched:
+                found.append(vehicle.id)
+        return sorted(found)
+
+    def test_search_matches_brute_force(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(3000, 49))
+        fleet.add_vehicle(ElectricCar("Citroën", "ë-C4", 35000, 2023, 50, 350))
+        fleet.remove_vehicles(range(1, 3000, 7))
+        for text in ("mod", "MODEL 3", "tesla model", "citroen", "Citroën ë", "o", "es", "x", "zz", "", "  ", "series 5"):
+            for prefix in (False, True):
+                results = fleet.search(text, prefix)
+                self.assertEqual(sorted(vehicle.id for vehicle in results), self.brute_force(fleet, text, prefix), (text, prefix))
+                self.assertEqual(len(results), len(list(results)))
+
+    def test_search_follows_changes(self):
+        fleet = Fleet()
+        vehicle = Vehicle("Škoda", "Octavia", 30000, 2022)
+        fleet.add_vehicle(vehicle)
+        self.assertEqual(list(fleet.search("skoda oct", prefix=True)), [vehicle])
+        self.assertEqual(list(fleet.search("tavia")), [vehicle])
+        self.assertEqual(list(fleet.search("tavia", prefix=True)), [])
+        fleet.remove_vehicles([vehicle.id])
+        self.assertEqual(list(fleet.search("skoda")), [])
+        self.assertEqual(fleet.indexes.text.grams, {})
+
+class QueryTests(unittest.TestCase):
+    CRITERIA = [
+        {'brand': 'BMW'},
+        {'brand': 'tesla', 'year': (2018, 2022)},
+        {'vehicle_type': 'Truck', 'load_capacity': (10, None)},
+        {'price': (None, 30000)},
+        {'brand': 'Volvo', 'price': (20000, 60000), 'year': (2015, None)},
+        {'autonomy': (300, 500)},
+        {'vehicle_type': 'ElectricCar', 'battery_capacity': (60, 80), 'price': (40000, None)},
+        {'search': 'model', 'year': (None, 2019)},
+        {'length': (8, 12), 'brand': 'Volvo'},
+        {'vehicle_type': 'Vehicle', 'autonomy': (100, None)},
+        {'brand': 'Inexistente'},
+        {},
+    ]
+
+    def brute_force(self, fleet, brand=None, vehicle_type=None, search=None, **ranges):
+        words = normalize_text(search or "").split()
+        found = []
+        for vehicle in fleet.iter_vehicles():
+            if brand and vehicle.brand.casefold() != brand.casefold():
+                continue
+            if vehicle_type and vehicle.__class__.__name__ != vehicle_type:
+                continue
+            if not all(word in normalize_text(f"{vehicle.brand} {vehicle.model}") for word in words):
+                continue
+            values = {name: getattr(vehicle, name, None) for name in ranges}
+            if all(value is not None and (low is None or value >= low) and (high is None or value <= high)
+                   for (low, high), value in zip(ranges.values(), values.values())):
+                found.append(vehicle.id)
+        return sorted(found)
+
+    def test_query_matches_brute_force(self):
+        for columnar in (False, True):
+            fleet = Fleet(columnar=columnar)
+            fleet.add_vehicles(generate_vehicles(3000, 31))
+            fleet.remove_vehicles(range(1, 3000, 6))
+            fleet.apply_global_discount(10)
+            for criteria in self.CRITERIA:
+                query = fleet.query(**criteria)
+                expected = self.brute_force(fleet, **criteria)
+                self.assertEqual(sorted(vehicle.id for vehicle in query), expected, (columnar, criteria))
+                self.assertEqual(query.count(), len(expected), (columnar, criteria))
+                self.assertTrue(query.explain().startswith("1. "))
+
+    def test_query_follows_price_changes(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(500, 32))
+        self.assertEqual(fleet.query(price=(None, 30000)).count(), len(self.brute_force(fleet, price=(None, 30000))))
+        fleet.get_vehicle(1).price = 1
+        fleet.apply_global_discount(20)
+        fleet.remove_vehicles([2, 3])
+        query = fleet.query(price=(None, 30000))
+        self.assertIn(1, [vehicle.id for vehicle in query])
+        self.assertEqual(sorted(vehicle.id for vehicle in query), self.brute_force(fleet, price=(None, 30000)))
+
+    def test_incompatible_criteria_are_empty(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(200, 33))
+        query = fleet.query(vehicle_type='Truck', autonomy=(0, None))
+        self.assertEqual((list(query), query.count(), query.strategy), ([], 0, 'empty'))
+        self.assertEqual(list(fleet.query(load_capacity=(1, None), battery_capacity=(1, None))), [])
+        with self.assertRaises(TypeError):
+            fleet.query(colour=('azul', None))
+
+class SortedViewTests(unittest.TestCase):
+    KEYS = {'price': lambda vehicle: vehicle.price, 'year': lambda vehicle: vehicle.year,
+            'tax': lambda vehicle: vehicle.calculate_tax()}
+
+    def brute_force(self, fleet, name, low=None, high=None, reverse=False):
+        key = self.KEYS[name]
+        rows = sorted(fleet.iter_vehicles(), key=lambda vehicle: (key(vehicle), vehicle.id))
+        rows = [vehicle.id for vehicle in rows if (low is None or key(vehicle) >= low) and (high is None or key(vehicle) <= high)]
+        return rows[::-1] if reverse else rows
+
+    def assert_views(self, fleet):
+        for name, low, high in (('price', None, None), ('price', 20000, 45000), ('year', 2015, 2020),
+                                ('tax', None, 1500), ('year', 2030, None)):
+            for reverse in (False, True):
+                expected = self.brute_force(fleet, name, low, high, reverse)
+                view = fleet.sorted_by(name, low, high, reverse)
+                self.assertEqual(len(view), len(expected), (name, low, high, reverse))
+                self.assertEqual([vehicle.id for vehicle in view.window(0, len(view))], expected)
+                self.assertEqual([vehicle.id for vehicle in view.window(7, 30)], expected[7:30])
+
+    def test_views_follow_every_change(self):
+        # Blocos pequenos para que as alterações partam e juntem blocos
+        with mock.patch.object(main, 'SORTED_LOAD', 8):
+            for columnar in (False, True):
+                fleet = Fleet(columnar=columnar)
+                fleet.add_vehicles(generate_vehicles(1500, 41))
+                self.assert_views(fleet)
+                fleet.add_vehicles(generate_vehicles(20, 42))
+                fleet.remove_vehicles(range(1, 1500, 9))
+                fleet.get_vehicle(2).price = 1
+                fleet.get_vehicle(3).price = 10 ** 6
+                self.assert_views(fleet)
+                fleet.apply_global_discount(15)
+                fleet.remove_vehicles(range(2, 1500, 3))
+                self.assert_views(fleet)
+                self.assertTrue(fleet.verify_summary())
+
+    def test_views_follow_tax_rules(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(800, 43))
+        self.assert_views(fleet)
+        tax_rules.add_rule(old_truck_rate)
+        self.addCleanup(tax_rules.remove_rule, old_truck_rate)
+        self.assert_views(fleet)
+
+class ImportTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def exported(self, count, format_type):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(count, 1))
+        filename = self.path(f"frota.{format_type}")
+        fleet.export_inventory(filename, format_type)
+        return filename
+
+    def test_export_import_round_trip(self):
+        source = Fleet()
+        source.add_vehicles(generate_vehicles(3000, 1))
+        source.add_vehicle(ElectricCar("Citroën", "ë-C4", 35000, 2023, 50, 350))
+        rows = [vehicle_row(vehicle) for vehicle in source.iter_vehicles()]
+        for format_type in ('csv', 'json', 'jsonl'):
+            filename = self.path(f"volta.{format_type}")
+            source.export_inventory(filename, format_type)
+            for fleet in (Fleet(), Fleet(columnar=True)):
+                success, message, report = fleet.import_inventory(filename)
+                self.assertTrue(success, message)
+                self.assertEqual((report['imported'], report['rejected']), (3001, 0))
+                imported = [vehicle_row(vehicle) for vehicle in fleet.iter_vehicles()]
+                if format_type == 'csv':
+                    # O CSV não distingue 500 de 500.0
+                    for row in rows + imported:
+                        for key in ('battery_capacity', 'autonomy', 'load_capacity', 'length'):
+                            if key in row:
+                                row[key] = float(row[key])
+                self.assertEqual(imported, rows, format_type)
+                assert_same_summary(self, fleet.get_summary(), source.get_summary())
+
+    def test_malformed_jsonl_lines_are_rejected(self):
+        with open(self.exported(50, 'jsonl'), encoding='utf-8') as file:
+            lines = file.read().splitlines()
+        lines[10] = '{"brand": "X", oops'
+        lines[20] = '[1, 2]'
+        filename = self.path("mal.jsonl")
+        with open(filename, 'w', encoding='utf-8') as file:
+            file.write("\n".join(lines) + "\n")
+
+        fleet = Fleet()
+        success, message, report = fleet.import_inventory(filename)
+        self.assertTrue(success, message)
+        self.assertEqual((report['imported'], report['rejected']), (48, 2))
+        self.assertEqual([number for number, _ in report['errors']], [11, 21])
+        self.assertEqual(len(fleet), 48)
+
+    def test_malformed_json_object_is_rejected(self):
+        with open(self.exported(3000, 'json'), encoding='utf-8') as file:
+            text = file.read()
+        start = text.index('{', len(text) // 2)
+        filename = self.path("mal.json")
+        with open(filename, 'w', encoding='utf-8') as file:
+            file.write(text[:start + 1] + "oops" + text[start + 1:])
+
+        success, message, report = Fleet().import_inventory(filename)
+        self.assertTrue(success, message)
+        self.assertEqual((report['imported'], report['rejected']), (2999, 1))
+
+    def failing_csv(self, count, bad_row):
+        # Bytes inválidos em UTF-8 a meio do ficheiro: a leitura falha depois de bad_row linhas
+        with open(self.exported(count, 'csv'), 'rb') as file:
+            lines = file.read().split(b"\n")
+        lines[bad_row] = b"\xff\xfe" + lines[bad_row]
+        filename = self.path("falha.csv")
+        with open(filename, 'wb') as file:
+            file.write(b"\n".join(lines))
+        return filename
+
+    def test_failed_import_leaves_fleet_unchanged(self):
+        filename = self.failing_csv(25000, 15000)
+        for columnar in (False, True):
+            for initial in (0, 100000):
+                fleet = Fleet(columnar=columnar)
+                fleet.add_vehicles(generate_vehicles(initial, 2))
+                summary, version = fleet.get_summary(), fleet.version
+                success, message, report = fleet.import_inventory(filename)
+                self.assertFalse(success)
+                self.assertEqual(len(fleet), initial)
+                self.assertEqual(fleet.get_summary(), summary)
+                self.assertNotEqual(fleet.version, version)
+                # Os ids seguintes continuam contíguos e os índices sem restos da importação
+                vehicles = list(generate_vehicles(3, 3))
+                fleet.add_vehicles(vehicles)
+                self.assertEqual([vehicle.id for vehicle in vehicles], [initial + 1, initial + 2, initial + 3])
+                self.assertEqual(fleet.query(year=(None, None)).count(), initial + 3)
+                self.assertEqual(fleet.recompute_summary()['total'], initial + 3)
+
+    def test_failed_add_detaches_vehicles(self):
+        # A falha chega depois de um lote inteiro já ligado à frota
+        vehicles = list(generate_vehicles(IMPORT_BATCH_SIZE + 10, 4))
+
+        def source():
+            yield from vehicles[:IMPORT_BATCH_SIZE + 5]
+            raise OSError("fonte interrompida")
+
+        fleet = Fleet()
+        with self.assertRaises(OSError):
+            fleet.add_vehicles(source())
+        self.assertEqual(len(fleet), 0)
+        self.assertTrue(all(vehicle.id is None and vehicle._fleet is None for vehicle in vehicles))
+        fleet.add_vehicles(vehicles)
+        self.assertEqual(len(fleet), len(vehicles))
+
+    def test_failed_sharded_import_leaves_fleet_unchanged(self):
+        # Dois lotes já enviados às partições antes da falha
+        filename = self.failing_csv(5 * SHARD_CHUNK_SIZE, 4 * SHARD_CHUNK_SIZE + 500)
+        with ShardedFleet(2) as fleet:
+            fleet.add_vehicles(generate_vehicles(100, 2))
+            summary = fleet.get_summary()
+            success, message, report = fleet.import_inventory(filename)
+            self.assertFalse(success)
+            self.assertEqual(len(fleet), 100)
+            # Os totais das partições acumulam remoções: o imposto só difere no arredondamento
+            after = fleet.get_summary()
+            self.assertAlmostEqual(after.pop('total_tax'), summary.pop('total_tax'), places=4)
+            self.assertEqual(after, summary)
+            self.assertEqual(fleet.recompute_summary()['total'], 100)
+
+class ScenarioTests(unittest.TestCase):
+    def test_preview_does_not_change_fleet(self):
+        for columnar in (False, True):
+            fleet = Fleet(columnar=columnar)
+            fleet.add_vehicles(generate_vehicles(3000, 43))
+            summary, version = fleet.get_summary(), fleet.version
+            scenarios = [fleet.scenario(10), fleet.scenario(20, brand='bmw'), fleet.scenario(-5, vehicle_type='ElectricCar', min_year=2020)]
+            results = compare_scenarios(scenarios)
+            self.assertEqual(fleet.get_summary(), summary)
+            self.assertEqual(fleet.version, version)
+            for scenario, totals in zip(scenarios, results):
+                selected = [vehicle for vehicle in fleet.iter_vehicles() if scenario.matches(vehicle)]
+                self.assertEqual(totals['count'], len(selected))
+                self.assertAlmostEqual(totals['old_value'], sum(vehicle.price for vehicle in selected), places=2)
+                self.assertAlmostEqual(totals['new_value'], sum(map(scenario.new_price, selected)), places=2)
+                self.assertAlmostEqual(totals['old_tax'], sum(vehicle.calculate_tax() for vehicle in selected), places=2)
+                self.assertAlmostEqual(totals['delta_tax'], totals['old_tax'] * -scenario.percentage / 100, places=2)
+
+    def test_commit_updates_totals_of_selected_rows(self):
+        for columnar in (False, True):
+            fleet = Fleet(columnar=columnar)
+            fleet.add_vehicles(generate_vehicles(5000, 10))
+            fleet.sorted_by('tax')
+            summary = fleet.get_summary()
+            scenario = fleet.scenario(15, vehicle_type='Truck', min_year=2015)
+            expected = scenario.totals()
+            self.assertEqual(scenario.commit(), expected['count'])
+            self.assertTrue(fleet.verify_summary())
+            after = fleet.get_summary()
+            self.assertAlmostEqual(after['total_value'] - summary['total_value'], expected['delta_value'], delta=0.01 * expected['count'])
+            self.assertEqual(after['value_by_type']['Vehicle'], summary['value_by_type']['Vehicle'])
+            taxes = [vehicle.calculate_tax() for vehicle in fleet.sorted_by('tax').window(0, len(fleet))]
+            self.assertEqual(taxes, sorted(taxes))
+
+    def test_discount_rounds_to_cents(self):
+        # O desconto global passa pelo cenário: os preços novos ficam arredondados ao cêntimo
+        for columnar in (False, True):
+            fleet = Fleet(columnar=columnar)
+            fleet.add_vehicles(generate_vehicles(100, 11))
+            fleet.get_vehicle(1).price = 333.33
+            fleet.apply_global_discount(10)
+            self.assertEqual(fleet.get_vehicle(1).price, 300.0)
+            self.assertTrue(all(round(vehicle.price, 2) == vehicle.price for vehicle in fleet.iter_vehicles()))
+            self.assertTrue(fleet.verify_summary())
+
+    def test_stale_scenario_is_rejected(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for fleet in (Fleet(), SQLiteFleet(os.path.join(directory.name, "frota.db"))):
+            fleet.add_vehicles(generate_vehicles(10, 12))
+            scenario = fleet.scenario(10)
+            fleet.add_vehicle(next(generate_vehicles(1, 13)))
+            with self.assertRaises(ValueError):
+                scenario.commit()
+            if isinstance(fleet, SQLiteFleet):
+                fleet.close()
+
+def old_truck_rate(vehicle_type, year):
+    # Regra de módulo: pode ser enviada às partições de uma ShardedFleet
+    return 0.4 if vehicle_type == 'Truck' and year < 2015 else None
+
+class TaxRuleTests(unittest.TestCase):
+    def setUp(self):
+        state = (tax_rules.base_rate, dict(tax_rules.multipliers), dict(tax_rules.year_rates), list(tax_rules.rules))
+
+        def restore():
+            tax_rules.base_rate, tax_rules.multipliers, tax_rules.year_rates, tax_rules.rules = state
+            tax_rules._changed()
+        self.addCleanup(restore)
+
+    def test_rates_by_type_and_year(self):
+        tax_rules.configure(base_rate=0.2, multipliers={'Truck': 1.5})
+        self.assertAlmostEqual(tax_rules.rate('Truck', 2020), 0.3)
+        tax_rules.set_rate('ElectricCar', 0.05)
+        tax_rules.set_rate('ElectricCar', 0.0, year=2024)
+        self.assertAlmostEqual(tax_rules.rate('ElectricCar', 2023), 0.05)
+        self.assertEqual(tax_rules.rate('ElectricCar', 2024), 0.0)
+        tax_rules.add_rule(old_truck_rate)
+        self.assertEqual(tax_rules.rate('Truck', 2010), 0.4)
+        tax_rules.remove_rule(old_truck_rate)
+        self.assertAlmostEqual(tax_rules.rate('Truck', 2010), 0.3)
+
+    def test_fleets_follow_rate_changes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = SQLiteFleet(os.path.join(directory.name, "frota.db"))
+        self.addCleanup(database.close)
+        fleets = [Fleet(), Fleet(columnar=True), database]
+        for fleet in fleets:
+            fleet.add_vehicles(generate_vehicles(1000, 42))
+        vehicle = fleets[0].get_vehicle(1)
+        frozen = fleets[0].snapshot()
+        before, old_tax = frozen.get_summary(), vehicle.calculate_tax()
+        tax_rules.configure(base_rate=0.1, multipliers={'Truck': 2.0}, year_rates={('Vehicle', 2020): 0.0})
+        expected = sum(vehicle.price * tax_rules.rate(vehicle.__class__.__name__, vehicle.year)
+                       for vehicle in fleets[0].iter_vehicles())
+        for fleet in fleets:
+            self.assertAlmostEqual(fleet.get_summary()['total_tax'], expected, places=2)
+            if isinstance(fleet, Fleet):
+                self.assertTrue(fleet.verify_summary())
+        self.assertAlmostEqual(vehicle.calculate_tax(), vehicle.price * tax_rules.rate(vehicle.__class__.__name__, vehicle.year))
+        # O snapshot tirado antes da mudança mantém as taxas antigas
+        self.assertEqual(frozen.get_summary(), before)
+        self.assertEqual(next(frozen.iter_vehicles()).calculate_tax(), old_tax)
+        self.assertNotEqual(vehicle.calculate_tax(), old_tax)
+
+    def test_rules_must_be_picklable(self):
+        rules = list(tax_rules.rules)
+        with self.assertRaises(ValueError):
+            tax_rules.add_rule(lambda vehicle_type, year: None)
+        self.assertEqual(tax_rules.rules, rules)
+
+    def test_sharded_fleet_applies_rules(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(3000, 16))
+        with ShardedFleet(2) as sharded:
+            sharded.add_vehicles(generate_vehicles(3000, 16))
+            tax_rules.add_rule(old_truck_rate)
+            self.addCleanup(tax_rules.remove_rule, old_truck_rate)
+            expected, summary = fleet.get_summary(), sharded.get_summary()
+        self.assertAlmostEqual(summary.pop('total_tax'), expected.pop('total_tax'), places=4)
+        self.assertEqual(summary, expected)
+
+class JournalTests(unittest.TestCase):
+    def state(self, fleet):
+        return vehicle_rows(sorted(fleet.iter_vehicles(), key=lambda vehicle: vehicle.id))
+
+    def test_rollback_restores_each_version(self):
+        for columnar in (False, True):
+            fleet = Fleet(columnar=columnar)
+            steps = [
+                lambda: fleet.add_vehicles(generate_vehicles(3000, 44)),
+                lambda: fleet.remove_vehicles(range(1, 3000, 3)),
+                lambda: setattr(fleet.get_vehicle(2), 'price', 5.0),
+                lambda: fleet.apply_global_discount(10),
+                lambda: fleet.set_prices({3: 30.0, 5: 50.0}),
+                lambda: fleet.add_vehicles(generate_vehicles(10, 45)),
+                fleet.clear,
+                lambda: fleet.add_vehicles(generate_vehicles(5, 46)),
+            ]
+            versions = []
+            for step in steps:
+                step()
+                versions.append((fleet.version, self.state(fleet), fleet.get_summary()))
+            self.assertEqual(len(fleet.history()), len(steps))
+            for version, state, summary in reversed(versions):
+                fleet.rollback(version)
+                self.assertEqual(self.state(fleet), state)
+                assert_same_summary(self, fleet.get_summary(), summary)
+                self.assertTrue(fleet.verify_summary())
+                self.assertEqual(fleet.query(year=(None, None)).count(), summary['total'])
+
+    def test_undo_walks_back(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(100, 47))
+        states = [self.state(fleet)]
+        for vehicle_id in (1, 2, 3):
+            fleet.get_vehicle(vehicle_id).price = 1.0
+            states.append(self.state(fleet))
+        fleet.remove_vehicles([10, 11])
+        # Cada undo recua uma alteração, incluindo as feitas antes de outro undo
+        for state in reversed(states):
+            self.assertTrue(fleet.undo()[0])
+            self.assertEqual(self.state(fleet), state)
+        self.assertTrue(fleet.undo()[0])
+        self.assertEqual(len(fleet), 0)
+        self.assertFalse(fleet.undo()[0])
+
+    def test_snapshot_is_isolated(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(500, 48))
+        snapshot = fleet.snapshot()
+        state, summary = self.state(fleet), fleet.get_summary()
+        fleet.remove_vehicles(range(1, 100))
+        fleet.apply_global_discount(50)
+        self.assertEqual(vehicle_rows(snapshot.iter_vehicles()), state)
+        self.assertEqual(snapshot.get_summary(), summary)
+        with self.assertRaises(TypeError):
+            snapshot.scenario(10).commit()
+
+    def test_reset_journal_keeps_initial_data(self):
+        # Como a interface ao arrancar: limpar, carregar os exemplos e começar o diário aí
+        fleet = Fleet()
+        fleet.clear()
+        for vehicle in generate_vehicles(10, 14):
+            fleet.add_vehicle(vehicle)
+        fleet.reset_journal()
+        self.assertEqual(fleet.history(), [])
+        self.assertFalse(fleet.undo()[0])
+        self.assertEqual(len(fleet), 10)
+
+        old_price = fleet.get_vehicle(3).price
+        fleet.get_vehicle(3).price = 1.0
+        self.assertTrue(fleet.undo()[0])
+        self.assertEqual(fleet.get_vehicle(3).price, old_price)
+        self.assertFalse(fleet.undo()[0])
+        self.assertEqual(len(fleet), 10)
+        self.assertTrue(fleet.verify_summary())
+
+class ConcurrencyTests(unittest.TestCase):
+    def test_readers_see_consistent_fleet_during_writes(self):
+        for columnar in (False, True):
+            fleet = Fleet(columnar=columnar)
+            fleet.add_vehicles(generate_vehicles(2000, 51))
+            errors = []
+            done = threading.Event()
+
+            def write(seed):
+                try:
+                    for step in range(20):
+                        fleet.add_vehicles(generate_vehicles(50, seed + step))
+                        fleet.remove_vehicles([vehicle.id for vehicle in fleet.window(0, 30)])
+                        fleet.apply_global_discount(1)
+                        fleet.sorted_by('price').window(0, 10)
+                except Exception as error:
+                    errors.append(error)
+
+            def read():
+                try:
+                    while not done.is_set():
+                        # Dentro de uma leitura os totais e os veículos não mudam
+                        fleet.lock.acquire_read()
+                        try:
+                            summary = fleet.get_summary()
+                            vehicles = list(fleet.iter_vehicles())
+                            self.assertEqual(summary['total'], len(vehicles))
+                            self.assertAlmostEqual(summary['total_value'], sum(vehicle.price for vehicle in vehicles), places=2)
+                            trucks = [vehicle for vehicle in vehicles if isinstance(vehicle, Truck) and vehicle.year >= 2015]
+                            self.assertEqual(fleet.query(vehicle_type='Truck', year=(2015, None)).count(), len(trucks))
+                        finally:
+                            fleet.lock.release_read()
+                except Exception as error:
+                    errors.append(error)
+
+            readers = [threading.Thread(target=read) for _ in range(3)]
+            writers = [threading.Thread(target=write, args=(seed,)) for seed in (100, 200)]
+            for thread in readers + writers:
+                thread.start()
+            for thread in writers:
+                thread.join()
+            done.set()
+            for thread in readers:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(len(fleet), 2000 + 2 * 20 * 20)
+            self.assertTrue(fleet.verify_summary())
+
+    def test_waiting_writer_blocks_new_readers(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(10, 52))
+        order = []
+        fleet.lock.acquire_read()
+        writer = threading.Thread(target=lambda: (fleet.apply_global_discount(10), order.append('escrita')))
+        writer.start()
+        while not fleet.lock._waiting_writers:
+            time.sleep(0.001)
+        reader = threading.Thread(target=lambda: (fleet.get_summary(), order.append('leitura')))
+        reader.start()
+        reader.join(0.05)
+        # O leitor novo espera pelo escritor, que espera pela leitura em curso
+        self.assertEqual(order, [])
+        fleet.lock.release_read()
+        writer.join()
+        reader.join()
+        self.assertEqual(order, ['escrita', 'leitura'])
+
+    def test_read_then_write_in_same_thread_is_rejected(self):
+        fleet = Fleet()
+        fleet.lock.acquire_read()
+        try:
+            with self.assertRaises(RuntimeError):
+                fleet.add_vehicle(Vehicle("Fiat", "Panda", 12000, 2020))
+        finally:
+            fleet.lock.release_read()
+        # Quem escreve pode ler e voltar a escrever
+        fleet.lock.acquire_write()
+        try:
+            fleet.add_vehicle(Vehicle("Fiat", "Panda", 12000, 2020))
+            self.assertEqual(fleet.get_summary()['total'], 1)
+        finally:
+            fleet.lock.release_write()
+        self.assertEqual(len(fleet), 1)
+
+class PriceTests(unittest.TestCase):
+    def test_price_setter_inside_read_is_rejected(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(100, 17))
+        vehicle = fleet.get_vehicle(5)
+        old_price = vehicle.price
+        fleet.lock.acquire_read()
+        try:
+            with self.assertRaises(RuntimeError):
+                vehicle.price = 1.0
+            prices = {vehicle.id: round(vehicle.price * 0.9, 2) for vehicle in fleet.iter_vehicles() if vehicle.year < 2015}
+        finally:
+            fleet.lock.release_read()
+        self.assertEqual(vehicle.price, old_price)
+
+        # Os preços recolhidos durante a leitura são aplicados depois numa só escrita
+        for columnar in (False, True):
+            fleet = Fleet(columnar=columnar)
+            fleet.add_vehicles(generate_vehicles(100, 17))
+            fleet.sorted_by('price')
+            summary, version = fleet.get_summary(), fleet.version
+            self.assertEqual(fleet.set_prices({**prices, 999: 1.0}), len(prices))
+            self.assertEqual(fleet.version, version + 1)
+            self.assertTrue(all(fleet.get_vehicle(vehicle_id).price == price for vehicle_id, price in prices.items()))
+            self.assertTrue(fleet.verify_summary())
+            by_price = [vehicle.price for vehicle in fleet.sorted_by('price').window(0, 100)]
+            self.assertEqual(by_price, sorted(by_price))
+            self.assertTrue(fleet.undo()[0])
+            self.assertEqual(fleet.get_summary(), summary)
+
+class ServiceTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.fleet = Fleet()
+        self.fleet.add_vehicles(generate_vehicles(1500, 61))
+        self.service = service.FleetService(self.fleet)
+        host, port = await self.service.start(port=0)
+        self.url = f"http://{host}:{port}"
+
+    async def asyncTearDown(self):
+        await self.service.close()
+
+    async def request(self, method, path, body=None, content_type='application/json'):
+        # urllib bloqueia: corre numa thread para o ciclo de eventos continuar a servir
+        def send():
+            data = body if body is None or isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+            request = urllib.request.Request(self.url + path, data, {'Content-Type': content_type}, method=method)
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return response.status, response.headers['Content-Type'], response.read()
+            except urllib.error.HTTPError as error:
+                return error.code, error.headers['Content-Type'], error.read()
+        return await asyncio.to_thread(send)
+
+    async def request_json(self, method, path, body=None):
+        status, content_type, data = await self.request(method, path, body)
+        return status, json.loads(data)
+
+    async def test_summary_and_vehicles_match_fleet(self):
+        status, summary = await self.request_json('GET', '/summary')
+        self.assertEqual(status, 200)
+        assert_same_summary(self, summary, self.fleet.get_summary())
+        status, vehicle = await self.request_json('GET', '/vehicles/7')
+        self.assertEqual(vehicle, {'id': 7, **vehicle_row(self.fleet.get_vehicle(7))})
+
+        path = '/vehicles?type=Truck&year=2015&max_price=80000&offset=3&limit=40'
+        status, content_type, data = await self.request('GET', path)
+        self.assertEqual((status, content_type), (200, service.JSON_LINES))
+        expected = self.fleet.query(vehicle_type='Truck', year=(2015, None), price=(None, 80000)).fetch(3, 40)
+        self.assertEqual([json.loads(line)['id'] for line in data.splitlines()], [vehicle.id for vehicle in expected])
+        status, content_type, data = await self.request('GET', '/vehicles?search=model&prefix=1')
+        self.assertEqual(len(data.splitlines()), len(self.fleet.search("model", prefix=True)))
+
+    async def test_writes_change_the_fleet(self):
+        rows = [vehicle_row(vehicle) for vehicle in generate_vehicles(3, 62)]
+        status, added = await self.request_json('POST', '/vehicles', rows)
+        self.assertEqual((status, added['added'], added['ids']), (201, 3, [1501, 1502, 1503]))
+        lines = "".join(json.dumps(row) + "\n" for row in rows).encode('utf-8')
+        status, content_type, data = await self.request('POST', '/vehicles', lines, service.JSON_LINES)
+        self.assertEqual(json.loads(data)['ids'], [1504, 1505, 1506])
+        self.assertEqual(await self.request_json('DELETE', '/vehicles/1504'), (200, {'removed': [1504]}))
+        self.assertEqual((await self.request_json('GET', '/vehicles/1504'))[0], 404)
+        self.assertEqual(len(self.fleet), 1505)
+
+        summary = self.fleet.get_summary()
+        status, preview = await self.request_json('POST', '/discount', {'percentage': 10, 'type': 'Truck', 'dry_run': True})
+        self.assertEqual(status, 200)
+        self.assertEqual(self.fleet.get_summary(), summary)
+        status, result = await self.request_json('POST', '/discount', {'percentage': 10, 'type': 'Truck'})
+        self.assertEqual(result['count'], preview['count'])
+        self.assertEqual(preview['count'], summary['by_type']['Truck'])
+        # O commit arredonda cada preço ao cêntimo; a pré-visualização não
+        self.assertAlmostEqual(self.fleet.get_summary()['value_by_type']['Truck'], preview['new_value'],
+                               delta=0.005 * preview['count'])
+        self.assertTrue(self.fleet.verify_summary())
+
+    async def test_export_matches_file_export(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for format_type in EXPORT_FORMATS:
+            filename = os.path.join(directory.name, f"frota.{format_type}")
+            self.assertTrue(self.fleet.export_inventory(filename, format_type)[0])
+            with open(filename, 'rb') as file:
+                expected = without_export_date(file.read())
+            status, content_type, data = await self.request('GET', f'/export?format={format_type}')
+            self.assertEqual((status, content_type), (200, service.EXPORT_CONTENT_TYPES[format_type]))
+            self.assertEqual(without_export_date(data), expected, format_type)
+
+    async def test_invalid_requests(self):
+        self.assertEqual((await self.request_json('GET', '/vehicles?type=Carro'))[0], 400)
+        self.assertEqual((await self.request_json('GET', '/vehicles?min_price=barato'))[0], 400)
+        self.assertEqual((await self.request_json('GET', '/garagem'))[0], 404)
+        self.assertEqual((await self.request_json('PUT', '/summary'))[0], 405)
+        self.assertEqual((await self.request_json('GET', '/export?format=xml'))[0], 400)
+        self.assertEqual((await self.request_json('POST', '/discount', {'percentage': 'dez'}))[0], 400)
+        # Um lote com um veículo inválido não adiciona nenhum
+        rows = [vehicle_row(next(generate_vehicles(1, 63))), {'type': 'Vehicle', 'brand': 'Fiat'}]
+        self.assertEqual((await self.request_json('POST', '/vehicles', rows))[0], 400)
+        self.assertEqual(len(self.fleet), 1500)
+
+class MappedFleetTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = os.path.join(directory.name, "frota.snap")
+        self.fleet = Fleet()
+        self.fleet.add_vehicles(generate_vehicles(3000, 32))
+        self.fleet.remove_vehicles(range(1, 3000, 4))
+        self.fleet.save_snapshot(self.filename)
+
+    def test_snapshot_matches_fleet(self):
+        with MappedFleet(self.filename) as mapped:
+            self.assertEqual(len(mapped), len(self.fleet))
+            self.assertEqual(mapped.get_summary(), self.fleet.get_summary())
+            self.assertEqual(vehicle_rows(mapped.iter_vehicles()), vehicle_rows(self.fleet.iter_vehicles()))
+            self.assertEqual(vehicle_rows(mapped.window(10, 20)), vehicle_rows(list(self.fleet.iter_vehicles())[10:20]))
+            self.assertEqual(vehicle_rows(mapped.recent(3)), vehicle_rows(self.fleet.recent(3)))
+            for vehicle_id in (2, 3, 2999, 3000):
+                self.assertEqual(vehicle_rows([mapped.get_vehicle(vehicle_id)]), vehicle_rows([self.fleet.get_vehicle(vehicle_id)]))
+            self.assertIsNone(mapped.get_vehicle(1))
+            self.assertIsNone(mapped.get_vehicle(5000))
+            copy = mapped.to_fleet(columnar=True)
+        assert_same_summary(self, copy.get_summary(), self.fleet.get_summary())
+        self.assertTrue(copy.verify_summary())
+
+    def test_invalid_file_is_rejected(self):
+        with open(self.filename, 'r+b') as file:
+            file.write(b"XXXXXXXX")
+        with self.assertRaises(ValueError):
+            MappedFleet(self.filename)
+
+class SQLiteFleetTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.fleet = SQLiteFleet(os.path.join(directory.name, "frota.db"))
+        self.addCleanup(self.fleet.close)
+
+    def test_added_vehicles_are_bound(self):
+        events = []
+        self.fleet.subscribe(lambda event, vehicles: events.append(vehicles))
+        single = next(generate_vehicles(1, 5))
+        self.fleet.add_vehicle(single)
+        batch = list(generate_vehicles(IMPORT_BATCH_SIZE + 3, 6))
+        self.assertEqual(self.fleet.add_vehicles(batch), len(batch))
+
+        self.assertEqual([vehicle.id for vehicle in batch], list(range(2, len(batch) + 2)))
+        self.assertEqual([vehicle.id for vehicle in events[-1]], [vehicle.id for vehicle in batch])
+        # Alterar o preço do objeto passado a add_vehicle(s) fica gravado na base
+        single.price = 1234.0
+        batch[-1].price = 4321.0
+        self.assertEqual(self.fleet.get_vehicle(single.id).price, 1234.0)
+        self.assertEqual(self.fleet.get_vehicle(batch[-1].id).price, 4321.0)
+        with self.assertRaises(ValueError):
+            self.fleet.add_vehicle(single)
+
+    def test_matches_in_memory_fleet(self):
+        fleet = Fleet()
+        for target in (fleet, self.fleet):
+            target.add_vehicles(generate_vehicles(2000, 30))
+            target.remove_vehicles(range(1, 2000, 9))
+            target.apply_global_discount(5)
+        assert_same_summary(self, self.fleet.get_summary(), fleet.get_summary())
+        self.assertEqual(vehicle_rows(self.fleet.iter_vehicles()), vehicle_rows(fleet.iter_vehicles()))
+        ids = lambda found: sorted(vehicle.id for vehicle in found)
+        self.assertEqual(ids(self.fleet.filter_by_brand('bmw')), ids(fleet.filter_by_brand('BMW')))
+        self.assertEqual(ids(self.fleet.filter_by_year(2020)), ids(fleet.filter_by_year(2020)))
+        self.assertEqual(ids(self.fleet.filter_by_type('Truck')), ids(fleet.filter_by_type('Truck')))
+        self.assertEqual(ids(self.fleet.search("model")), ids(fleet.search("model")))
+        criteria = {'vehicle_type': 'ElectricCar', 'price': (30000, 70000), 'autonomy': (400, None)}
+        self.assertEqual(ids(self.fleet.query(**criteria)), ids(fleet.query(**criteria)))
+        self.assertEqual(self.fleet.query(**criteria).count(), fleet.query(**criteria).count())
+        self.assertEqual([vehicle.id for vehicle in self.fleet.sorted_by('tax', reverse=True).window(0, 20)],
+                         [vehicle.id for vehicle in fleet.sorted_by('tax', reverse=True).window(0, 20)])
+
+    def test_changes_persist(self):
+        self.fleet.add_vehicles(generate_vehicles(50, 31))
+        self.fleet.get_vehicle(7).price = 777.0
+        self.fleet.remove_vehicles([8])
+        summary = self.fleet.get_summary()
+        self.fleet.close()
+        with SQLiteFleet(self.fleet.path) as reopened:
+            self.assertEqual(reopened.get_summary(), summary)
+            self.assertEqual(reopened.get_vehicle(7).price, 777.0)
+            self.assertIsNone(reopened.get_vehicle(8))
+
+    def test_removal_is_measured_once(self):
+        self.fleet.add_vehicles(generate_vehicles(10, 7))
+        self.assertEqual(self.fleet.remove_vehicle(0).id, 1)
+        metrics = self.fleet.operation_metrics()
+        self.assertEqual(metrics['remove_vehicle']['count'], 1)
+        self.assertNotIn('remove_vehicles', metrics)
+        self.assertEqual(len(self.fleet), 9)
+
+    def test_set_prices(self):
+        self.fleet.add_vehicles(generate_vehicles(10, 7))
+        version = self.fleet.version
+        self.assertEqual(self.fleet.set_prices({2: 100.0, 3: 200.0, 99: 1.0}), 2)
+        self.assertEqual([vehicle.price for vehicle in self.fleet.window(1, 3)], [100.0, 200.0])
+        self.assertEqual(self.fleet.version, version + 1)
+
+    def test_snapshot_is_closed(self):
+        self.fleet.add_vehicles(generate_vehicles(100, 7))
+        filename = os.path.join(os.path.dirname(self.fleet.path), "frota.jsonl")
+        with self.fleet.snapshot() as snapshot:
+            self.fleet.add_vehicles(generate_vehicles(10, 8))
+            # Exportar do snapshot não abre outra ligação nem fecha a dele
+            success, message = snapshot.export_inventory(filename, 'jsonl')
+            self.assertTrue(success, message)
+            self.assertEqual(len(snapshot), 100)
+        self.assertIsNone(snapshot._db)
+        with open(filename, encoding='utf-8') as file:
+            self.assertEqual(sum(1 for _ in file), 100)
+        # Sem transações de leitura abertas o checkpoint esvazia o WAL por completo
+        busy, _, _ = self.fleet.db.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        self.assertEqual(busy, 0)
+
+    def test_snapshot_is_read_only(self):
+        self.fleet.add_vehicles(generate_vehicles(10, 7))
+        with self.fleet.snapshot() as snapshot:
+            summary = snapshot.get_summary()
+            with self.assertRaises(TypeError):
+                snapshot.add_vehicles(generate_vehicles(5, 8))
+            for write in (lambda: snapshot.remove_vehicle(0), lambda: snapshot.apply_global_discount(10),
+                          snapshot.clear):
+                self.assertRaises(TypeError, write)
+            # A ligação do snapshot também recusa escritas diretas
+            with self.assertRaises(sqlite3.OperationalError):
+                snapshot.db.execute("DELETE FROM vehicles")
+            # Alterar um veículo lido do snapshot não chega à base
+            vehicle = snapshot.get_vehicle(1)
+            vehicle.price = 1.0
+            self.assertNotEqual(self.fleet.get_vehicle(1).price, 1.0)
+
+            # Escritas e taxas novas na frota não aparecem no snapshot
+            self.fleet.add_vehicles(generate_vehicles(5, 8))
+            self.fleet.apply_global_discount(10)
+            old_rate = tax_rules.base_rate
+            tax_rules.configure(base_rate=0.5)
+            self.addCleanup(tax_rules.configure, base_rate=old_rate)
+            self.assertEqual(len(snapshot), 10)
+            self.assertEqual(snapshot.get_summary(), summary)
+            self.assertEqual(len(self.fleet), 15)
+
+    def test_mapped_fleet_exports_like_fleet(self):
+        # Campos inteiros (autonomia, preços dados como int) continuam inteiros no snapshot
+        directory = os.path.dirname(self.fleet.path)
+        for columnar in (False, True):
+            fleet = Fleet(columnar=columnar)
+            fleet.add_vehicles(generate_vehicles(500, 15))
+            fleet.add_vehicle(ElectricCar("Tesla", "Model 3", 45000, 2023, 75, 500))
+            fleet.add_vehicle(Truck("MAN", "TGX", 78000, 2019, 16, 11.8))
+            filename = os.path.join(directory, "frota.snap")
+            fleet.save_snapshot(filename)
+            for format_type in ('csv', 'json', 'jsonl'):
+                expected, exported = (os.path.join(directory, f"{name}.{format_type}") for name in ("a", "b"))
+                fleet.export_inventory(expected, format_type)
+                with MappedFleet(filename) as mapped:
+                    mapped.export_inventory(exported, format_type)
+                with open(expected, 'rb') as a, open(exported, 'rb') as b:
+                    a, b = without_export_date(a.read()), without_export_date(b.read())
+                self.assertEqual(a, b, (columnar, format_type))
+
+    def test_mapped_fleet_survives_export(self):
+        directory = os.path.dirname(self.fleet.path)
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(50, 9))
+        filename = os.path.join(directory, "frota.snap")
+        fleet.save_snapshot(filename)
+        with MappedFleet(filename) as mapped:
+            success, message = mapped.export_inventory(os.path.join(directory, "frota.csv"), 'csv')
+            self.assertTrue(success, message)
+            self.assertEqual(len(list(mapped.iter_vehicles())), 50)
+
+class CommandLineTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cwd = os.getcwd()
+        os.chdir(directory.name)
+        self.addCleanup(os.chdir, cwd)
+        self.addCleanup(setattr, operation_log, 'sample_every', 0)
+
+    def test_summary_without_source_creates_no_database(self):
+        with mock.patch('sys.stdout'):
+            self.assertEqual(main.main(["summary"]), 0)
+        self.assertEqual(os.listdir("."), [])
+
+    def run_main(self, *argv):
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout, mock.patch('sys.stderr', new_callable=io.StringIO):
+            code = main.main(list(argv))
+        return code, stdout.getvalue()
+
+    def test_commands_share_the_source_options(self):
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(500, 3))
+        code, output = self.run_main("summary", "--synthetic", "500", "--seed", "3", "--json")
+        self.assertEqual(code, 0)
+        assert_same_summary(self, json.loads(output), fleet.get_summary())
+
+        self.assertEqual(self.run_main("export", "frota.jsonl", "--synthetic", "500", "--seed", "3")[0], 0)
+        self.assertEqual(self.run_main("import", "frota.jsonl", "--db", "frota.db")[0], 0)
+        code, output = self.run_main("summary", "--db", "frota.db", "--json")
+        assert_same_summary(self, json.loads(output), fleet.get_summary())
+
+        code, output = self.run_main("filter", "--input", "frota.jsonl", "--type", "Truck", "--year", "2020",
+                                     "--output", "camioes.csv")
+        expected = fleet.query(vehicle_type='Truck', year=(2020, None)).count()
+        self.assertEqual(code, 0)
+        with open("camioes.csv", encoding='utf-8') as file:
+            self.assertEqual(sum(1 for _ in file), expected + 1)
+
+        code, output = self.run_main("top", "--synthetic", "500", "--seed", "3", "--by", "price", "--count", "3")
+        prices = [vehicle.price for vehicle in fleet.sorted_by('price', reverse=True).window(0, 3)]
+        self.assertEqual([float(line.split()[0].replace(",", "")) for line in output.splitlines()], prices)
+
+    def test_errors_are_reported(self):
+        code, _ = self.run_main("summary", "--input", "nao_existe.csv")
+        self.assertEqual(code, 1)
+
+    def test_import_loads_no_gui_or_numpy(self):
+        # Os comandos sem interface não pagam o arranque do Tk, do NumPy nem do asyncio
+        modules = ('customtkinter', 'tkinter', 'numpy', 'asyncio', 'gui', 'service')
+        script = f"import main, sys; print([name for name in {modules!r} if name in sys.modules])"
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(main.__file__)), check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_default_gui_keeps_global_options(self):
+        with mock.patch.object(main, 'command_gui', return_value=0) as command_gui:
+            self.assertEqual(main.main(["--log"]), 0)
+        self.assertEqual(command_gui.call_args.args[0].command, 'gui')
+        self.assertEqual(operation_log.sample_every, 1)
+
+class ShardedFleetTests(unittest.TestCase):
+    def ids(self, vehicles):
+        return [vehicle.id for vehicle in vehicles]
+
+    def test_sharded_fleet_matches_fleet(self):
+        fleet = Fleet()
+        with ShardedFleet(3) as sharded:
+            for target in (fleet, sharded):
+                target.add_vehicles(generate_vehicles(3000, 71))
+                target.remove_vehicles(range(1, 3000, 7))
+                target.apply_global_discount(10)
+                target.scenario(-5, brand='bmw').commit()
+                target.add_vehicle(Truck("MAN", "TGX", 78000, 2019, 16, 11.8))
+            assert_same_summary(self, sharded.get_summary(), fleet.get_summary())
+            assert_same_summary(self, sharded.recompute_summary(), fleet.get_summary())
+            by_id = sorted(fleet.iter_vehicles(), key=lambda vehicle: vehicle.id)
+            self.assertEqual(vehicle_rows(sharded.iter_vehicles()), vehicle_rows(by_id))
+            self.assertEqual(vehicle_rows([sharded.get_vehicle(3001)]), vehicle_rows([fleet.get_vehicle(3001)]))
+            self.assertIsNone(sharded.get_vehicle(8))
+
+            # Consultas por ordem de id global; ordenações por (chave, id) como na Fleet
+            for criteria in QueryTests.CRITERIA:
+                expected = sorted(self.ids(fleet.query(**criteria)))
+                query = sharded.query(**criteria)
+                self.assertEqual(self.ids(query), expected, criteria)
+                self.assertEqual(query.count(), len(expected))
+                self.assertEqual(self.ids(query.fetch(5, 20)), expected[5:25])
+            self.assertEqual(self.ids(sharded.search("model", prefix=True)), sorted(self.ids(fleet.search("model", prefix=True))))
+            for name, low, high, reverse in (('price', None, None, False), ('price', 20000, 50000, True), ('tax', 500, None, False),
+                                             ('year', 2015, 2020, True)):
+                view, expected = sharded.sorted_by(name, low, high, reverse), fleet.sorted_by(name, low, high, reverse)
+                self.assertEqual(len(view), len(expected))
+                self.assertEqual(self.ids(view.window(10, 60)), self.ids(expected.window(10, 60)), (name, reverse))
+
+            removed = sharded.remove_vehicles([2, 3, 4, 2])
+            self.assertEqual(sorted(self.ids(removed)), [2, 3, 4])
+            self.assertEqual(len(sharded), len(fleet) - 3)
+
+    def test_sharded_export_matches_fleet(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        fleet = Fleet()
+        fleet.add_vehicles(generate_vehicles(2000, 72))
+        fleet.apply_global_discount(5)
+        with ShardedFleet(2) as sharded:
+            sharded.add_vehicles(generate_vehicles(2000, 72))
+            sharded.apply_global_discount(5)
+            for format_type in EXPORT_FORMATS:
+                contents = []
+                for name, source in (("frota", fleet), ("particoes", sharded)):
+                    filename = os.path.join(directory.name, f"{name}.{format_type}")
+                    self.assertTrue(source.export_inventory(filename, format_type)[0])
+                    with open(filename, 'rb') as file:
+                        contents.append(without_export_date(file.read()))
+                self.assertEqual(contents[0], contents[1], format_type)
+
+if __name__ == "__main__":
+    unittest.main()